@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""Alerts pushed to telegram chats when containers crash or become unhealthy.
+
+The alert manager follows the docker events stream already consumed by each
+:py:class:`docker_utils.ContainerCache`, so that no further subscription is
+needed. It alerts on:
+
+    * ``die``: a container exited with a non-zero code, unless it was killed
+      (e.g. by ``/stop`` or ``/restart``) or ran out of memory just before;
+    * ``oom``: a container ran out of memory;
+    * ``unhealthy``: the health check of a container failed;
+    * ``restart loop``: a container died
+      :py:attr:`alerts.AlertManager.FLAP_COUNT` times within
+      :py:attr:`alerts.AlertManager.FLAP_WINDOW` seconds, not counting the
+      deaths of containers killed on purpose.
+
+An alert is not repeated for the same container within
+:py:attr:`alerts.AlertManager.DEDUP_WINDOW` seconds. Alerts raised within
+:py:attr:`alerts.AlertManager.BATCH_DELAY` seconds of each other are sent as
+a single digest message.
+"""
+
+from collections import (
+    deque,
+    OrderedDict
+)
+import logging
+import queue
+from threading import (
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+from telegram import (
+    Bot,
+    ParseMode
+)
+
+from telecom.command import (
+    Command
+)
+
+
+class ContainerHistory:
+    """What the alert manager remembers about a container.
+    """
+
+    alerted_at: Dict[str, float]
+    """Dict that maps an alert kind to the monotonic time it was last raised
+    for this container."""
+
+    deaths: Deque[float]
+    """Monotonic times of the last deaths of the container."""
+
+    killed_at: float
+    """Monotonic time the container was last killed or stopped on purpose."""
+
+    oom_at: float
+    """Monotonic time the container last ran out of memory."""
+
+    def __init__(self):
+        self.alerted_at = {}
+        self.deaths = deque(maxlen=AlertManager.FLAP_COUNT)
+        self.killed_at = float("-inf")
+        self.oom_at = float("-inf")
+
+
+class AlertManager:
+    """Turns docker events into telegram alerts, on a single background
+    thread.
+
+    Events are queued by :py:meth:`alerts.AlertManager.push`, at most
+    :py:attr:`alerts.AlertManager.MAX_QUEUED` of them; beyond that, they are
+    dropped. The history of at most
+    :py:attr:`alerts.AlertManager.MAX_CONTAINERS` containers is kept, least
+    recently seen first, so that memory is bounded whatever the number of
+    containers.
+    """
+
+    BATCH_DELAY: float = 5.0
+    """Time (in seconds) alerts are held, waiting for further alerts to be
+    sent along."""
+
+    DEDUP_WINDOW: float = 600.0
+    """Time (in seconds) during which an alert is not repeated for the same
+    container."""
+
+    FLAP_COUNT: int = 3
+    """Number of deaths of a container that make a restart loop."""
+
+    FLAP_WINDOW: float = 300.0
+    """Time window (in seconds) of the restart loop detection."""
+
+    KILL_GRACE: float = 30.0
+    """Time (in seconds) after a container was killed, or ran out of memory,
+    during which its death is expected, and not alerted on."""
+
+    MAX_CONTAINERS: int = 10000
+    """Maximum number of container histories kept."""
+
+    MAX_DIGEST_LINES: int = 30
+    """Maximum number of alerts listed in a digest message."""
+
+    MAX_QUEUED: int = 10000
+    """Maximum number of events waiting to be processed."""
+
+    bot: Bot
+    """Telegram bot sending the alerts."""
+
+    chat_ids: List[int]
+    """Chats alerts are sent to."""
+
+    show_host: bool
+    """Wether container names are prefixed by their docker host name."""
+
+    _batch: List[str]
+    """Alerts waiting to be sent, at most
+    :py:attr:`alerts.AlertManager.MAX_DIGEST_LINES` of them."""
+
+    _batch_size: int
+    """Number of alerts waiting to be sent, including those not kept in
+    ``_batch``."""
+
+    _flush_at: Optional[float]
+    """Monotonic time at which the waiting alerts are sent, if any."""
+
+    _histories: 'OrderedDict[Tuple[str, str], ContainerHistory]'
+    """Dict that maps a host name and a container id to the history of the
+    container, least recently seen first."""
+
+    _queue: 'queue.Queue[Tuple[str, Dict[str, Any]]]'
+    """Events waiting to be processed, with their host name."""
+
+    def __init__(self,
+                 bot: Bot,
+                 chat_ids: Sequence[int],
+                 show_host: bool = False):
+        self.bot = bot
+        self.chat_ids = list(chat_ids)
+        self.show_host = show_host
+        self._batch = []
+        self._batch_size = 0
+        self._flush_at = None
+        self._histories = OrderedDict()
+        self._queue = queue.Queue(AlertManager.MAX_QUEUED)
+        self._alerts = Command.METRICS.counter(
+            "dockerbot_alerts_total",
+            "Alerts raised, by kind and outcome (queued or deduplicated)",
+            ("kind", "outcome")
+        )
+        self._dropped = Command.METRICS.counter(
+            "dockerbot_alert_events_dropped_total",
+            "Docker events dropped because the alert queue was full"
+        )
+
+    def _alert(self,
+               history: ContainerHistory,
+               kind: str,
+               text: str,
+               now: float) -> None:
+        """Adds an alert to the batch, unless it was raised recently for the
+        same container.
+        """
+        if now - history.alerted_at.get(kind, float("-inf")) < \
+                AlertManager.DEDUP_WINDOW:
+            self._alerts.inc(kind=kind, outcome="deduplicated")
+            return
+        history.alerted_at[kind] = now
+        self._alerts.inc(kind=kind, outcome="queued")
+        if len(self._batch) < AlertManager.MAX_DIGEST_LINES:
+            self._batch.append(text)
+        self._batch_size += 1
+        if self._flush_at is None:
+            self._flush_at = now + AlertManager.BATCH_DELAY
+
+    def _flush(self) -> None:
+        """Sends the waiting alerts, as a single message.
+        """
+        if self._batch_size == 1:
+            text = self._batch[0]
+        else:
+            text = "\n".join(
+                [f'🚨 *{self._batch_size} alerts*'] + self._batch
+            )
+            if self._batch_size > len(self._batch):
+                text += f'\n... ({self._batch_size - len(self._batch)} more)'
+        for chat_id in self.chat_ids:
+            Command.OUTBOX.send(
+                self.bot.send_message,
+                chat_id=chat_id,
+                parse_mode=ParseMode.MARKDOWN,
+                text=text
+            )
+        self._batch = []
+        self._batch_size = 0
+        self._flush_at = None
+
+    def _history(self, host: str, container_id: str) -> ContainerHistory:
+        """Returns the history of a container, marking it as recently seen.
+        """
+        key = (host, container_id)
+        history = self._histories.pop(key, None)
+        if history is None:
+            history = ContainerHistory()
+        self._histories[key] = history
+        while len(self._histories) > AlertManager.MAX_CONTAINERS:
+            self._histories.popitem(last=False)
+        return history
+
+    def _process(self, host: str, event: Dict[str, Any], now: float) -> None:
+        """Updates the history of a container with an event, and raises the
+        corresponding alerts.
+        """
+        action = event.get("Action", event.get("status", ""))
+        if action not in ("die", "kill", "oom", "stop") and \
+                not action.startswith("health_status: unhealthy"):
+            return
+        actor = event.get("Actor", {})
+        attributes = actor.get("Attributes", {})
+        container_id = event.get("id", actor.get("ID", ""))
+        name = attributes.get("name", container_id[:12])
+        if self.show_host:
+            name = f'{host}/{name}'
+        history = self._history(host, container_id)
+        if action in ("kill", "stop"):
+            history.killed_at = now
+        elif action == "oom":
+            history.oom_at = now
+            self._alert(history, "oom", f'💥 `{name}` ran out of memory.',
+                        now)
+        elif action == "die":
+            if now - history.killed_at <= AlertManager.KILL_GRACE:
+                # Expected death, e.g. /restart, which is not a crash
+                return
+            history.deaths.append(now)
+            exit_code = attributes.get("exitCode", "0")
+            if len(history.deaths) == AlertManager.FLAP_COUNT and \
+                    now - history.deaths[0] <= AlertManager.FLAP_WINDOW:
+                self._alert(
+                    history,
+                    "restart loop",
+                    f'🔁 `{name}` died {AlertManager.FLAP_COUNT} times in '
+                    f'{now - history.deaths[0]:.0f} s (last exit code '
+                    f'{exit_code}).',
+                    now
+                )
+            elif exit_code != "0" and \
+                    now - history.oom_at > AlertManager.KILL_GRACE:
+                # A death right after running out of memory was alerted on
+                self._alert(history, "die",
+                            f'⏹ `{name}` died with exit code {exit_code}.',
+                            now)
+        else:
+            self._alert(history, "unhealthy", f'🤒 `{name}` is unhealthy.',
+                        now)
+
+    def _run(self) -> None:
+        """Processes events and sends alerts, forever.
+        """
+        while True:
+            timeout = None  # type: Optional[float]
+            if self._flush_at is not None:
+                timeout = max(self._flush_at - time.monotonic(), 0.0)
+            try:
+                host, event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                try:
+                    self._process(host, event, time.monotonic())
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception("Could not process docker event")
+            if self._flush_at is not None and \
+                    time.monotonic() >= self._flush_at:
+                self._flush()
+
+    def push(self, host: str, event: Dict[str, Any]) -> None:
+        """Queues a docker event, see
+        :py:meth:`docker_utils.ContainerCache.add_listener`.
+        """
+        try:
+            self._queue.put_nowait((host, event))
+        except queue.Full:
+            self._dropped.inc()
+
+    def start(self) -> None:
+        """Starts processing events in a background thread.
+        """
+        Thread(target=self._run, daemon=True, name="alerts").start()
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""Implentation of command `/df`.
+"""
+
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor
+)
+import logging
+from threading import (
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union
+)
+
+from cmd_stats import (
+    format_bytes
+)
+from docker_utils import (
+    ContainerCache,
+    DockerCommand
+)
+from telecom.command import (
+    NotEnoughArguments
+)
+from telecom.selector import (
+    ArgumentSelector
+)
+
+
+class DfSelector(ArgumentSelector):
+    """Selects the largest items of a kind, the summary, or a refresh.
+    """
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        return [
+            ("Images", "images"),
+            ("Containers", "containers"),
+            ("Volumes", "volumes"),
+            ("Build cache", "cache"),
+            ("Summary", "summary"),
+            ("🔄 Refresh", "refresh")
+        ]
+
+
+class DiskUsage:
+    """The disk usage of a docker host, as returned by
+    ``docker.DockerClient.df``, i.e. ``docker system df -v``.
+
+    Items are images, containers (their writable layer), volumes and build
+    cache entries. Reclaimable space is that of unused images, stopped
+    containers, unreferenced volumes, and build cache entries neither in use
+    nor shared.
+    """
+
+    KINDS: Dict[str, str] = {
+        "images": "Images",
+        "containers": "Containers",
+        "volumes": "Volumes",
+        "cache": "Build cache"
+    }
+    """Dict that maps a kind of item to its title."""
+
+    duration: float
+    """Time (in seconds) docker took to compute the disk usage."""
+
+    items: Dict[str, List[Tuple[str, int]]]
+    """Dict that maps a kind to the names and sizes of its items, largest
+    first."""
+
+    reclaimable: Dict[str, int]
+    """Dict that maps a kind to the size of its reclaimable items."""
+
+    taken_at: float
+    """Monotonic time at which the disk usage was computed."""
+
+    totals: Dict[str, int]
+    """Dict that maps a kind to the size of its items."""
+
+    def __init__(self, df: Dict[str, Any], duration: float):
+        self.duration = duration
+        self.taken_at = time.monotonic()
+        self.items = {kind: [] for kind in DiskUsage.KINDS}
+        self.reclaimable = {kind: 0 for kind in DiskUsage.KINDS}
+        for image in df.get("Images", None) or []:
+            tags = [
+                tag for tag in image.get("RepoTags", None) or []
+                if tag != "<none>:<none>"
+            ]
+            name = tags[0] if tags else image.get("Id", "")[7:19]
+            size = max(image.get("Size", 0), 0)
+            self.items["images"].append((name, size))
+            if not image.get("Containers", 0):
+                self.reclaimable["images"] += \
+                    size - max(image.get("SharedSize", 0), 0)
+        for container in df.get("Containers", None) or []:
+            names = container.get("Names", None) or [container.get("Id", "")]
+            size = max(container.get("SizeRw", 0) or 0, 0)
+            self.items["containers"].append((names[0].lstrip("/"), size))
+            if container.get("State", "") != "running":
+                self.reclaimable["containers"] += size
+        for volume in df.get("Volumes", None) or []:
+            usage = volume.get("UsageData", None) or {}
+            size = max(usage.get("Size", 0), 0)
+            self.items["volumes"].append((volume.get("Name", ""), size))
+            if usage.get("RefCount", 0) == 0:
+                self.reclaimable["volumes"] += size
+        for entry in df.get("BuildCache", None) or []:
+            size = max(entry.get("Size", 0), 0)
+            self.items["cache"].append(
+                (entry.get("Description", "") or entry.get("ID", "")[:12],
+                 size)
+            )
+            if not entry.get("InUse", False) and \
+                    not entry.get("Shared", False):
+                self.reclaimable["cache"] += size
+        for items in self.items.values():
+            items.sort(key=lambda item: -item[1])
+        self.totals = {
+            kind: sum([size for _, size in items])
+            for kind, items in self.items.items()
+        }
+        # Images share layers, which the sum of their sizes counts repeatedly
+        self.totals["images"] = df.get("LayersSize", self.totals["images"])
+
+
+class Df(DockerCommand):
+    """Implementation of command `/df`.
+
+    Computing the disk usage of a docker host can take tens of seconds, so it
+    is never done while a user waits. The disk usage of each docker host is
+    computed in the background on :py:attr:`cmd_df.Df.EXECUTOR` once `/df`
+    is first issued, then every :py:attr:`cmd_df.Df.REFRESH_INTERVAL`
+    seconds, and replies are rendered from the last snapshot. A refresh
+    requested with the keyboard runs in the background too, and the reply is
+    edited when it is done.
+    """
+
+    __HELP__ = """▪️ Usage: `/df [images|containers|volumes|cache] [N]`:
+Displays the disk usage of the docker hosts, or their `N` largest images,
+containers (writable layers), volumes or build cache entries. Disk usage is
+computed in the background, and may be a few minutes old."""
+
+    __STATE__ = (
+        "ERRORS",
+        "EXECUTOR",
+        "LOCK",
+        "REFRESHER",
+        "REFRESHING",
+        "SNAPSHOTS"
+    )
+
+    ERRORS: Dict[str, str] = {}
+    """Dict that maps a docker host name to the error of its last disk usage
+    computation, if it failed."""
+
+    EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=4,
+        thread_name_prefix="df"
+    )
+    """Thread pool on which disk usage is computed."""
+
+    LOCK: Lock = Lock()
+    """Lock protecting :py:attr:`cmd_df.Df.ERRORS`,
+    :py:attr:`cmd_df.Df.REFRESHING`, :py:attr:`cmd_df.Df.SNAPSHOTS` and
+    :py:attr:`cmd_df.Df.REFRESHER`."""
+
+    MAX_COUNT: int = 50
+    """Maximum number of items displayed."""
+
+    NAME_LENGTH: int = 30
+    """Maximum length of the item names in the table."""
+
+    REFRESHER: Optional[Thread] = None
+    """Background thread refreshing the snapshots, once started."""
+
+    REFRESHING: Dict[str, 'Future[DiskUsage]'] = {}
+    """Dict that maps a docker host name to its disk usage computation in
+    progress."""
+
+    REFRESH_INTERVAL: float = 900.0
+    """Age (in seconds) at which a snapshot is refreshed in the background."""
+
+    SNAPSHOTS: Dict[str, DiskUsage] = {}
+    """Dict that maps a docker host name to its last disk usage."""
+
+    TOP_COUNT: int = 10
+    """Default number of items displayed."""
+
+    _count: int
+    """Number of items displayed."""
+
+    _kind: str
+    """Kind of items displayed, or ``summary``."""
+
+    _replied: bool
+    """Wether the reply was sent."""
+
+    def __init__(self):
+        super().__init__()
+        self._count = Df.TOP_COUNT
+        self._kind = "summary"
+        self._replied = False
+
+    def footer(self, container_cache: ContainerCache) -> str:
+        """Returns the age of the snapshot of a docker host, and wether it is
+        being refreshed or failed to.
+        """
+        with Df.LOCK:
+            snapshot = Df.SNAPSHOTS.get(container_cache.name, None)
+            refreshing = container_cache.name in Df.REFRESHING
+            error = Df.ERRORS.get(container_cache.name, None)
+        name = f'`{container_cache.name}`: ' \
+            if len(self.container_caches) > 1 else ""
+        if snapshot is None:
+            text = f'⌛️ {name}computing disk usage...' if refreshing \
+                else f'⌛️ {name}no disk usage yet.'
+        else:
+            text = f'🕓 {name}computed ' \
+                f'{format_age(time.monotonic() - snapshot.taken_at)} ago in ' \
+                f'{snapshot.duration:.1f} s'
+            if refreshing:
+                text += ", refreshing..."
+        if error is not None:
+            text += f'\n❌ {name}last refresh failed: {error}'
+        return text
+
+    def main(self) -> None:
+        kind = self._args_dict.get("0", "summary")
+        if kind not in DiskUsage.KINDS and kind != "summary":
+            self.reply_error(f'Unknown kind `{kind}`.')
+            return
+        try:
+            count = int(self._args_dict.get("1", Df.TOP_COUNT))
+        except ValueError:
+            self.reply_error(f'`{self._args_dict["1"]}` is not a number.')
+            return
+        choice = self._args_dict.pop("view", None)
+        if choice not in (None, "refresh"):
+            self._args_dict["0"] = kind = choice
+        self._kind = kind
+        self._count = min(max(count, 1), Df.MAX_COUNT)
+        Df.start_refresher(self.container_caches)
+        with Df.LOCK:
+            futures = [
+                Df.refresh(cache) for cache in self.container_caches
+                if choice == "refresh" or cache.name not in Df.SNAPSHOTS
+            ]
+        self.show()
+        pending = [future for future in futures if not future.done()]
+        if pending:
+
+            def on_done(_: 'Future[DiskUsage]') -> None:
+                if all(future.done() for future in pending):
+                    self.show()
+
+            for future in pending:
+                future.add_done_callback(on_done)
+        raise NotEnoughArguments
+
+    def render(self) -> str:
+        """Renders the summary or the largest items of the snapshots.
+        """
+        with Df.LOCK:
+            snapshots = {
+                cache.name: Df.SNAPSHOTS[cache.name]
+                for cache in self.container_caches
+                if cache.name in Df.SNAPSHOTS
+            }
+        show_name = len(self.container_caches) > 1
+        footers = "\n".join([
+            self.footer(cache) for cache in self.container_caches
+        ])
+        if self._kind == "summary":
+            sections = []
+            for cache in self.container_caches:
+                snapshot = snapshots.get(cache.name, None)
+                if snapshot is None:
+                    continue
+                lines = [
+                    f'{"TYPE":<12} {"COUNT":>6} {"SIZE":>7} {"RECLAIM":>7}'
+                ]
+                for kind, title in DiskUsage.KINDS.items():
+                    lines.append(
+                        f'{title:<12} {len(snapshot.items[kind]):>6} '
+                        f'{format_bytes(snapshot.totals[kind]):>7} '
+                        f'{format_bytes(snapshot.reclaimable[kind]):>7}'
+                    )
+                header = f'💾 *Disk usage of* `{cache.name}`' if show_name \
+                    else '💾 *Disk usage*'
+                sections.append(
+                    header + "\n```\n" + "\n".join(lines) + "\n```"
+                )
+            return "\n\n".join(sections + [footers])
+        items = [
+            (f'{name}/{item}' if show_name else item, size)
+            for name, snapshot in snapshots.items()
+            for item, size in snapshot.items[self._kind]
+        ]
+        items.sort(key=lambda item: -item[1])
+        lines = [
+            f'{item[:Df.NAME_LENGTH]:<{Df.NAME_LENGTH}} '
+            f'{format_bytes(size):>7}'
+            for item, size in items[:self._count]
+        ]
+        title = DiskUsage.KINDS[self._kind].lower()
+        text = f'💾 *Top {min(self._count, len(items))} of {len(items)} ' \
+            f'{title} by size*'
+        if lines:
+            text += "\n```\n" + "\n".join(lines) + "\n```"
+        return text + "\n" + footers
+
+    def show(self) -> None:
+        """Sends or edits the reply.
+        """
+        text = self.render()
+        keyboard = self.inline_keyboard("view", DfSelector())
+        if self._replied:
+            self.edit_reply(text, reply_markup=keyboard)
+        else:
+            self._replied = True
+            self.reply(text, editable=True, reply_markup=keyboard)
+
+    @staticmethod
+    def refresh(container_cache: ContainerCache) -> 'Future[DiskUsage]':
+        """Returns a future of the disk usage of a docker host, and records
+        it in :py:attr:`cmd_df.Df.SNAPSHOTS`. A computation in progress is
+        shared. :py:attr:`cmd_df.Df.LOCK` must be held.
+        """
+        name = container_cache.name
+
+        def target() -> DiskUsage:
+            start = time.monotonic()
+            try:
+                usage = DiskUsage(
+                    container_cache.docker_client.df(),
+                    time.monotonic() - start
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                logging.warning("Could not compute disk usage of %s: %s",
+                                name, str(error))
+                with Df.LOCK:
+                    Df.ERRORS[name] = str(error)
+                    Df.REFRESHING.pop(name, None)
+                raise
+            logging.info("Computed disk usage of %s in %.1f s", name,
+                         usage.duration)
+            with Df.LOCK:
+                Df.ERRORS.pop(name, None)
+                Df.REFRESHING.pop(name, None)
+                Df.SNAPSHOTS[name] = usage
+            return usage
+
+        if name not in Df.REFRESHING:
+            Df.REFRESHING[name] = Df.EXECUTOR.submit(target)
+        return Df.REFRESHING[name]
+
+    @staticmethod
+    def start_refresher(container_caches: Sequence[ContainerCache]) -> None:
+        """Starts refreshing the snapshots of docker hosts in the background,
+        unless it is already started.
+        """
+
+        def target():
+            while True:
+                with Df.LOCK:
+                    for cache in container_caches:
+                        snapshot = Df.SNAPSHOTS.get(cache.name, None)
+                        if snapshot is None or \
+                                time.monotonic() - snapshot.taken_at >= \
+                                Df.REFRESH_INTERVAL:
+                            Df.refresh(cache)
+                time.sleep(Df.REFRESH_INTERVAL / 10)
+
+        with Df.LOCK:
+            if Df.REFRESHER is None:
+                Df.REFRESHER = Thread(target=target, daemon=True, name="df")
+                Df.REFRESHER.start()
+
+
+def format_age(seconds: float) -> str:
+    """Formats a duration with a single unit, e.g. ``12 s``, ``5 min`` or
+    ``3 h``.
+    """
+    if seconds < 60:
+        return f'{seconds:.0f} s'
+    if seconds < 3600:
+        return f'{seconds // 60:.0f} min'
+    return f'{seconds // 3600:.0f} h'
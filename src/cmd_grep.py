@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Implentation of command `/grep`.
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait
+)
+import logging
+import re
+from threading import (
+    Event,
+    Lock
+)
+import time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Pattern,
+    Tuple
+)
+
+from docker.models.containers import (
+    Container
+)
+from telegram.constants import (
+    MAX_MESSAGE_LENGTH
+)
+
+from cmd_logs import (
+    format_log_cursor,
+    format_log_line,
+    iter_log_lines,
+    LogCursor,
+    parse_log_line
+)
+from docker_utils import (
+    DockerCommand,
+    fan_out
+)
+
+
+class GrepScan:
+    """The matches found so far by a `/grep` command.
+
+    Containers are scanned by concurrent calls to
+    :py:meth:`cmd_grep.GrepScan.scan`. Each reads the log stream of its
+    container line by line, so that memory does not grow with the size of the
+    logs. Scanning stops once :py:attr:`cmd_grep.Grep.MAX_MATCHES` matches
+    are found, or when :py:meth:`cmd_grep.GrepScan.stop` is called.
+    """
+
+    errors: Dict[str, str]
+    """Dict that maps a container name to the error that stopped its scan."""
+
+    hits: Dict[str, int]
+    """Dict that maps a container name to its number of matches."""
+
+    matches: List[Tuple[str, LogCursor, str]]
+    """Matches, as container names, timestamps and log lines, in the order
+    they were found."""
+
+    pattern: Pattern
+    """Compiled regular expression."""
+
+    scanned: int
+    """Number of containers whose scan is over."""
+
+    since: int
+    """Start of the time window, in seconds since the epoch."""
+
+    version: int
+    """Incremented on each change, so that unchanged results are not
+    rendered again."""
+
+    _lock: Lock
+    """Lock protecting the results."""
+
+    _stopped: Event
+    """Set when scanning must stop."""
+
+    def __init__(self, pattern: Pattern, since: int):
+        self.errors = {}
+        self.hits = {}
+        self.matches = []
+        self.pattern = pattern
+        self.scanned = 0
+        self.since = since
+        self.version = 0
+        self._lock = Lock()
+        self._stopped = Event()
+
+    @property
+    def is_full(self) -> bool:
+        """Returns wether the match cap is reached.
+        """
+        return len(self.matches) >= Grep.MAX_MATCHES
+
+    def scan(self, name: str, container: Container) -> None:
+        """Scans the logs of a container.
+        """
+        try:
+            stream = container.logs(
+                since=self.since,
+                stream=True,
+                timestamps=True
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            with self._lock:
+                self.errors[name] = str(error)
+                self.scanned += 1
+                self.version += 1
+            return
+        try:
+            for raw_line in iter_log_lines(stream):
+                if self._stopped.is_set():
+                    break
+                cursor, text = parse_log_line(raw_line)
+                if not self.pattern.search(text):
+                    continue
+                with self._lock:
+                    if self.is_full:
+                        self._stopped.set()
+                        break
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    self.matches.append((name, cursor, text))
+                    self.version += 1
+                    if self.is_full:
+                        self._stopped.set()
+        except Exception as error:  # pylint: disable=broad-except
+            logging.warning("Could not grep logs of %s: %s", name,
+                            str(error))
+            with self._lock:
+                self.errors[name] = str(error)
+        finally:
+            stream.close()
+            with self._lock:
+                self.scanned += 1
+                self.version += 1
+
+    def render(self, total: int, footer: str) -> str:
+        """Renders the hit counts and the matches that fit in a message.
+        """
+        with self._lock:
+            hits = sorted(self.hits.items(), key=lambda item: -item[1])
+            matches = list(self.matches)
+            errors = dict(self.errors)
+            scanned = self.scanned
+        lines = [
+            f'🔎 `{self.pattern.pattern.replace("`", "ʼ")}` since '
+            f'{format_log_cursor((self.since, 0))}: '
+            f'{len(matches)}{"+" if self.is_full else ""} matches in '
+            f'{len(hits)} containers ({scanned}/{total} scanned, {footer})'
+        ]
+        lines += [f'▪️ `{name}`: {count}' for name, count in hits]
+        lines += [f'❌ `{name}`: {error}' for name, error in errors.items()]
+        budget = MAX_MESSAGE_LENGTH - 200 - \
+            sum([len(line.encode("UTF-8")) + 1 for line in lines])
+        shown = 0
+        for name, cursor, text in matches:
+            line = f'`{name}` {format_log_cursor(cursor)}\n' + \
+                format_log_line(text)
+            budget -= len(line.encode("UTF-8")) + 1
+            if budget < 0:
+                break
+            lines.append(line)
+            shown += 1
+        if shown < len(matches):
+            lines.append(f'... ({len(matches) - shown} more)')
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        """Stops scanning.
+        """
+        self._stopped.set()
+
+
+class Grep(DockerCommand):
+    """Implementation of command `/grep`.
+
+    The logs of the containers are scanned concurrently on
+    :py:attr:`cmd_grep.Grep.EXECUTOR`, see :py:class:`cmd_grep.GrepScan`. The
+    reply is edited as matches are found, at most once every
+    :py:attr:`cmd_grep.Grep.EDIT_INTERVAL` seconds.
+    """
+
+    __HELP__ = """▪️ Usage: `/grep PATTERN [CONTAINER...] [since=AGE]`:
+Searches the logs of containers for a regular expression, e.g.
+`/grep (?i)error web-* since=2h`. All running containers are searched by
+default, over the last hour."""
+
+    __STATE__ = ("EXECUTOR",)
+
+    DURATION_UNITS: Dict[str, int] = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    """Dict that maps a duration unit to its number of seconds."""
+
+    EDIT_INTERVAL: float = 1.0
+    """Minimum delay (in seconds) between two edits of the reply."""
+
+    EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=32,
+        thread_name_prefix="grep"
+    )
+    """Thread pool on which logs are scanned."""
+
+    MAX_MATCHES: int = 100
+    """Number of matches after which scanning stops."""
+
+    SCAN_TIMEOUT: float = 60.0
+    """Duration (in seconds) after which scanning stops."""
+
+    WINDOW: int = 3600
+    """Default duration (in seconds) of the scanned time window."""
+
+    def containers(self, patterns: List[str]) -> Dict[str, Container]:
+        """Returns the containers to scan by name: those matched by
+        ``patterns``, or all the running containers.
+        """
+        if patterns:
+            containers = self.match_containers(patterns)
+        else:
+            listings = fan_out(self.container_caches,
+                               lambda cache: cache.list())
+            containers = [
+                container
+                for listing in listings.values()
+                for container in listing
+                if container.status == "running"
+            ]
+        return {
+            self.container_name(container): container
+            for container in containers
+        }
+
+    def main(self) -> None:
+        if "0" not in self._args_dict:
+            self.reply_error(
+                "Usage: `/grep PATTERN [CONTAINER...] [since=AGE]`"
+            )
+            return
+        try:
+            pattern = re.compile(self._args_dict["0"])
+        except re.error as error:
+            self.reply_error(f'Invalid pattern: {error}.')
+            return
+        window = Grep.WINDOW  # type: Optional[int]
+        patterns = []  # type: List[str]
+        idx = 1
+        while str(idx) in self._args_dict:
+            arg = self._args_dict[str(idx)]
+            if arg.startswith("since="):
+                window = parse_duration(arg[len("since="):])
+                if window is None:
+                    self.reply_error(f'Invalid duration `{arg}`.')
+                    return
+            else:
+                patterns.append(arg)
+            idx += 1
+        containers = self.containers(patterns)
+        if not containers:
+            if not patterns:
+                self.reply_warning("No running container.")
+            return
+        self.search(GrepScan(pattern, int(time.time()) - (window or 0)),
+                    containers)
+
+    def search(self, scan: GrepScan, containers: Dict[str, Container]) -> None:
+        """Scans containers, and edits the reply as matches are found.
+        """
+        self.reply(scan.render(len(containers), "scanning"), editable=True)
+        futures = {
+            Grep.EXECUTOR.submit(scan.scan, name, container)
+            for name, container in containers.items()
+        }
+        deadline = time.monotonic() + Grep.SCAN_TIMEOUT
+        edited_at = time.monotonic()
+        version = scan.version
+        while futures and not scan.is_full:
+            if time.monotonic() > deadline:
+                break
+            _, futures = wait(
+                futures,
+                timeout=Grep.EDIT_INTERVAL,
+                return_when=FIRST_COMPLETED
+            )
+            if futures and scan.version != version and \
+                    time.monotonic() - edited_at >= Grep.EDIT_INTERVAL:
+                edited_at = time.monotonic()
+                version = scan.version
+                self.edit_reply(scan.render(len(containers), "scanning"))
+        scan.stop()
+        if scan.is_full:
+            footer = "stopped at match limit"
+        elif futures:
+            footer = "timed out"
+        else:
+            footer = "done"
+        self.edit_reply(scan.render(len(containers), footer))
+
+
+def parse_duration(text: str) -> Optional[int]:
+    """Parses a duration such as ``90s``, ``15m``, ``2h`` or ``1d`` into
+    seconds, or returns ``None`` if it is invalid.
+    """
+    unit = Grep.DURATION_UNITS.get(text[-1:], None)
+    if unit is None or not text[:-1].isdigit():
+        return None
+    return int(text[:-1]) * unit
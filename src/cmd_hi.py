@@ -23,6 +23,8 @@ class Hi(DockerCommand):
     """Implementation of command `/hi`.
     """
 
+    BLOCKING: bool = False
+
     def main(self) -> None:
         self.reply(
             f'Hi {self._message.from_user.first_name} 👋 I am your personal '
@@ -2,7 +2,11 @@
 """Implentation of command `/info`.
 """
 
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
 from typing import (
+    Dict,
     List,
     Sequence,
     Tuple,
@@ -10,9 +14,14 @@ from typing import (
 )
 
 from docker_utils import (
+    ContainerCache,
     ContainerSelector,
     DockerCommand,
-    emoji_of_status
+    emoji_of_status,
+    fan_out
+)
+from telecom.command import (
+    Command
 )
 
 
@@ -32,10 +41,18 @@ class Info(DockerCommand):
     """
 
     __HELP__ = """▪️ Usage: `/info`:
-Displays informations about the docker "daemon.
+Displays informations about the docker daemons.
 ▪️ Usage: `/info CONTAINER`:
 Displays informations about a container."""
 
+    STATUSES: Dict[str, str] = {
+        "running": "Running",
+        "restarting": "Restarting",
+        "paused": "Paused",
+        "exited": "Stopped"
+    }
+    """Container statuses listed by `/info`, and their titles."""
+
     def info_container(self, container_name: str) -> None:
         """Implentation of command `/info`.
 
@@ -57,44 +74,71 @@ Displays informations about a container."""
     def info_docker(self) -> None:
         """Implentation of command `/info`.
 
-        Retrieves and sends general informations about the docker daemon.
+        Retrieves and sends general informations about the docker daemons. The
+        docker hosts are queried concurrently, see
+        :py:func:`docker_utils.fan_out`.
         """
-        info = self.docker_client.info()
-        running_containers = self.docker_client.containers.list(
-            filters={"status": "running"}
+        caches = self.container_caches
+        statuses = fan_out(
+            caches,
+            lambda cache: Info.info_host(cache, len(caches) > 1)
         )
-        running_container_list = "\n".join([''] + [
-            f'     - `{c.name}`' for c in running_containers
-        ])
-        restarting_containers = self.docker_client.containers.list(
-            filters={"status": "restarting"}
-        )
-        restarting_container_list = "\n".join([''] + [
-            f'     - `{c.name}`' for c in restarting_containers
-        ])
-        paused_containers = self.docker_client.containers.list(
-            filters={"status": "paused"}
-        )
-        paused_container_list = "\n".join([''] + [
-            f'     - `{c.name}`' for c in paused_containers
-        ])
-        stopped_containers = self.docker_client.containers.list(
-            filters={"status": "exited"}
+        self.reply("\n\n".join([
+            statuses.get(
+                cache.name,
+                f'*Docker status of* `{cache.name}` ⌛️\nNo answer.'
+            )
+            for cache in caches
+        ]))
+
+    @staticmethod
+    def info_host(container_cache: ContainerCache, show_name: bool) -> str:
+        """Returns general informations about a docker daemon.
+
+        The resulting text is reused from
+        :py:attr:`telecom.command.Command.RENDER_CACHE` until the containers
+        change, see :py:attr:`docker_utils.ContainerCache.version`.
+        """
+        return Command.RENDER_CACHE.get(
+            "info",
+            (container_cache.name, show_name),
+            container_cache.current_version(),
+            lambda: Info.render_host(container_cache, show_name)
         )
-        stopped_container_list = "\n".join([''] + [
-            f'     - `{c.name}`' for c in stopped_containers
-        ])
-        text = f'''*Docker status* 🐳⚙️
+
+    @staticmethod
+    def render_host(container_cache: ContainerCache, show_name: bool) -> str:
+        """Renders general informations about a docker daemon.
+
+        The daemon informations and the container list are retrieved
+        concurrently, and the containers are partitioned by status locally.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            info_future = executor.submit(container_cache.docker_client.info)
+            containers_future = executor.submit(container_cache.list)
+            info = info_future.result()
+            containers = containers_future.result()
+        partition = {
+            status: []
+            for status in Info.STATUSES
+        }  # type: Dict[str, List[str]]
+        for container in containers:
+            if container.status in partition:
+                partition[container.status].append(container.name)
+        header = f'*Docker status of* `{container_cache.name}` 🐳⚙️' \
+            if show_name else '*Docker status* 🐳⚙️'
+        text = f'''{header}
 ▪️ Docker version: {info["ServerVersion"]}
-▪️ Memory: {int(info["MemTotal"])/1000000000} GiB
-▪️ Running containers: {len(running_containers)}{running_container_list}
-▪️ Restarting containers: {len(restarting_containers)}{restarting_container_list}
-▪️ Paused containers: {len(paused_containers)}{paused_container_list}
-▪️ Stopped containers: {len(stopped_containers)}{stopped_container_list}'''
-        self.reply(text)
+▪️ Memory: {int(info["MemTotal"])/1000000000} GiB'''
+        for status, title in Info.STATUSES.items():
+            names = partition[status]
+            text += f'\n▪️ {title} containers: {len(names)}' + "".join([
+                f'\n     - `{name}`' for name in names
+            ])
+        return text
 
     def main(self) -> None:
-        item = self.arg("0", InfoSelector(self.docker_client))
+        item = self.arg("0", InfoSelector(self.container_caches))
         if item == "":
             self.info_docker()
         else:
@@ -2,34 +2,522 @@
 """Implentation of command `/logs`.
 """
 
+import calendar
+from collections import (
+    deque
+)
+import logging
+from threading import (
+    Event,
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union
+)
+
+from docker.models.containers import (
+    Container
+)
+from telegram.constants import (
+    MAX_MESSAGE_LENGTH
+)
+
 from docker_utils import (
     ContainerSelector,
     DockerCommand
 )
+from telecom.command import (
+    NotEnoughArguments
+)
+from telecom.selector import (
+    ArgumentSelector
+)
+
+
+LogCursor = Tuple[int, int]
+"""Timestamp of a log line, as seconds and nanoseconds since the epoch."""
+
+LogLine = Tuple[LogCursor, str]
+"""A formatted log line, and its timestamp."""
+
+
+class PageSelector(ArgumentSelector):
+    """Selects the previous or next page of logs.
+    """
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        return [("⬅️ Older", "older"), ("Newer ➡️", "newer")]
+
+
+class StopSelector(ArgumentSelector):
+    """A selector with a single Stop button.
+    """
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        return [("Stop ⏹", "stop")]
+
+
+class LogPager:
+    """Builds pages of the logs of a container that fit in a single telegram
+    message.
+
+    The log stream is read incrementally, and at most one page of lines is held
+    in memory. The pager remembers the timestamps of the oldest and newest
+    lines of the last page it built, which serve as cursors for
+    :py:meth:`cmd_logs.LogPager.older` and :py:meth:`cmd_logs.LogPager.newer`.
+    Since docker only accepts whole seconds as ``since`` and ``until`` bounds,
+    lines are additionally filtered by their exact timestamp.
+    """
+
+    _container: Container
+    """The browsed container."""
+
+    _newest: Optional[LogCursor]
+    """Timestamp of the newest line of the last page."""
+
+    _oldest: Optional[LogCursor]
+    """Timestamp of the oldest line of the last page."""
+
+    def __init__(self, container: Container):
+        self._container = container
+        self._newest = None
+        self._oldest = None
+
+    def _page(self,
+              stream: Any,
+              after: Optional[LogCursor] = None,
+              before: Optional[LogCursor] = None,
+              keep_newest: bool = True) -> Tuple[Deque[LogLine], bool]:
+        """Reads a page out of a timestamped log stream, and closes it.
+
+        Only lines strictly between ``after`` and ``before`` are considered.
+        If ``keep_newest`` is set, the last lines that fit in a page are kept,
+        otherwise the first ones. Also returns wether the page is full.
+        """
+        budget = MAX_MESSAGE_LENGTH - 200
+        lines = deque()  # type: Deque[LogLine]
+        full = False
+        size = 0
+        try:
+            for raw_line in iter_log_lines(stream):
+                cursor, text = parse_log_line(raw_line)
+                if before is not None and cursor >= before:
+                    break
+                if after is not None and cursor <= after:
+                    continue
+                line = format_log_line(text)
+                line_size = len(line.encode("UTF-8")) + 1
+                if not keep_newest and (
+                        size + line_size > budget or
+                        len(lines) >= Logs.PAGE_LINES):
+                    full = True
+                    break
+                lines.append((cursor, line))
+                size += line_size
+                while size > budget or len(lines) > Logs.PAGE_LINES:
+                    size -= len(lines.popleft()[1].encode("UTF-8")) + 1
+                    full = True
+        finally:
+            stream.close()
+        return lines, full
+
+    def _render(self, lines: Deque[LogLine]) -> str:
+        """Renders a page and moves the cursors to its boundaries.
+        """
+        name = self._container.name
+        if not lines:
+            return f'🗒 Logs for container `{name}`: _empty_'
+        self._oldest, self._newest = lines[0][0], lines[-1][0]
+        return "\n".join(
+            [
+                f'🗒 Logs for container `{name}` '
+                f'({format_log_cursor(self._oldest)} → '
+                f'{format_log_cursor(self._newest)}):'
+            ] + [line for _, line in lines]
+        )
+
+    def latest(self) -> str:
+        """Renders the last page of the logs.
+        """
+        lines, _ = self._page(self._container.logs(
+            stream=True,
+            tail=Logs.PAGE_LINES,
+            timestamps=True
+        ))
+        return self._render(lines)
+
+    def newer(self) -> Optional[str]:
+        """Renders the page following the last one, or returns ``None`` if
+        there are no newer lines.
+        """
+        if self._newest is None:
+            return self.latest()
+        lines, _ = self._page(
+            self._container.logs(
+                since=max(self._newest[0], 1),
+                stream=True,
+                timestamps=True
+            ),
+            after=self._newest,
+            keep_newest=False
+        )
+        return self._render(lines) if lines else None
+
+    def older(self) -> Optional[str]:
+        """Renders the page preceding the last one, or returns ``None`` if
+        there are no older lines.
+
+        The scanned time window starts at
+        :py:attr:`cmd_logs.Logs.PAGE_WINDOW` seconds and is widened until the
+        page is full or the whole log has been scanned.
+        """
+        if self._oldest is None:
+            return None
+        window = Logs.PAGE_WINDOW
+        while True:
+            since = max(self._oldest[0] - window, 1)
+            lines, full = self._page(
+                self._container.logs(
+                    since=since,
+                    stream=True,
+                    timestamps=True,
+                    until=self._oldest[0] + 1
+                ),
+                before=self._oldest
+            )
+            if full or since == 1:
+                break
+            window *= 8
+        return self._render(lines) if lines else None
+
+
+class LogFollower:
+    """Follows the logs of a container and pushes them to the reply of a
+    :py:class:`cmd_logs.Logs` command.
+
+    A reader thread consumes the log stream of the container into a rolling
+    window of :py:attr:`cmd_logs.Logs.FOLLOW_LINES` lines. A second thread
+    pushes the window through :py:meth:`telecom.command.Command.edit_reply` at
+    most once every :py:attr:`cmd_logs.Logs.FOLLOW_EDIT_INTERVAL` seconds, and
+    only if new lines arrived. Following stops when
+    :py:meth:`cmd_logs.LogFollower.stop` is called, after
+    :py:attr:`cmd_logs.Logs.FOLLOW_TIMEOUT` seconds, or when the container
+    exits.
+    """
+
+    _command: 'Logs'
+    """The command whose reply is edited."""
+
+    _container: Container
+    """The followed container."""
+
+    _dirty: bool
+    """Wether the window changed since it was last pushed."""
+
+    _reason: str
+    """Why following stopped."""
+
+    _reader: Thread
+    """Thread consuming the log stream."""
+
+    _stop_event: Event
+    """Set when following must stop."""
+
+    _stream: Optional[Any]
+    """The log stream of the container."""
+
+    _stream_lock: Lock
+    """Lock protecting ``_stream``, so that a stream opened while following
+    is stopped gets closed."""
+
+    _window: Deque[str]
+    """Rolling window of the last log lines."""
+
+    _writer: Thread
+    """Thread pushing the window to telegram."""
+
+    def __init__(self, command: 'Logs', container: Container):
+        self._command = command
+        self._container = container
+        self._dirty = False
+        self._reason = "timeout"
+        self._reader = Thread(target=self._read, daemon=True)
+        self._stop_event = Event()
+        self._stream = None
+        self._stream_lock = Lock()
+        self._window = deque(maxlen=Logs.FOLLOW_LINES)
+        self._writer = Thread(target=self._write, daemon=True)
+
+    def _push(self, footer: str, **kwargs) -> None:
+        """Edits the command reply with the current window.
+        """
+        self._dirty = False
+        text = "\n".join(
+            [f'🗒 Logs for container `{self._container.name}` ({footer}):'] +
+            [format_log_line(line) for line in list(self._window)]
+        )
+        self._command.edit_reply(text, **kwargs)
+
+    def _read(self) -> None:
+        """Consumes the log stream until it ends or is closed.
+        """
+        try:
+            stream = self._container.logs(
+                follow=True,
+                stream=True,
+                tail=Logs.FOLLOW_LINES
+            )
+            with self._stream_lock:
+                self._stream = stream
+                stopped = self._stop_event.is_set()
+            if stopped:
+                stream.close()
+                return
+            for line in iter_log_lines(stream):
+                self._window.append(
+                    line[:Logs.LINE_LENGTH].decode("UTF-8", "ignore")
+                )
+                self._dirty = True
+                if self._stop_event.is_set():
+                    break
+            else:
+                self.stop("container exited")
+        except Exception as error:  # pylint: disable=broad-except
+            if not self._stop_event.is_set():
+                logging.error("Log stream broke: %s", str(error))
+                self.stop("stream error")
+
+    def _write(self) -> None:
+        """Periodically pushes the window, then finalizes the reply and
+        releases the stream and the reader thread.
+        """
+        deadline = time.monotonic() + Logs.FOLLOW_TIMEOUT
+        while not self._stop_event.wait(Logs.FOLLOW_EDIT_INTERVAL):
+            if time.monotonic() > deadline:
+                self.stop("timeout")
+                break
+            if self._dirty:
+                self._push(
+                    "following",
+                    reply_markup=self._command.inline_keyboard(
+                        "stop",
+                        StopSelector()
+                    )
+                )
+        with self._stream_lock:
+            if self._stream is not None:
+                self._stream.close()
+        self._reader.join(Logs.FOLLOW_EDIT_INTERVAL)
+        self._push(f'stopped: {self._reason}')
+        self._command.drop_pending()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Waits for the follower to finish, if it was started. A follower
+        stopped before being started finishes as soon as it is started.
+        """
+        if self._writer.ident is not None:
+            self._writer.join(timeout)
+
+    def start(self) -> None:
+        """Starts following.
+        """
+        self._reader.start()
+        self._writer.start()
+
+    def stop(self, reason: str) -> None:
+        """Stops following.
+        """
+        if not self._stop_event.is_set():
+            self._reason = reason
+            self._stop_event.set()
+
 
 class Logs(DockerCommand):
-    """Implementation of command `/start`.
+    """Implementation of command `/logs`.
     """
 
     __HELP__ = """▪️ Usage: `/logs CONTAINER`:
-Shows logs of a container."""
+Shows logs of a container.
+▪️ Usage: `/logs CONTAINER follow`:
+Follows the logs of a container.
+▪️ Usage: `/logs CONTAINER export`:
+Sends all the logs of a container as a compressed file."""
+
+    FOLLOW_EDIT_INTERVAL: float = 3.0
+    """Minimum delay (in seconds) between two edits of a followed log."""
+
+    FOLLOW_LINES: int = 20
+    """Number of lines displayed when following logs."""
+
+    FOLLOW_TIMEOUT: float = 600.0
+    """Duration (in seconds) after which following logs stops."""
+
+    LINE_LENGTH: int = 180
+    """Length (in bytes) at which log lines are cut."""
+
+    PAGE_LINES: int = 25
+    """Maximum number of lines of a log page."""
+
+    PAGE_WINDOW: int = 60
+    """Initial duration (in seconds) of the time window scanned when looking
+    for older logs. It is widened until a page is filled."""
+
+    _pager: Optional['LogPager']
+    """Log pager, if this command browses logs."""
+
+    _follower: Optional[LogFollower]
+    """Log follower, if this command follows logs."""
+
+    def __init__(self):
+        super().__init__()
+        self._follower = None
+        self._pager = None
+
+    def export(self, container_name: str) -> None:
+        """Sends the logs of a container as a document. The log stream is
+        compressed as it is read, see
+        :py:meth:`telecom.command.Command.reply_document`.
+        """
+        container = self.get_container(container_name)
+        if not container:
+            return
+        stream = container.logs(stream=True, timestamps=True)
+        try:
+            self.reply_document(
+                stream,
+                f'{container.name}.log',
+                f'🗒 Logs for container `{container_name}`'
+            )
+        finally:
+            stream.close()
+
+    def follow(self, container_name: str) -> None:
+        """Follows the logs of a container.
 
-    LOG_LINES_TO_FETCH: int = 25
+        The command stays pending while following, so that the Stop button
+        calls it again.
+        """
+        if self._follower is not None:
+            self._follower.stop("stopped by user")
+            self._follower.join()
+            return
+        container = self.get_container(container_name)
+        if container:
+            # Set before the Stop button is sent, which may be pressed before
+            # the follower is started
+            follower = LogFollower(self, container)
+            self._follower = follower
+            self.reply(
+                f'🗒 Logs for container `{container_name}` (following):',
+                editable=True,
+                reply_markup=self.inline_keyboard("stop", StopSelector())
+            )
+            follower.start()
+            raise NotEnoughArguments
 
     def main(self):
         container_name = self.arg(
             "0",
-            ContainerSelector(self.docker_client),
+            ContainerSelector(self.container_caches),
             "Choose a container:"
         )
-        container = self.get_container(container_name)
-        if container:
-            logs_raw = container.logs(tail=Logs.LOG_LINES_TO_FETCH)
-            logs_lines = logs_raw.decode("UTF-8").split("\n")
-            logs_formatted = "\n".join(
-                [f'▪️ `{line}`' for line in logs_lines if line]
-            )
+        if self._args_dict.get("1", None) == "follow":
+            self.follow(container_name)
+            return
+        if self._args_dict.get("1", None) == "export":
+            self.export(container_name)
+            return
+        self.browse(container_name, self._args_dict.pop("page", None))
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Following logs is not restored, since the follower does not survive
+        a restart of the bot: the Stop button would follow the logs again.
+        """
+        if self._args_dict.get("1", None) == "follow":
+            return None
+        return super().snapshot()
+
+    def browse(self, container_name: str, page: Optional[str]) -> None:
+        """Browses the logs of a container, one page at a time.
+
+        The command stays pending while browsing, so that the Older and Newer
+        buttons call it again.
+        """
+        if self._pager is None:
+            container = self.get_container(container_name)
+            if not container:
+                return
+            self._pager = LogPager(container)
             self.reply(
-                f'🗒 Logs for container `{container_name}` ' +
-                f'(last *{Logs.LOG_LINES_TO_FETCH}* lines):\n{logs_formatted}'
+                self._pager.latest(),
+                editable=True,
+                reply_markup=self.inline_keyboard("page", PageSelector())
             )
+        else:
+            text = self._pager.older() if page == "older" \
+                else self._pager.newer()
+            if text is not None:
+                self.edit_reply(
+                    text,
+                    reply_markup=self.inline_keyboard("page", PageSelector())
+                )
+        raise NotEnoughArguments
+
+
+def format_log_line(line: str) -> str:
+    """Formats a log line as a markdown list item.
+
+    Backticks are replaced so that they don't break the markdown code span.
+    """
+    return f'▪️ `{line.replace("`", "ʼ")}`'
+
+
+def format_log_cursor(cursor: LogCursor) -> str:
+    """Formats the timestamp of a log line.
+    """
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(cursor[0]))
+
+
+def iter_log_lines(stream: Iterable[bytes]) -> Iterator[bytes]:
+    """Splits a stream of log chunks into lines.
+    """
+    buffer = b''
+    for chunk in stream:
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+def parse_log_line(raw_line: bytes) -> Tuple[LogCursor, str]:
+    """Parses a log line obtained with ``timestamps=True``, of the form
+    ``2020-01-31T12:34:56.123456789Z text``.
+
+    The text is cut to :py:attr:`cmd_logs.Logs.LINE_LENGTH` bytes.
+    """
+    stamp, _, text = raw_line.partition(b' ')
+    date, _, fraction = stamp.decode("ascii", "ignore").partition(".")
+    try:
+        seconds = calendar.timegm(
+            time.strptime(date[:19], "%Y-%m-%dT%H:%M:%S")
+        )
+    except ValueError:
+        seconds = 0
+    digits = ""
+    for char in fraction:
+        if not char.isdigit():
+            break
+        digits += char
+    nanoseconds = int((digits + "000000000")[:9])
+    text = text[:Logs.LINE_LENGTH]
+    return (seconds, nanoseconds), text.decode("UTF-8", "ignore")
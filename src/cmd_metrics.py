@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Implentation of command `/metrics`.
+"""
+
+from telegram.constants import (
+    MAX_MESSAGE_LENGTH
+)
+
+from telecom.command import (
+    Command
+)
+
+
+class Metrics(Command):
+    """Implementation of command `/metrics`.
+    """
+
+    __HELP__ = """▪️ Usage: `/metrics [PREFIX]`:
+Displays the metrics of the bot, or those whose name starts with `PREFIX`
+(e.g. `command`, `docker`, `telegram`). Histogram buckets are omitted."""
+
+    PREFIX: str = "dockerbot_"
+    """Common prefix of the names of the metrics of the bot."""
+
+    def main(self) -> None:
+        prefix = self._args_dict.get("0", "")
+        if not prefix.startswith(Metrics.PREFIX):
+            prefix = Metrics.PREFIX + prefix
+        lines = Command.METRICS.render(prefix, compact=True).splitlines()
+        text = ""
+        for idx, line in enumerate(lines):
+            line = line[len(Metrics.PREFIX):]
+            if len((text + line).encode("UTF-8")) > MAX_MESSAGE_LENGTH - 100:
+                text += f'... ({len(lines) - idx} more)\n'
+                break
+            text += line + "\n"
+        if not text:
+            self.reply_warning(f'No metric starts with `{prefix}`.')
+            return
+        self.reply(f'📈 *Metrics* 📈\n```\n{text}```')
@@ -3,25 +3,17 @@
 """
 
 from docker_utils import (
-    ContainerSelector,
-    DockerCommand
+    LifecycleCommand
 )
 
-class Pause(DockerCommand):
+class Pause(LifecycleCommand):
     """Implementation of command `/pause`.
     """
 
-    __HELP__ = """▪️ Usage: `/pause CONTAINER`:
-Pauses a container."""
+    __HELP__ = """▪️ Usage: `/pause CONTAINER...`:
+Pauses containers. Containers are given by name, by glob pattern \
+(e.g. `web-*`), or by label selector (e.g. `label=stack=web`)."""
 
-    def main(self):
-        container_name = self.arg(
-            "0",
-            ContainerSelector(self.docker_client),
-            "Choose a container to *pause*:"
-        )
-        container = self.get_container(container_name)
-        if container:
-            self.reply(f'🔄 Pausing container `{container_name}`.')
-            container.pause()
-            self.edit_reply(f'🆗 Paused container `{container_name}`.')
+    ACTION = "pause"
+    ACTION_DONE = "Paused"
+    ACTION_ONGOING = "Pausing"
@@ -3,25 +3,17 @@
 """
 
 from docker_utils import (
-    ContainerSelector,
-    DockerCommand
+    LifecycleCommand
 )
 
-class Restart(DockerCommand):
+class Restart(LifecycleCommand):
     """Implementation of command `/restart`.
     """
 
-    __HELP__ = """▪️ Usage: `/restart CONTAINER`:
-Restarts a container."""
+    __HELP__ = """▪️ Usage: `/restart CONTAINER...`:
+Restarts containers. Containers are given by name, by glob pattern \
+(e.g. `web-*`), or by label selector (e.g. `label=stack=web`)."""
 
-    def main(self):
-        container_name = self.arg(
-            "0",
-            ContainerSelector(self.docker_client),
-            "Choose a container to *restart*:"
-        )
-        container = self.get_container(container_name)
-        if container:
-            self.reply(f'🔄 Restarting container `{container_name}`.')
-            container.restart()
-            self.edit_reply(f'🆗 Restarted container `{container_name}`.')
+    ACTION = "restart"
+    ACTION_DONE = "Restarted"
+    ACTION_ONGOING = "Restarting"
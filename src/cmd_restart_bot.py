@@ -8,6 +8,12 @@ import sys
 from threading import (
     Thread
 )
+import time
+from typing import (
+    Sequence,
+    Tuple,
+    Union
+)
 
 from telegram.ext import (
     Updater
@@ -16,33 +22,102 @@ from telegram.ext import (
 from telecom.command import (
     Command
 )
+from telecom.registry import (
+    CommandRegistry
+)
 from telecom.selector import (
-    YesNoSelector
+    ArgumentSelector
+)
+from telecom.state import (
+    StateFile
 )
 
+
+class RestartSelector(ArgumentSelector):
+    """Selects how the bot is restarted.
+    """
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        return [
+            ("🔁 Reload commands", "reload"),
+            ("🔄 Restart process", "exec"),
+            ("No ❌", "")
+        ]
+
+
 class RestartBot(Command):
     """Implementation of command `/restart_bot`.
+
+    Reloading only re-imports the command modules, see
+    :py:meth:`telecom.registry.CommandRegistry.reload`: pending commands,
+    caches and connections are kept, and updates keep being processed.
+    Changes to other modules, e.g. ``docker_utils``, need a restart of the
+    process.
     """
 
-    __HELP__ = """▪️ Usage: `/restart_bot`:
-Restarts this bot."""
+    __HELP__ = """▪️ Usage: `/restart_bot [reload|exec]`:
+Reloads the commands of this bot in place, or restarts its process."""
 
     def main(self):
+        mode = self.arg(
+            "0",
+            RestartSelector(),
+            "This will restart the current telegram bot. Are you sure?"
+        )
+        if mode == "reload":
+            self.reload()
+        elif mode == "exec":
+            self.restart()
+        elif mode:
+            self.reply_error(f'Unknown mode `{mode}`.')
+
+    def reload(self) -> None:
+        """Reloads the commands. If they cannot be reloaded, e.g. because a
+        module has a syntax error, the current commands are kept.
+        """
+        start = time.monotonic()
+        try:
+            reloaded = self.command_registry.reload()
+        except Exception as error:  # pylint: disable=broad-except
+            logging.exception("Could not reload commands")
+            self.reply_warning(
+                f'Could not reload commands, keeping the current ones: '
+                f'`{error}`'
+            )
+            return
+        self.reply(
+            f'🔁 Reloaded {len(self.command_registry.specs)} commands '
+            f'({len(reloaded)} modules re-imported) in '
+            f'{time.monotonic() - start:.3f} s.'
+        )
+
+    def restart(self) -> None:
+        """Stops the updater, saves the state file if any, and replaces the
+        process by a new one.
+        """
 
         def target():
             self.updater.stop()
+            state_file = self._args_dict.get("state_file", None)
+            if isinstance(state_file, StateFile):
+                state_file.stop()
             os.execl(sys.executable, sys.executable, *sys.argv)
 
-        confirmation = self.arg(
-            "confirmation",
-            YesNoSelector(),
-            "This will restart the current telegram bot. Are you sure?"
-        )
-        if confirmation:
-            self.reply("🔄 Bot restarting...")
-            logging.info("Bot restarting...")
-            Thread(target=target).start()
+        self.reply("🔄 Bot restarting...")
+        logging.info("Bot restarting...")
+        Thread(target=target).start()
 
+    @property
+    def command_registry(self) -> CommandRegistry:
+        """Returns the registry of the commands of the bot.
+        """
+        registry = self._args_dict.get("command_registry", None)
+        if not isinstance(registry, CommandRegistry):
+            raise ValueError(
+                'Instances of RestartBot must have a command registry as '
+                'default value for key "command_registry"'
+            )
+        return registry
 
     @property
     def updater(self) -> Updater:
@@ -3,25 +3,17 @@
 """
 
 from docker_utils import (
-    ContainerSelector,
-    DockerCommand
+    LifecycleCommand
 )
 
-class Start(DockerCommand):
+class Start(LifecycleCommand):
     """Implementation of command `/start`.
     """
 
-    __HELP__ = """▪️ Usage: `/start CONTAINER`:
-Starts a container."""
+    __HELP__ = """▪️ Usage: `/start CONTAINER...`:
+Starts containers. Containers are given by name, by glob pattern \
+(e.g. `web-*`), or by label selector (e.g. `label=stack=web`)."""
 
-    def main(self):
-        container_name = self.arg(
-            "0",
-            ContainerSelector(self.docker_client),
-            "Choose a container to *start*:"
-        )
-        container = self.get_container(container_name)
-        if container:
-            self.reply(f'🔄 Starting container `{container_name}`.')
-            container.start()
-            self.edit_reply(f'🆗 Started container `{container_name}`.')
+    ACTION = "start"
+    ACTION_DONE = "Started"
+    ACTION_ONGOING = "Starting"
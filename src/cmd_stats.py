@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""Implentation of command `/stats`.
+"""
+
+from collections import (
+    deque
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    wait
+)
+import logging
+from threading import (
+    Lock
+)
+import time
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union
+)
+
+from docker.models.containers import (
+    Container
+)
+
+from docker_utils import (
+    DockerCommand,
+    fan_out
+)
+from telecom.command import (
+    NotEnoughArguments
+)
+from telecom.selector import (
+    ArgumentSelector
+)
+
+
+class SortSelector(ArgumentSelector):
+    """Selects the metric the containers are sorted by, or a refresh.
+    """
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        return [
+            ("CPU", "cpu"),
+            ("Memory", "memory"),
+            ("Network", "network"),
+            ("Block IO", "io"),
+            ("🔄 Refresh", "refresh")
+        ]
+
+
+class StatsSample:
+    """A resource usage sample of a container, as returned by
+    ``docker.models.containers.Container.stats(stream=False)``.
+
+    Network and block IO counters are totals since the container started.
+    """
+
+    block_io: int
+    """Bytes read from and written to block devices."""
+
+    cpu_percent: float
+    """CPU usage, in percent of one CPU, over the second preceding the
+    sample."""
+
+    memory: int
+    """Memory usage, excluding the page cache, in bytes."""
+
+    memory_limit: int
+    """Memory limit, in bytes."""
+
+    network: int
+    """Bytes received and sent over all networks."""
+
+    taken_at: float
+    """Monotonic time at which the sample was taken."""
+
+    def __init__(self, stats: Dict[str, Any]):
+        self.taken_at = time.monotonic()
+        cpu = stats.get("cpu_stats", {})
+        precpu = stats.get("precpu_stats", {})
+        cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - \
+            precpu.get("cpu_usage", {}).get("total_usage", 0)
+        system_delta = cpu.get("system_cpu_usage", 0) - \
+            precpu.get("system_cpu_usage", 0)
+        cpu_count = cpu.get("online_cpus", 0) or \
+            len(cpu.get("cpu_usage", {}).get("percpu_usage", None) or [1])
+        self.cpu_percent = 100.0 * cpu_delta / system_delta * cpu_count \
+            if system_delta > 0 and cpu_delta > 0 else 0.0
+        memory = stats.get("memory_stats", {})
+        memory_details = memory.get("stats", {})
+        self.memory = memory.get("usage", 0) - memory_details.get(
+            "inactive_file",
+            memory_details.get("cache", 0)
+        )
+        self.memory_limit = memory.get("limit", 0)
+        self.network = sum([
+            interface.get("rx_bytes", 0) + interface.get("tx_bytes", 0)
+            for interface in (stats.get("networks", None) or {}).values()
+        ])
+        self.block_io = sum([
+            entry.get("value", 0)
+            for entry in (stats.get("blkio_stats", {}).get(
+                "io_service_bytes_recursive", None) or [])
+            if entry.get("op", "").lower() in ("read", "write")
+        ])
+
+
+SamplePair = Tuple[StatsSample, Optional[StatsSample]]
+"""The last sample of a container, and the sample preceding it if any."""
+
+
+class StatsRow:
+    """A line of the `/stats` table: the last sample of a container, and its
+    network and block IO rates if a previous sample is known.
+    """
+
+    block_io: float
+    """Block IO rate in bytes per second, or total if ``is_rate`` is
+    ``False``."""
+
+    is_rate: bool
+    """Wether ``block_io`` and ``network`` are rates or totals."""
+
+    name: str
+    """Container name."""
+
+    network: float
+    """Network rate in bytes per second, or total if ``is_rate`` is
+    ``False``."""
+
+    sample: StatsSample
+    """Last sample."""
+
+    def __init__(self,
+                 name: str,
+                 sample: StatsSample,
+                 previous: Optional[StatsSample]):
+        self.name = name
+        self.sample = sample
+        duration = sample.taken_at - previous.taken_at \
+            if previous is not None else 0.0
+        self.is_rate = duration > 0 and previous is not None and \
+            sample.network >= previous.network and \
+            sample.block_io >= previous.block_io
+        if self.is_rate and previous is not None:
+            self.network = (sample.network - previous.network) / duration
+            self.block_io = (sample.block_io - previous.block_io) / duration
+        else:
+            self.network = sample.network
+            self.block_io = sample.block_io
+
+    def key(self, metric: str) -> float:
+        """Returns the value of a metric, used as sort key.
+        """
+        return {
+            "cpu": self.sample.cpu_percent,
+            "io": self.block_io,
+            "memory": float(self.sample.memory),
+            "network": self.network
+        }[metric]
+
+
+class Stats(DockerCommand):
+    """Implementation of command `/stats`.
+
+    The running containers of all docker hosts are sampled concurrently on
+    :py:attr:`cmd_stats.Stats.EXECUTOR`, and containers that do not answer
+    within :py:attr:`cmd_stats.Stats.SAMPLE_TIMEOUT` seconds are left out.
+    The last samples of each container are kept, so that network and block
+    IO rates can be computed from the previous call.
+    """
+
+    __HELP__ = """▪️ Usage: `/stats [cpu|memory|network|io] [N]`:
+Displays the resource usage of the top `N` running containers, sorted by CPU
+usage by default. Network and block IO are per second since the previous
+sample; totals are marked with `*`."""
+
+    __STATE__ = ("EXECUTOR", "HISTORY", "HISTORY_LOCK", "SAMPLING")
+
+    EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=128,
+        thread_name_prefix="stats"
+    )
+    """Thread pool on which containers are sampled. Docker takes one to two
+    seconds to sample a container, mostly waiting, so there are enough
+    workers to sample all the containers of a typical host at once."""
+
+    HISTORY: Dict[str, Deque[StatsSample]] = {}
+    """Dict that maps a container id to its last samples."""
+
+    HISTORY_LENGTH: int = 10
+    """Number of samples kept per container."""
+
+    HISTORY_LOCK: Lock = Lock()
+    """Lock protecting :py:attr:`cmd_stats.Stats.HISTORY` and
+    :py:attr:`cmd_stats.Stats.SAMPLING`."""
+
+    NAME_LENGTH: int = 20
+    """Maximum length of the container names in the table."""
+
+    SAMPLE_MAX_AGE: float = 1.0
+    """Age (in seconds) under which a sample is reused instead of querying
+    docker again."""
+
+    SAMPLE_TIMEOUT: float = 3.0
+    """Time (in seconds) to wait for the samples."""
+
+    SAMPLING: Dict[str, 'Future[SamplePair]'] = {}
+    """Dict that maps a container id to its sampling in progress."""
+
+    TOP_COUNT: int = 15
+    """Default number of containers displayed."""
+
+    _missing: int
+    """Number of running containers that could not be sampled."""
+
+    _rows: Optional[List[StatsRow]]
+    """Last sampled rows, or ``None`` if no sampling occured yet."""
+
+    def __init__(self):
+        super().__init__()
+        self._missing = 0
+        self._rows = None
+
+    def render(self, metric: str, count: int) -> str:
+        """Renders the top ``count`` rows sorted by ``metric``.
+        """
+        rows = sorted(
+            self._rows or [],
+            key=lambda row: row.key(metric),
+            reverse=True
+        )
+        lines = [
+            f'{"NAME":<{Stats.NAME_LENGTH}} {"CPU%":>6} {"MEM":>7} '
+            f'{"NET/s":>7} {"IO/s":>7}'
+        ]
+        for row in rows[:count]:
+            mark = "" if row.is_rate else "*"
+            lines.append(
+                f'{row.name[:Stats.NAME_LENGTH]:<{Stats.NAME_LENGTH}} '
+                f'{row.sample.cpu_percent:>6.1f} '
+                f'{format_bytes(row.sample.memory):>7} '
+                f'{format_bytes(row.network) + mark:>7} '
+                f'{format_bytes(row.block_io) + mark:>7}'
+            )
+        text = f'📊 *Top {min(count, len(rows))} of {len(rows)} running ' \
+            f'containers by {metric}*\n```\n' + "\n".join(lines) + "\n```"
+        if self._missing:
+            text += f'\n⌛️ {self._missing} containers did not answer.'
+        return text
+
+    def sample(self) -> None:
+        """Samples the running containers of all docker hosts.
+        """
+        listings = fan_out(self.container_caches, lambda cache: cache.list())
+        containers = [
+            container
+            for listing in listings.values()
+            for container in listing
+            if container.status == "running"
+        ]
+        futures = {
+            Stats.sample_container(container): container
+            for container in containers
+        }
+        done, _ = wait(futures, timeout=Stats.SAMPLE_TIMEOUT)
+        rows = []  # type: List[StatsRow]
+        for future in done:
+            container = futures[future]  # type: Container
+            if future.exception() is not None:
+                logging.warning("Could not sample container %s: %s",
+                                container.name, str(future.exception()))
+                continue
+            sample, previous = future.result()
+            rows.append(
+                StatsRow(self.container_name(container), sample, previous)
+            )
+        if len(listings) == len(self.container_caches):
+            running = {container.id for container in containers}
+            with Stats.HISTORY_LOCK:
+                for container_id in list(Stats.HISTORY):
+                    if container_id not in running:
+                        del Stats.HISTORY[container_id]
+        self._missing = len(containers) - len(rows)
+        self._rows = rows
+
+    @staticmethod
+    def sample_container(container: Container) -> 'Future[SamplePair]':
+        """Returns a future of the last sample of a container, and of the
+        sample preceding it.
+
+        A sample younger than :py:attr:`cmd_stats.Stats.SAMPLE_MAX_AGE` is
+        reused, and a sampling in progress is shared, so that concurrent calls
+        do not query docker for the same container. A sampling that times out
+        still completes in the background and is recorded.
+        """
+
+        def target() -> SamplePair:
+            try:
+                sample = StatsSample(container.stats(stream=False))
+            finally:
+                with Stats.HISTORY_LOCK:
+                    Stats.SAMPLING.pop(container.id, None)
+            with Stats.HISTORY_LOCK:
+                history = Stats.HISTORY.setdefault(
+                    container.id,
+                    deque(maxlen=Stats.HISTORY_LENGTH)
+                )
+                previous = history[-1] if history else None
+                history.append(sample)
+            return sample, previous
+
+        with Stats.HISTORY_LOCK:
+            history = Stats.HISTORY.get(container.id, None)
+            if history and time.monotonic() - history[-1].taken_at < \
+                    Stats.SAMPLE_MAX_AGE:
+                future = Future()  # type: Future[SamplePair]
+                future.set_result(
+                    (history[-1], history[-2] if len(history) > 1 else None)
+                )
+                return future
+            if container.id not in Stats.SAMPLING:
+                Stats.SAMPLING[container.id] = Stats.EXECUTOR.submit(target)
+            return Stats.SAMPLING[container.id]
+
+    def main(self) -> None:
+        if str(self._args_dict.get("0", "")).isdigit() and \
+                "1" not in self._args_dict:
+            # `/stats N`, with the default metric
+            self._args_dict["1"] = self._args_dict.pop("0")
+        metric = self._args_dict.get("0", "cpu")
+        if metric not in ("cpu", "io", "memory", "network"):
+            self.reply_error(f'Unknown metric `{metric}`.')
+            return
+        try:
+            count = max(int(self._args_dict.get("1", Stats.TOP_COUNT)), 1)
+        except ValueError:
+            self.reply_error(f'`{self._args_dict["1"]}` is not a number.')
+            return
+        choice = self._args_dict.pop("sort", None)
+        if choice not in (None, "refresh"):
+            self._args_dict["0"] = metric = choice
+        if self._rows is None:
+            self.sample()
+            self.reply(
+                self.render(metric, count),
+                editable=True,
+                reply_markup=self.inline_keyboard("sort", SortSelector())
+            )
+        else:
+            if choice == "refresh":
+                self.sample()
+            self.edit_reply(
+                self.render(metric, count),
+                reply_markup=self.inline_keyboard("sort", SortSelector())
+            )
+        raise NotEnoughArguments
+
+
+def format_bytes(size: float) -> str:
+    """Formats a number of bytes with a binary unit prefix, e.g. ``1.5M``.
+    """
+    for unit in ("", "K", "M", "G", "T"):
+        if abs(size) < 1024 or unit == "T":
+            return f'{size:.0f}{unit}' if not unit else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}P'
@@ -3,25 +3,17 @@
 """
 
 from docker_utils import (
-    ContainerSelector,
-    DockerCommand
+    LifecycleCommand
 )
 
-class Stop(DockerCommand):
+class Stop(LifecycleCommand):
     """Implementation of command `/stop`.
     """
 
-    __HELP__ = """▪️ Usage: `/stop CONTAINER`:
-Stops a container."""
+    __HELP__ = """▪️ Usage: `/stop CONTAINER...`:
+Stops containers. Containers are given by name, by glob pattern \
+(e.g. `web-*`), or by label selector (e.g. `label=stack=web`)."""
 
-    def main(self):
-        container_name = self.arg(
-            "0",
-            ContainerSelector(self.docker_client),
-            "Choose a container to *stop*:"
-        )
-        container = self.get_container(container_name)
-        if container:
-            self.reply(f'🔄 Stopping container `{container_name}`.')
-            container.stop()
-            self.edit_reply(f'🆗 Stopped container `{container_name}`.')
+    ACTION = "stop"
+    ACTION_DONE = "Stopped"
+    ACTION_ONGOING = "Stopping"
@@ -3,25 +3,17 @@
 """
 
 from docker_utils import (
-    ContainerSelector,
-    DockerCommand
+    LifecycleCommand
 )
 
-class Unpause(DockerCommand):
+class Unpause(LifecycleCommand):
     """Implementation of command `/unpause`.
     """
 
-    __HELP__ = """▪️ Usage: `/unpause CONTAINER`:
-Unpauses a container."""
+    __HELP__ = """▪️ Usage: `/unpause CONTAINER...`:
+Unpauses containers. Containers are given by name, by glob pattern \
+(e.g. `web-*`), or by label selector (e.g. `label=stack=web`)."""
 
-    def main(self):
-        container_name = self.arg(
-            "0",
-            ContainerSelector(self.docker_client),
-            "Choose a container to *unpause*:"
-        )
-        container = self.get_container(container_name)
-        if container:
-            self.reply(f'🔄 Unpausing container `{container_name}`.')
-            container.unpause()
-            self.edit_reply(f'🆗 Unpaused container `{container_name}`.')
+    ACTION = "unpause"
+    ACTION_DONE = "Unpaused"
+    ACTION_ONGOING = "Unpausing"
@@ -2,12 +2,35 @@
 """Various docker utilities.
 """
 
+from concurrent.futures import (
+    as_completed,
+    ThreadPoolExecutor,
+    wait
+)
+import fnmatch
+import itertools
+import logging
+import random
+import re
+from threading import (
+    Lock,
+    Thread
+)
+import time
 from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
     Optional,
     Sequence,
     Tuple,
+    TypeVar,
     Union
 )
+import urllib.parse
 
 from docker import (
     DockerClient
@@ -16,64 +39,807 @@ import docker.errors
 from docker.models.containers import (
     Container
 )
+import requests
+import requests.adapters
+from telegram.constants import (
+    MAX_MESSAGE_LENGTH
+)
 
 from telecom.command import (
     Command
 )
+from telecom.executor import (
+    KeyedLock
+)
 from telecom.selector import (
     ArgumentSelector
 )
 
 
-class ContainerSelector(ArgumentSelector):
-    """Selects a container of a docker client.
+T = TypeVar("T")
+
+
+class ContainerCache:
+    """In-process cache of the containers of a docker daemon.
+
+    The cache is populated by a single listing call once
+    :py:meth:`docker_utils.ContainerCache.start` is invoked, and then kept
+    current by a background thread subscribed to the docker events stream.
+    Each relevant container event triggers the inspection of that container
+    only. Other components can follow the same events stream, see
+    :py:meth:`docker_utils.ContainerCache.add_listener`.
+
+    While the docker host is unavailable (see
+    :py:class:`docker_utils.DockerUnavailable`), the last known containers
+    are served, however stale.
+
+    If the events stream is disconnected, or if the last full listing is older
+    than :py:attr:`docker_utils.ContainerCache.MAX_AGE`, the cache is
+    considered stale and the next read refreshes it.
     """
 
-    def __init__(self, docker_client: DockerClient):
+    EVENT_ACTIONS: Sequence[str] = (
+        "create",
+        "destroy",
+        "die",
+        "pause",
+        "rename",
+        "restart",
+        "start",
+        "unpause"
+    )
+    """Container event actions that update the cache."""
+
+    FAN_OUT_EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=32,
+        thread_name_prefix="fan-out"
+    )
+    """Thread pool on which :py:func:`docker_utils.fan_out` queries docker
+    hosts."""
+
+    FAN_OUT_TIMEOUT: float = 5.0
+    """Time (in seconds) :py:func:`docker_utils.fan_out` waits for a docker
+    host to answer."""
+
+    MAX_AGE: float = 300.0
+    """Maximum age (in seconds) of the last full listing before the cache is
+    considered stale."""
+
+    RECONNECT_DELAY: float = 5.0
+    """Delay (in seconds) before resubscribing to the events stream after it
+    broke."""
+
+    UIDS: Iterator[int] = itertools.count()
+    """Source of :py:attr:`docker_utils.ContainerCache.uid`."""
+
+    _containers: Dict[str, Container]
+    """Dict that maps a container id to the corresponding container."""
+
+    _docker_client: DockerClient
+    """Docker client."""
+
+    _listeners: List[Callable[[str, Dict[str, Any]], None]]
+    """Functions called with the host name and each container event."""
+
+    _listening: bool
+    """Wether the events stream is currently connected."""
+
+    _lock: Lock
+    """Lock protecting ``_containers``, ``_refreshed_at`` and ``version``."""
+
+    _refreshed_at: float
+    """Monotonic time of the last full listing."""
+
+    name: str
+    """Name of the docker host."""
+
+    uid: int
+    """Identifier of this cache, unique within the process: unlike the host
+    name, it tells apart caches of different daemons with the same name."""
+
+    version: int
+    """Incremented on each container event, and when a full listing finds
+    containers added, removed, renamed or with a new status, so that what is
+    rendered from the containers can be reused until then, see
+    :py:class:`telecom.render.RenderCache`."""
+
+    def __init__(self, docker_client: DockerClient, name: str = "local"):
+        self.name = name
+        self.uid = next(ContainerCache.UIDS)
+        self.version = 0
+        self._containers = {}
         self._docker_client = docker_client
+        self._listeners = []
+        self._listening = False
+        self._lock = Lock()
+        self._refreshed_at = 0.0
 
-    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
-        return [
-            (
-                f'{container.name} {emoji_of_status(container.status)}',
-                container.name
+    def _handle_event(self, event: Dict[str, Any]) -> None:
+        """Updates the cache according to a docker event.
+        """
+        for listener in self._listeners:
+            try:
+                listener(self.name, event)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Docker event listener failed")
+        action = event.get("Action", event.get("status", ""))
+        container_id = event.get("id", event.get("Actor", {}).get("ID", ""))
+        if not container_id or action not in ContainerCache.EVENT_ACTIONS:
+            return
+        logging.debug("Container %s: %s", container_id, action)
+        if action == "destroy":
+            with self._lock:
+                self._containers.pop(container_id, None)
+                self.version += 1
+        else:
+            self._update(container_id)
+
+    def _listen(self) -> None:
+        """Consumes the docker events stream forever.
+        """
+        while True:
+            try:
+                events = self._docker_client.events(
+                    decode=True,
+                    filters={"type": "container"}
+                )
+                self._listening = True
+                # Events that happened before the subscription are caught up
+                # by a full listing.
+                self.refresh()
+                for event in events:
+                    self._handle_event(event)
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error("Docker events stream broke: %s", str(error))
+            finally:
+                self._listening = False
+            time.sleep(ContainerCache.RECONNECT_DELAY)
+
+    def _update(self, container_id: str) -> Optional[Container]:
+        """Inspects a single container and updates the cache accordingly.
+        """
+        container = None  # type: Optional[Container]
+        try:
+            container = self._docker_client.containers.get(container_id)
+        except docker.errors.NotFound:
+            pass
+        with self._lock:
+            if container is None:
+                removed = self._containers.pop(container_id, None)
+                changed = removed is not None
+            else:
+                previous = self._containers.get(container.id, None)
+                changed = previous is None or \
+                    _summary({"": previous}) != _summary({"": container})
+                self._containers[container.id] = container
+            if changed:
+                self.version += 1
+        return container
+
+    def _find(self, container_name: str) -> Optional[Container]:
+        """Finds a container in the cache by name, id, or id prefix. As with
+        docker, an id prefix must match a single container.
+        """
+        with self._lock:
+            for container in self._containers.values():
+                if container_name in (container.name, container.id):
+                    return container
+            matches = [
+                container for container in self._containers.values()
+                if container.id.startswith(container_name)
+            ]
+        return matches[0] if len(matches) == 1 else None
+
+    def add_listener(self,
+                     listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Adds a function called with the host name and each container event
+        of the docker events stream, from the thread consuming it. The
+        function must return quickly, e.g. by queuing the event.
+        """
+        self._listeners.append(listener)
+
+    def get(self,
+            container_name: str,
+            force_refresh: bool = False) -> Optional[Container]:
+        """Gets a container by name, id, or id prefix.
+
+        If the container is not in the cache, or if the cache is stale, or if
+        ``force_refresh`` is set, the container is inspected. Returns ``None``
+        if the container does not exist. An ambiguous id prefix is left to
+        docker, which rejects it.
+        """
+        if not (force_refresh or self.is_stale()):
+            container = self._find(container_name)
+            if container is not None:
+                return container
+        try:
+            return self._update(container_name)
+        except DockerUnavailable:
+            container = self._find(container_name)
+            if container is None:
+                raise
+            return container
+
+    def current_version(self) -> Optional[Tuple[int, int]]:
+        """Returns :py:attr:`docker_utils.ContainerCache.uid` and
+        :py:attr:`docker_utils.ContainerCache.version`, or ``None`` if the
+        cache is stale, in which case the version may not reflect the latest
+        changes.
+        """
+        return None if self.is_stale() else (self.uid, self.version)
+
+    def is_stale(self) -> bool:
+        """Wether the cache needs to be refreshed before being read.
+        """
+        age = time.monotonic() - self._refreshed_at
+        return not self._listening or age > ContainerCache.MAX_AGE
+
+    def list(self, force_refresh: bool = False) -> List[Container]:
+        """Returns all containers, sorted by name.
+
+        The cache is refreshed first if it is stale or if ``force_refresh`` is
+        set.
+        """
+        if force_refresh or self.is_stale():
+            try:
+                self.refresh()
+            except DockerUnavailable:
+                if not self._refreshed_at:
+                    raise
+                logging.warning("Docker host %s is unavailable, serving "
+                                "cached containers", self.name)
+        with self._lock:
+            containers = list(self._containers.values())
+        return sorted(containers, key=lambda container: container.name)
+
+    def refresh(self) -> None:
+        """Repopulates the cache with a single listing call.
+        """
+        containers = {
+            container.id: container
+            for container in map(
+                _unsparse,
+                self._docker_client.containers.list(all=True, sparse=True)
             )
-            for container in self._docker_client.containers.list(all=True)
-        ]
+        }
+        with self._lock:
+            if _summary(containers) != _summary(self._containers):
+                self.version += 1
+            self._containers = containers
+            self._refreshed_at = time.monotonic()
+        logging.debug("Refreshed container cache (%d containers)",
+                      len(containers))
+
+    def start(self) -> None:
+        """Starts listening to docker events. The cache is populated in the
+        background, so that an unreachable docker host does not delay the
+        caller.
+        """
+        Thread(target=self._listen, daemon=True).start()
+
+    @property
+    def docker_client(self) -> DockerClient:
+        """Returns the ``docker.DockerClient`` of this cache.
+        """
+        return self._docker_client
+
+
+class ContainerSelector(ArgumentSelector):
+    """Selects a container among the containers of some docker hosts.
+
+    If there are several docker hosts, containers are designated by
+    ``HOST/CONTAINER``. Hosts are queried concurrently, and hosts that do not
+    answer in time are skipped, see :py:func:`docker_utils.fan_out`.
+    """
+
+    def __init__(self, container_caches: Sequence[ContainerCache]):
+        self._container_caches = container_caches
+
+    def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
+        listings = fan_out(
+            self._container_caches,
+            lambda cache: cache.list()
+        )
+        options = []  # type: List[Union[str, Tuple[str, str]]]
+        for cache in self._container_caches:
+            for container in listings.get(cache.name, []):
+                name = container.name if len(self._container_caches) == 1 \
+                    else f'{cache.name}/{container.name}'
+                options.append(
+                    (f'{name} {emoji_of_status(container.status)}', name)
+                )
+        return options
+
+    def option_version(self) -> Optional[Hashable]:
+        versions = tuple(
+            cache.current_version() for cache in self._container_caches
+        )
+        if any(version is None for version in versions):
+            return None
+        return versions
 
 
 # pylint: disable=abstract-method
 class DockerCommand(Command):
-    """An abstract command that interacts with the docker daemon.
+    """An abstract command that interacts with docker daemons.
+
+    A non-empty list of :py:class:`docker_utils.ContainerCache`, one per
+    docker host, **must** be given as a default value for argument
+    ``container_caches``. See :py:meth:`telecom.command.register_command`.
+    Containers of a specific host are designated by ``HOST/CONTAINER``.
 
-    A ``docker.DockerClient`` **must** be given as a default value for argument
-    ``docker_client``. See :py:meth:`telecom.command.register_command`.
+    Actions on a given container should be serialized using
+    :py:attr:`docker_utils.DockerCommand.CONTAINER_LOCKS`.
     """
 
+    BLOCKING: bool = True
+
+    CONTAINER_LOCKS: KeyedLock = KeyedLock()
+    """Locks indexed by container id."""
+
+    def container_name(self, container: Container) -> str:
+        """Returns the name of a container, prefixed by the name of its docker
+        host if there are several hosts.
+        """
+        if len(self.container_caches) > 1:
+            for cache in self.container_caches:
+                if cache.docker_client is container.client:
+                    return f'{cache.name}/{container.name}'
+        return container.name
+
     def get_container(self,
                       container_name: str) -> Optional[Container]:
         """Gets a container.
 
-        If the container does not exist, return ``None`` and reports.
+        If the name is not prefixed by a docker host name, all hosts are
+        searched. If the container does not exist, return ``None`` and reports.
         """
-        container = None  # type: Optional[Container]
-        try:
-            container = self.docker_client.containers.get(container_name)
-        except docker.errors.NotFound:
-            self.reply_error(f'Container \"{container_name}\" not found.')
-        return container
+        caches, name = self.split_host(container_name)
+        found = fan_out(caches, lambda cache: cache.get(name))
+        for cache in caches:
+            container = found.get(cache.name, None)
+            if container is not None:
+                return container
+        self.reply_error(f'Container \"{container_name}\" not found.')
+        return None
+
+    def match_containers(self, patterns: Sequence[str]) -> List[Container]:
+        """Gets the containers matched by a list of patterns, sorted by name.
+
+        A pattern is either a container name or id, a glob pattern on container
+        names (e.g. ``web-*``), or a label selector of the form ``label=KEY``
+        or ``label=KEY=VALUE``. Patterns that match nothing are reported.
+        """
+        containers = {}  # type: Dict[str, Container]
+        unmatched = []  # type: List[str]
+        for pattern in patterns:
+            matched = []  # type: List[Container]
+            caches, name = self.split_host(pattern)
+            if name.startswith("label=") or any(
+                    char in name for char in "*?["):
+                listings = fan_out(caches, lambda cache: cache.list())
+                candidates = [
+                    container
+                    for listing in listings.values()
+                    for container in listing
+                ]
+            else:
+                # The first host having the container, as in get_container()
+                found = fan_out(caches, lambda cache: cache.get(name))
+                candidates = [
+                    found[cache.name] for cache in caches
+                    if found.get(cache.name, None) is not None
+                ][:1]
+            if name.startswith("label="):
+                key, _, value = name[len("label="):].partition("=")
+                matched = [
+                    container for container in candidates
+                    if key in container.labels and
+                    (not value or container.labels[key] == value)
+                ]
+            elif any(char in name for char in "*?["):
+                matched = [
+                    container for container in candidates
+                    if fnmatch.fnmatchcase(container.name, name)
+                ]
+            else:
+                matched = candidates
+            if not matched:
+                unmatched.append(pattern)
+            containers.update({
+                self.container_name(container): container
+                for container in matched
+            })
+        if unmatched:
+            self.reply_error("No container matches " + ", ".join([
+                f'`{pattern}`' for pattern in unmatched
+            ]) + ".")
+        return [containers[name] for name in sorted(containers)]
+
+    def split_host(self,
+                   container_name: str) -> Tuple[List[ContainerCache], str]:
+        """Splits a container designation of the form ``HOST/CONTAINER`` into
+        the cache of that host and the container name. If there is no host
+        prefix, the caches of all hosts are returned.
+        """
+        host, _, name = container_name.partition("/")
+        for cache in self.container_caches:
+            if name and cache.name == host:
+                return [cache], name
+        return list(self.container_caches), container_name
 
     @property
-    def docker_client(self) -> DockerClient:
-        """Returns the ``docker.DockerClient`` of this command.
+    def container_cache(self) -> ContainerCache:
+        """Returns the :py:class:`docker_utils.ContainerCache` of the first
+        docker host of this command.
         """
-        client = self._args_dict.get("docker_client", None)
-        if not isinstance(client, DockerClient):
+        return self.container_caches[0]
+
+    @property
+    def container_caches(self) -> List[ContainerCache]:
+        """Returns the :py:class:`docker_utils.ContainerCache` of all the docker
+        hosts of this command.
+        """
+        caches = self._args_dict.get("container_caches", None)
+        if not caches or not all(
+                isinstance(cache, ContainerCache) for cache in caches):
             raise ValueError(
-                'A DockerCommand must have a DockerClient as default value '
-                'for key "docker_client"'
+                'A DockerCommand must have a non-empty list of ContainerCache '
+                'as default value for key "container_caches"'
+            )
+        return list(caches)
+
+    @property
+    def docker_client(self) -> DockerClient:
+        """Returns the ``docker.DockerClient`` of the first docker host of this
+        command.
+        """
+        return self.container_cache.docker_client
+
+
+class DockerTransport:
+    """Timeouts, retries and circuit breaker of the requests of a docker
+    client.
+
+    Reads (``GET`` requests, except streamed ones) time out after
+    :py:attr:`docker_utils.DockerTransport.READ_TIMEOUT` seconds, or as set
+    in :py:attr:`docker_utils.DockerTransport.SLOW_READS`, and other
+    requests after the timeout of the client, to which docker-py adds the
+    grace period of ``stop`` and ``restart``. Reads that fail to connect, time
+    out, or get a ``502``, ``503`` or ``504`` response are retried at most
+    :py:attr:`docker_utils.DockerTransport.RETRIES` times, with a jittered
+    exponential backoff.
+
+    After :py:attr:`docker_utils.DockerTransport.BREAKER_THRESHOLD`
+    consecutive failures, the circuit breaker opens: requests fail at once
+    with :py:class:`docker_utils.DockerUnavailable` for
+    :py:attr:`docker_utils.DockerTransport.BREAKER_COOLDOWN` seconds. A single
+    request is then let through, which closes the breaker if it succeeds, and
+    opens it again otherwise.
+
+    Connection pools keep at most
+    :py:attr:`docker_utils.DockerTransport.POOL_SIZE` connections, including
+    over TCP, for which docker-py ignores ``max_pool_size``.
+    """
+
+    BREAKER_COOLDOWN: float = 30.0
+    """Time (in seconds) during which requests fail fast once the breaker is
+    open."""
+
+    BREAKER_THRESHOLD: int = 5
+    """Number of consecutive failures that open the breaker."""
+
+    POOL_SIZE: int = 64
+    """Maximum number of connections kept open to a docker host, enough for
+    the workers of :py:class:`cmd_grep.Grep` and the events stream."""
+
+    READ_TIMEOUT: float = 10.0
+    """Timeout (in seconds) of reads."""
+
+    RETRIES: int = 2
+    """Maximum number of retries of a read."""
+
+    RETRY_BACKOFF: float = 0.5
+    """Maximum delay (in seconds) before the first retry, doubled for each
+    following retry."""
+
+    RETRY_STATUSES: Tuple[int, ...] = (502, 503, 504)
+    """HTTP statuses of the reads that are retried."""
+
+    SLOW_READS: Dict[str, float] = {"/system/df": 300.0}
+    """Dict that maps the endpoint of a slow read to its timeout (in seconds),
+    used in place of :py:attr:`docker_utils.DockerTransport.READ_TIMEOUT`.
+    Slow reads are not retried."""
+
+    TRANSPORTS: Dict[str, 'DockerTransport'] = {}
+    """Dict that maps a docker host name to its transport."""
+
+    WRITE_TIMEOUT: float = 60.0
+    """Timeout (in seconds) of the other requests, i.e. the timeout of the
+    docker clients."""
+
+    host_name: str
+    """Name of the docker host."""
+
+    opened_at: Optional[float]
+    """Monotonic time the breaker opened at, or ``None`` if it is closed."""
+
+    _failures: int
+    """Number of consecutive failures."""
+
+    _lock: Lock
+    """Lock protecting the state of the breaker."""
+
+    _probing: bool
+    """Wether a request is let through while the breaker is open."""
+
+    _request: Callable[..., requests.Response]
+    """Original ``request`` method of the docker client."""
+
+    _timeout: Any
+    """Timeout of the docker client."""
+
+    def __init__(self, docker_client: DockerClient, host_name: str):
+        self.host_name = host_name
+        self.opened_at = None
+        self._failures = 0
+        self._lock = Lock()
+        self._probing = False
+        self._request = docker_client.api.request
+        self._timeout = docker_client.api.timeout
+        self._rejected = Command.METRICS.counter(
+            "dockerbot_docker_rejected_total",
+            "Docker requests failed fast because the breaker was open",
+            ("host",)
+        )
+        self._retries = Command.METRICS.counter(
+            "dockerbot_docker_retries_total",
+            "Retries of docker reads",
+            ("host",)
+        )
+        DockerTransport.TRANSPORTS[host_name] = self
+        Command.METRICS.gauge(
+            "dockerbot_docker_breaker_open",
+            "Wether the circuit breaker of a docker host is open",
+            lambda: {
+                (name,): float(transport.opened_at is not None)
+                for name, transport in DockerTransport.TRANSPORTS.items()
+            },
+            ("host",)
+        )
+        for prefix, adapter in list(docker_client.api.adapters.items()):
+            # pylint: disable=unidiomatic-typecheck
+            if type(adapter) is requests.adapters.HTTPAdapter:
+                docker_client.api.mount(prefix, requests.adapters.HTTPAdapter(
+                    pool_maxsize=DockerTransport.POOL_SIZE
+                ))
+        docker_client.api.request = self.request
+
+    def _allow(self) -> None:
+        """Raises :py:class:`docker_utils.DockerUnavailable` unless a request
+        may be sent.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_in = self.opened_at + DockerTransport.BREAKER_COOLDOWN - \
+                time.monotonic()
+            if retry_in <= 0 and not self._probing:
+                self._probing = True
+                return
+        self._rejected.inc(host=self.host_name)
+        raise DockerUnavailable(self.host_name, max(retry_in, 0.0))
+
+    def _record(self, success: bool) -> None:
+        """Updates the breaker with the outcome of a request.
+        """
+        with self._lock:
+            self._probing = False
+            if success:
+                if self.opened_at is not None:
+                    logging.info("Docker host %s is available again",
+                                 self.host_name)
+                self._failures = 0
+                self.opened_at = None
+                return
+            self._failures += 1
+            if self.opened_at is not None or \
+                    self._failures >= DockerTransport.BREAKER_THRESHOLD:
+                if self.opened_at is None:
+                    logging.error("Docker host %s failed %d times in a row, "
+                                  "failing fast for %.0f s", self.host_name,
+                                  self._failures,
+                                  DockerTransport.BREAKER_COOLDOWN)
+                self.opened_at = time.monotonic()
+
+    def request(self,
+                method: str,
+                url: str,
+                **kwargs) -> requests.Response:
+        """Sends a request, in place of the ``request`` method of the docker
+        client.
+        """
+        retries = DockerTransport.RETRIES if method == "GET" else 0
+        if method == "GET" and not kwargs.get("stream", False) and \
+                kwargs.get("timeout", None) == self._timeout:
+            path = re.sub(r'^/v[0-9.]+/', "/", urllib.parse.urlparse(url).path)
+            if path in DockerTransport.SLOW_READS:
+                kwargs["timeout"] = DockerTransport.SLOW_READS[path]
+                retries = 0
+            else:
+                kwargs["timeout"] = DockerTransport.READ_TIMEOUT
+        attempt = 0
+        while True:
+            self._allow()
+            try:
+                response = self._request(method, url, **kwargs)
+            except Exception as error:  # pylint: disable=broad-except
+                self._record(False)
+                if attempt == retries or \
+                        not isinstance(error, requests.RequestException):
+                    raise
+                logging.warning("Retrying %s %s on docker host %s: %s",
+                                method, url, self.host_name, str(error))
+            else:
+                if response.status_code not in \
+                        DockerTransport.RETRY_STATUSES:
+                    self._record(True)
+                    return response
+                self._record(False)
+                if attempt == retries:
+                    return response
+                response.close()
+            attempt += 1
+            self._retries.inc(host=self.host_name)
+            time.sleep(random.uniform(
+                0.0,
+                DockerTransport.RETRY_BACKOFF * 2 ** (attempt - 1)
+            ))
+
+
+class DockerUnavailable(docker.errors.DockerException):
+    """Raised instead of sending a request to a docker host whose circuit
+    breaker is open, see :py:class:`docker_utils.DockerTransport`.
+    """
+
+    host_name: str
+    """Name of the docker host."""
+
+    retry_in: float
+    """Time (in seconds) before a request is let through again."""
+
+    def __init__(self, host_name: str, retry_in: float):
+        super().__init__(
+            f'Docker host {host_name} is unavailable, retrying in '
+            f'{retry_in:.0f} s'
+        )
+        self.host_name = host_name
+        self.retry_in = retry_in
+
+
+# pylint: disable=abstract-method
+class LifecycleCommand(DockerCommand):
+    """An abstract command that applies a lifecycle action, such as ``start``
+    or ``stop``, to one or more containers.
+
+    Containers are given as positional arguments, see
+    :py:meth:`docker_utils.DockerCommand.match_containers`. The action is
+    applied concurrently by at most
+    :py:attr:`docker_utils.LifecycleCommand.MAX_WORKERS` threads, and a single
+    progress message is edited as each container completes.
+
+    Subclasses must set :py:attr:`docker_utils.LifecycleCommand.ACTION`,
+    :py:attr:`docker_utils.LifecycleCommand.ACTION_ONGOING` and
+    :py:attr:`docker_utils.LifecycleCommand.ACTION_DONE`.
+    """
+
+    ACTION: str = ""
+    """Name of the ``docker.models.containers.Container`` method to call, e.g.
+    ``start``."""
+
+    ACTION_DONE: str = ""
+    """Past participle of the action, e.g. ``Started``."""
+
+    ACTION_ONGOING: str = ""
+    """Present participle of the action, e.g. ``Starting``."""
+
+    MAX_WORKERS: int = 8
+    """Maximum number of containers acted upon concurrently."""
+
+    def act(self, containers: Sequence[Container]) -> None:
+        """Applies the action to containers and reports progress.
+
+        The progress message lists each container while it fits in a
+        message, otherwise only the counts and the failures that fit; the
+        complete list is then sent once all containers completed.
+        """
+        results = {}  # type: Dict[str, Optional[str]]
+
+        def status_line(name: str) -> str:
+            if name not in results:
+                return f'🔄 `{name}`'
+            if results[name] is None:
+                return f'🆗 `{name}`'
+            return f'❌ `{name}`: {results[name]}'
+
+        def progress_text(complete: bool = False) -> str:
+            verb = self.ACTION_ONGOING \
+                if len(results) < len(containers) else self.ACTION_DONE
+            lines = [
+                f'{verb} {len(containers)} containers '
+                f'({len(results)}/{len(containers)}):'
+            ] + [
+                status_line(self.container_name(container))
+                for container in containers
+            ]
+            text = "\n".join(lines)
+            if complete or len(text.encode("UTF-8")) <= MAX_MESSAGE_LENGTH:
+                return text
+            failures = [line for line in lines if line.startswith("❌")]
+            lines = lines[:1] + [
+                f'🆗 {len(results) - len(failures)} ❌ {len(failures)} 🔄 '
+                f'{len(containers) - len(results)}'
+            ]
+            # Keep room for the count of failures left out
+            size = len("\n".join(lines).encode("UTF-8")) + 40
+            for idx, line in enumerate(failures):
+                size += len(line.encode("UTF-8")) + 1
+                if size > MAX_MESSAGE_LENGTH:
+                    lines.append(f'... ({len(failures) - idx} more failures)')
+                    break
+                lines.append(line)
+            return "\n".join(lines)
+
+        self.reply(progress_text(), editable=True)
+        workers = min(self.MAX_WORKERS, len(containers))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.act_on, container):
+                self.container_name(container)
+                for container in containers
+            }
+            for future in as_completed(futures):
+                error = future.exception()
+                results[futures[future]] = \
+                    None if error is None else str(error)
+                if error is not None:
+                    logging.error("Could not %s container %s: %s",
+                                  self.ACTION, futures[future], str(error))
+                self.edit_reply(progress_text())
+        text = progress_text(complete=True)
+        if len(text.encode("UTF-8")) > MAX_MESSAGE_LENGTH:
+            self.reply(text)
+        failures = [name for name, error in results.items() if error]
+        if failures:
+            self.reply_error(
+                f'{len(failures)} out of {len(containers)} containers could '
+                f'not be {self.ACTION_DONE.lower()}.'
             )
-        return client
+
+    def act_on(self, container: Container) -> None:
+        """Applies the action to a single container, while holding its lock.
+        """
+        with DockerCommand.CONTAINER_LOCKS.lock(container.id):
+            getattr(container, self.ACTION)()
+
+    def main(self) -> None:
+        self.arg(
+            "0",
+            ContainerSelector(self.container_caches),
+            f'Choose a container to *{self.ACTION}*:'
+        )
+        patterns = []  # type: List[str]
+        while str(len(patterns)) in self._args_dict:
+            patterns.append(self._args_dict[str(len(patterns))])
+        containers = self.match_containers(patterns)
+        if len(containers) == 1:
+            name = self.container_name(containers[0])
+            self.reply(f'🔄 {self.ACTION_ONGOING} container `{name}`.',
+                       editable=True)
+            self.act_on(containers[0])
+            self.edit_reply(f'🆗 {self.ACTION_DONE} container `{name}`.')
+        elif containers:
+            self.act(containers)
 
 
 def emoji_of_status(status: str) -> str:
@@ -92,3 +858,125 @@ def emoji_of_status(status: str) -> str:
         "restarting": "↩",
         "running": "▶"
     }.get(status, "❓")
+
+
+def fan_out(container_caches: Sequence[ContainerCache],
+            function: Callable[[ContainerCache], T]) -> Dict[str, T]:
+    """Calls a function on the caches of several docker hosts concurrently.
+
+    Returns a dict that maps a host name to the result of the function. Hosts
+    for which the function fails, or does not return within
+    :py:attr:`docker_utils.ContainerCache.FAN_OUT_TIMEOUT` seconds, are
+    omitted; if the function failed for all hosts, the error of the first host
+    is raised instead, e.g. :py:class:`docker_utils.DockerUnavailable`.
+    """
+    if len(container_caches) == 1:
+        # No need for a thread if there is a single host, whose error is
+        # raised as is
+        return {container_caches[0].name: function(container_caches[0])}
+    futures = {
+        ContainerCache.FAN_OUT_EXECUTOR.submit(function, cache): cache.name
+        for cache in container_caches
+    }
+    done, not_done = wait(futures, timeout=ContainerCache.FAN_OUT_TIMEOUT)
+    for future in not_done:
+        logging.warning("Docker host %s did not answer in time",
+                        futures[future])
+    results = {}  # type: Dict[str, T]
+    errors = {}  # type: Dict[str, BaseException]
+    for future in done:
+        error = future.exception()
+        if error is not None:
+            logging.error("Docker host %s failed: %s",
+                          futures[future], str(error))
+            errors[futures[future]] = error
+        else:
+            results[futures[future]] = future.result()
+    if len(errors) == len(container_caches):
+        raise errors[container_caches[0].name]
+    return results
+
+
+def instrument_docker_client(docker_client: DockerClient,
+                             host_name: str) -> None:
+    """Records the number and duration of the requests of a docker client in
+    :py:attr:`telecom.command.Command.METRICS`.
+
+    The duration of a request is measured until its response headers are
+    received, so that streamed responses (events, logs) do not skew it.
+    Container (and image, network, etc.) ids and names are removed from the
+    recorded endpoints.
+    """
+    durations = Command.METRICS.histogram(
+        "dockerbot_docker_request_duration_seconds",
+        "Duration of the docker engine API requests",
+        ("host", "method", "endpoint", "status")
+    )
+
+    def hook(response, *args, **kwargs):
+        # pylint: disable=unused-argument
+        path = re.sub(
+            r'^/v[0-9.]+/',
+            "/",
+            urllib.parse.urlparse(response.request.path_url).path
+        )
+        durations.observe(
+            response.elapsed.total_seconds(),
+            host=host_name,
+            method=response.request.method,
+            endpoint=_endpoint(path),
+            status=str(response.status_code)
+        )
+
+    docker_client.api.hooks["response"].append(hook)
+
+
+def _endpoint(path: str) -> str:
+    """Returns a docker engine API path with the id or name of the object it
+    targets, if any, replaced by ``ID``, e.g. ``/containers/ID/json`` or
+    ``/images/ID`` for ``/images/library/nginx:latest``.
+    """
+    collection_endpoints = {
+        "create", "events", "get", "json", "load", "privileges", "prune",
+        "pull", "search"
+    }
+    object_endpoints = {
+        "archive", "attach", "changes", "connect", "disable", "disconnect",
+        "enable", "exec", "export", "history", "json", "kill", "logs",
+        "pause", "push", "rename", "resize", "restart", "set", "start",
+        "stats", "stop", "tag", "top", "unpause", "update", "upgrade", "wait"
+    }
+    resources = {
+        "configs", "containers", "distribution", "exec", "images",
+        "networks", "nodes", "plugins", "secrets", "services", "tasks",
+        "volumes"
+    }
+    parts = path.split("/")
+    if len(parts) < 3 or parts[1] not in resources or len(parts) == 3 and \
+            parts[2] in collection_endpoints:
+        return path
+    if len(parts) > 3 and parts[-1] in object_endpoints:
+        return f'/{parts[1]}/ID/{parts[-1]}'
+    return f'/{parts[1]}/ID'
+
+
+def _summary(containers: Dict[str, Container]) -> Dict[str, Tuple[str, str]]:
+    """Returns the names and statuses of containers, by id.
+    """
+    return {
+        container_id: (container.name, container.status)
+        for container_id, container in containers.items()
+    }
+
+
+def _unsparse(container: Container) -> Container:
+    """Completes the attributes of a container obtained from a sparse listing,
+    so that its ``name``, ``status`` and ``labels`` properties are available
+    without inspecting it.
+    """
+    attrs = container.attrs
+    if attrs.get("Name") is None and attrs.get("Names"):
+        attrs["Name"] = attrs["Names"][0]
+    if "Config" not in attrs:
+        attrs["Config"] = {"Labels": attrs.get("Labels") or {}}
+    return container
@@ -5,8 +5,15 @@
 import argparse
 import logging
 import os
+import secrets
+import socket
+import time
+import urllib.parse
 from typing import (
-    List
+    Dict,
+    List,
+    Optional,
+    Sequence
 )
 
 import docker
@@ -15,27 +22,49 @@ from telegram import (
     ParseMode,
     Update
 )
+from telegram.error import (
+    TelegramError
+)
 from telegram.ext import (
     CallbackContext,
     CallbackQueryHandler,
+    MessageHandler,
     Updater
 )
+from telegram.ext.filters import (
+    Filters
+)
 
+from alerts import (
+    AlertManager
+)
+from docker_utils import (
+    ContainerCache,
+    DockerTransport,
+    DockerUnavailable,
+    instrument_docker_client
+)
 from telecom.command import (
+    add_metrics_hooks,
+    Command,
     inline_query_handler,
-    register_command,
+    reply_query_handler,
     register_help_command
 )
+from telecom.executor import (
+    CommandExecutor
+)
+from telecom.registry import (
+    CommandRegistry
+)
+from telecom.state import (
+    StateFile
+)
+
+
+STARTUP_DURATIONS: Dict[str, float] = {}
+"""Dict that maps a startup phase to its duration, in seconds."""
 
-import cmd_hi
-import cmd_info
-import cmd_logs
-import cmd_pause
-import cmd_restart
-import cmd_restart_bot
-import cmd_start
-import cmd_stop
-import cmd_unpause
 
 
 def error_callback(update: Update, context: CallbackContext) -> None:
@@ -49,6 +78,10 @@ def error_callback(update: Update, context: CallbackContext) -> None:
     # pylint: disable=unused-argument
     error_name = context.error.__class__.__name__
     error_message = str(context.error)
+    text = f'''❌ *TELEGRAM ERROR* ❌
+Last command raised a telegram `{error_name}`: {error_message}'''
+    if isinstance(context.error, DockerUnavailable):
+        text = f'⚠️ *DOCKER UNAVAILABLE* ⚠️\n{error_message}.'
     try:
         logging.error(
             'User "%s" raised a telegram error %s: %s',
@@ -60,8 +93,7 @@ def error_callback(update: Update, context: CallbackContext) -> None:
             chat_id=update.message.chat_id,
             parse_mode=ParseMode.MARKDOWN,
             reply_to_message_id=update.message.message_id,
-            text=f'''❌ *TELEGRAM ERROR* ❌
-Last command raised a telegram `{error_name}`: {error_message}'''
+            text=text
         )
     except:  # pylint: disable=bare-except
         logging.error(
@@ -71,117 +103,219 @@ Last command raised a telegram `{error_name}`: {error_message}'''
         )
 
 
-def init_docker(server: str) -> docker.DockerClient:
-    """Inits the docker client.
+def init_docker(servers: List[str]) -> List[ContainerCache]:
+    """Inits the docker clients and their container caches.
+
+    A server is given as ``[NAME=]URL``. If no name is given, it is derived
+    from the URL. Requests go through a
+    :py:class:`docker_utils.DockerTransport`.
     """
-    client = docker.DockerClient(base_url=server)
-    logging.info("Connected to docker socket %s", server)
-    return client
+    container_caches = []  # type: List[ContainerCache]
+    for server in servers:
+        name, separator, url = server.partition("=")
+        if not separator or "/" in name:
+            name, url = "", server
+        if not name:
+            host = urllib.parse.urlparse(url).hostname
+            name = host if host else "local"
+        if name in [cache.name for cache in container_caches]:
+            raise ValueError(f'Duplicate docker host name "{name}"')
+        client = docker.DockerClient(
+            base_url=url,
+            max_pool_size=DockerTransport.POOL_SIZE,
+            timeout=DockerTransport.WRITE_TIMEOUT
+        )
+        instrument_docker_client(client, name)
+        DockerTransport(client, name)
+        logging.info("Connected to docker host %s at %s", name, url)
+        container_cache = ContainerCache(client, name)
+        container_cache.start()
+        container_caches.append(container_cache)
+    return container_caches
 
 
 def init_telegram(token: str,
                   authorized_users: List[int],
-                  docker_client: docker.DockerClient) -> None:
+                  container_caches: List[ContainerCache],
+                  executor: CommandExecutor,
+                  api_url: Optional[str] = None,
+                  webhook_url: Optional[str] = None,
+                  webhook_listen: str = "0.0.0.0:8443",
+                  webhook_secret: str = "",
+                  workers: int = 4,
+                  plugin_dirs: Sequence[str] = (),
+                  state_file: Optional[StateFile] = None,
+                  alert_chats: Sequence[int] = ()) -> None:
     """Inits the telegram bot.
 
-    Registers commands, polls.
+    Registers commands, restores the pending commands from ``state_file`` if
+    any, then receives updates through a webhook if ``webhook_url`` is set,
+    and falls back to polling otherwise or if the webhook cannot be started.
+    The pending commands are saved to ``state_file`` periodically and when the
+    bot stops. Container alerts are sent to ``alert_chats``, if any.
+    """
+    start = time.monotonic()
+    updater = Updater(
+        token=token,
+        base_url=api_url,
+        use_context=True,
+        workers=workers
+    )
+    registry = register_commands(
+        updater,
+        authorized_users,
+        container_caches,
+        executor,
+        plugin_dirs,
+        state_file
+    )
+    if state_file is not None:
+        state_start = time.monotonic()
+        state_file.load()
+        state_file.start()
+        STARTUP_DURATIONS["state"] = time.monotonic() - state_start
+    if alert_chats:
+        alerts = AlertManager(
+            updater.bot,
+            alert_chats,
+            len(container_caches) > 1
+        )
+        alerts.start()
+        for container_cache in container_caches:
+            container_cache.add_listener(alerts.push)
+
+    if webhook_url is None or \
+            not start_webhook(updater, webhook_url, webhook_listen,
+                              webhook_secret):
+        updater.start_polling()
+    STARTUP_DURATIONS["telegram"] = time.monotonic() - start
+    logging.info("Started bot %s", updater.bot.id)
+    report_startup(registry)
+    updater.idle()
+    if state_file is not None:
+        state_file.stop()
+
+
+def register_commands(updater: Updater,
+                      authorized_users: List[int],
+                      container_caches: List[ContainerCache],
+                      executor: CommandExecutor,
+                      plugin_dirs: Sequence[str] = (),
+                      state_file: Optional[StateFile] = None
+                      ) -> CommandRegistry:
+    """Registers the handlers of the bot, and the commands discovered in the
+    directory of this module and in ``plugin_dirs``. Command modules are
+    imported on first use, and can be reloaded with the returned registry,
+    see :py:mod:`telecom.registry`.
+
+    Commands are called on ``executor``.
     """
-    updater = Updater(token=token, use_context=True)
     dispatcher = updater.dispatcher
 
     dispatcher.add_error_handler(error_callback)
     dispatcher.add_handler(CallbackQueryHandler(inline_query_handler))
+    reply_filters = Filters.reply & Filters.text & ~Filters.command
+    if authorized_users:
+        reply_filters &= Filters.user(authorized_users)
+    dispatcher.add_handler(MessageHandler(reply_filters, reply_query_handler))
 
     register_help_command(dispatcher)
 
-    register_command(
-        dispatcher,
-        "hi",
-        cmd_hi.Hi,
-        authorized_users=authorized_users
-    )
-    register_command(
-        dispatcher,
-        "info",
-        cmd_info.Info,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
-    )
-    register_command(
-        dispatcher,
-        "logs",
-        cmd_logs.Logs,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
-    )
-    register_command(
-        dispatcher,
-        "pause",
-        cmd_pause.Pause,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
-    )
-    register_command(
+    start = time.monotonic()
+    registry = CommandRegistry(
         dispatcher,
-        "restart",
-        cmd_restart.Restart,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
+        [os.path.dirname(os.path.abspath(__file__))] + list(plugin_dirs)
     )
-    register_command(
-        dispatcher,
-        "restart_bot",
-        cmd_restart_bot.RestartBot,
+    registry.register(
         authorized_users=authorized_users,
         defaults={
+            "command_registry": registry,
+            "container_caches": container_caches,
+            "state_file": state_file,
             "telegram_updater": updater
-        }
+        },
+        executor=executor
     )
-    register_command(
-        dispatcher,
-        "start",
-        cmd_start.Start,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
+    STARTUP_DURATIONS["discovery"] = time.monotonic() - start
+    return registry
+
+
+def report_startup(registry: CommandRegistry) -> None:
+    """Logs the durations of the startup phases, and exposes them and the
+    import durations of the commands as metrics.
+    """
+    logging.info(
+        "Started in %s; %d commands registered, to be imported on first use",
+        ", ".join([
+            f'{phase} {duration:.3f} s'
+            for phase, duration in STARTUP_DURATIONS.items()
+        ]),
+        len(registry.specs)
     )
-    register_command(
-        dispatcher,
-        "stop",
-        cmd_stop.Stop,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
+    Command.METRICS.gauge(
+        "dockerbot_startup_seconds",
+        "Duration of the startup phases; imports is the CPU time spent "
+        "before main() was called",
+        lambda: {
+            (phase,): duration
+            for phase, duration in STARTUP_DURATIONS.items()
+        },
+        ("phase",)
     )
-    register_command(
-        dispatcher,
-        "unpause",
-        cmd_unpause.Unpause,
-        authorized_users=authorized_users,
-        defaults={
-            "docker_client": docker_client
-        }
+    Command.METRICS.gauge(
+        "dockerbot_command_import_seconds",
+        "Duration of the import of the modules of the commands used so far",
+        lambda: {
+            (spec.name,): spec.import_duration
+            for spec in registry.specs
+            if spec.import_duration is not None
+        },
+        ("command",)
     )
 
-    updater.start_polling()
-    logging.info("Started bot %s", updater.bot.id)
-    updater.idle()
+
+def start_webhook(updater: Updater,
+                  url: str,
+                  listen: str,
+                  secret: str) -> bool:
+    """Starts receiving updates on an embedded HTTP server.
+
+    The server listens on ``listen`` (of the form ``HOST:PORT``) and receives
+    updates at path ``/SECRET``. TLS is expected to be terminated by a reverse
+    proxy, which forwards ``URL/SECRET`` to the server. Returns ``False`` if
+    the address cannot be bound or if the webhook cannot be set, in which case
+    nothing is started.
+    """
+    host, _, port = listen.rpartition(":")
+    try:
+        with socket.socket() as probe:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            probe.bind((host, int(port)))
+        updater.bot.set_webhook(url=f'{url.rstrip("/")}/{secret}')
+    except (OSError, TelegramError, ValueError) as error:
+        logging.error("Could not start webhook, falling back to polling: %s",
+                      str(error))
+        return False
+    updater.start_webhook(listen=host, port=int(port), url_path=secret)
+    logging.info("Listening for webhook updates on %s", listen)
+    return True
 
 
 def main():
     """Main function.
     """
+    STARTUP_DURATIONS["imports"] = time.process_time()
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--alert-chat",
+        action="append",
+        default=[],
+        dest="alert_chats",
+        help="Send alerts to this chat when a container crashes, runs out of "
+             "memory, becomes unhealthy or restarts in a loop; reuse this "
+             "option to add more chats (default: no alerts)",
+        metavar="CHATID",
+        type=int)
     parser.add_argument(
         "-a", "--authorized-user",
         action="append",
@@ -191,24 +325,201 @@ def main():
              "authorized users",
         metavar="USERID",
         type=int)
+    parser.add_argument(
+        "--docker-breaker-cooldown",
+        default=DockerTransport.BREAKER_COOLDOWN,
+        dest="docker_breaker_cooldown",
+        help="Time during which docker commands fail fast once a docker host "
+             "failed repeatedly, in seconds (default: %(default)s)",
+        metavar="SECONDS",
+        type=float)
+    parser.add_argument(
+        "--docker-breaker-threshold",
+        default=DockerTransport.BREAKER_THRESHOLD,
+        dest="docker_breaker_threshold",
+        help="Number of consecutive failed requests after which a docker "
+             "host is deemed unavailable (default: %(default)s)",
+        metavar="N",
+        type=int)
+    parser.add_argument(
+        "--docker-pool-size",
+        default=DockerTransport.POOL_SIZE,
+        dest="docker_pool_size",
+        help="Maximum number of connections to each docker host "
+             "(default: %(default)s)",
+        metavar="N",
+        type=int)
+    parser.add_argument(
+        "--docker-read-timeout",
+        default=DockerTransport.READ_TIMEOUT,
+        dest="docker_read_timeout",
+        help="Timeout of docker reads, e.g. listing or inspecting "
+             "containers, in seconds (default: %(default)s)",
+        metavar="SECONDS",
+        type=float)
+    parser.add_argument(
+        "--docker-retries",
+        default=DockerTransport.RETRIES,
+        dest="docker_retries",
+        help="Maximum number of retries of a failed docker read "
+             "(default: %(default)s)",
+        metavar="N",
+        type=int)
+    parser.add_argument(
+        "--docker-write-timeout",
+        default=DockerTransport.WRITE_TIMEOUT,
+        dest="docker_write_timeout",
+        help="Timeout of other docker requests, e.g. starting containers, in "
+             "seconds; stopping containers is given 10 more seconds "
+             "(default: %(default)s)",
+        metavar="SECONDS",
+        type=float)
+    parser.add_argument(
+        "--max-document-size",
+        default=Command.MAX_DOCUMENT_SIZE,
+        dest="max_document_size",
+        help="Size at which documents sent by the bot, e.g. log exports, "
+             "are cut, in bytes before compression (default: %(default)s)",
+        metavar="BYTES",
+        type=int)
+    parser.add_argument(
+        "--max-reply-chunks",
+        default=Command.MAX_REPLY_CHUNKS,
+        dest="max_reply_chunks",
+        help="Maximum number of messages a long reply is split into; longer "
+             "replies are sent as a compressed file (default: %(default)s)",
+        metavar="N",
+        type=int)
+    parser.add_argument(
+        "--metrics-listen",
+        default=None,
+        dest="metrics_listen",
+        help="Serve metrics in the Prometheus format at "
+             "http://HOST:PORT/metrics (default: not served)",
+        metavar="HOST:PORT")
+    parser.add_argument(
+        "-p", "--plugin-dir",
+        action="append",
+        default=[],
+        dest="plugin_dirs",
+        help="Directory containing additional cmd_*.py command modules; "
+             "reuse this option to add more directories",
+        metavar="DIR")
+    parser.add_argument(
+        "-q", "--queue-size",
+        default=16,
+        dest="queue_size",
+        help="Maximum number of docker commands waiting for a worker",
+        metavar="N",
+        type=int)
     parser.add_argument(
         "-s", "--server",
-        default="unix:///var/run/docker.sock",
-        dest="server",
-        help="URL to the docker server",
+        action="append",
+        default=[],
+        dest="servers",
+        help="URL to a docker server, optionally prefixed by a host name; "
+             "reuse this option to add more servers (default: "
+             "unix:///var/run/docker.sock)",
+        metavar="[NAME=]URL")
+    parser.add_argument(
+        "--state-file",
+        default=None,
+        dest="state_file",
+        help="Save the pending commands to this file on shutdown and "
+             "periodically, and restore them on startup, so that inline "
+             "keyboards survive restarts (default: not saved)",
+        metavar="PATH")
+    parser.add_argument(
+        "--state-interval",
+        default=60.0,
+        dest="state_interval",
+        help="Time between two saves of the state file, in seconds",
+        metavar="SECONDS",
+        type=float)
+    parser.add_argument(
+        "--telegram-api-url",
+        default=None,
+        dest="api_url",
+        help="Base URL of the telegram bot API, e.g. "
+             "https://api.telegram.org/bot",
         metavar="URL")
+    parser.add_argument(
+        "--telegram-workers",
+        default=4,
+        dest="telegram_workers",
+        help="Number of telegram update worker threads",
+        metavar="N",
+        type=int)
     parser.add_argument(
         "-t", "--token",
         dest="token",
         help="Telegram bot token",
         metavar="TOKEN")
+    parser.add_argument(
+        "--webhook",
+        default=None,
+        dest="webhook_url",
+        help="Receive updates through a webhook at this public URL instead of "
+             "polling",
+        metavar="URL")
+    parser.add_argument(
+        "--webhook-listen",
+        default="0.0.0.0:8443",
+        dest="webhook_listen",
+        help="Address the webhook server listens on (default: 0.0.0.0:8443)",
+        metavar="HOST:PORT")
+    parser.add_argument(
+        "--webhook-secret",
+        default=secrets.token_urlsafe(24),
+        dest="webhook_secret",
+        help="Secret path of the webhook (default: random)",
+        metavar="SECRET")
+    parser.add_argument(
+        "-w", "--workers",
+        default=4,
+        dest="workers",
+        help="Number of threads executing docker commands",
+        metavar="N",
+        type=int)
     arguments = parser.parse_args()
 
     if not arguments.authorized_users:
         logging.warning("No authorized user set! Use the -a flag")
 
-    docker_client = init_docker(arguments.server)
-    init_telegram(arguments.token, arguments.authorized_users, docker_client)
+    DockerTransport.BREAKER_COOLDOWN = arguments.docker_breaker_cooldown
+    DockerTransport.BREAKER_THRESHOLD = arguments.docker_breaker_threshold
+    DockerTransport.POOL_SIZE = arguments.docker_pool_size
+    DockerTransport.READ_TIMEOUT = arguments.docker_read_timeout
+    DockerTransport.RETRIES = arguments.docker_retries
+    DockerTransport.WRITE_TIMEOUT = arguments.docker_write_timeout
+    Command.MAX_DOCUMENT_SIZE = arguments.max_document_size
+    Command.MAX_REPLY_CHUNKS = arguments.max_reply_chunks
+    add_metrics_hooks()
+    if arguments.metrics_listen:
+        host, _, port = arguments.metrics_listen.rpartition(":")
+        Command.METRICS.serve(host, int(port))
+        logging.info("Serving metrics on %s", arguments.metrics_listen)
+    start = time.monotonic()
+    container_caches = init_docker(
+        arguments.servers or ["unix:///var/run/docker.sock"]
+    )
+    STARTUP_DURATIONS["docker"] = time.monotonic() - start
+    executor = CommandExecutor(arguments.workers, arguments.queue_size)
+    init_telegram(
+        arguments.token,
+        arguments.authorized_users,
+        container_caches,
+        executor,
+        api_url=arguments.api_url,
+        webhook_url=arguments.webhook_url,
+        webhook_listen=arguments.webhook_listen,
+        webhook_secret=arguments.webhook_secret,
+        workers=arguments.telegram_workers,
+        plugin_dirs=arguments.plugin_dirs,
+        state_file=StateFile(arguments.state_file, arguments.state_interval)
+        if arguments.state_file else None,
+        alert_chats=arguments.alert_chats
+    )
 
 
 if __name__ == "__main__":
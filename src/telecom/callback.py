@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Compact encoding of the callback data of inline keyboard buttons.
+
+Telegram limits the callback data of a button to 64 bytes. Instead of encoding
+the pending command, argument name and argument value of a button in its
+callback data, a short opaque token is used, and the triple is kept in a
+server-side table. See :py:attr:`telecom.command.Command.CALLBACK_TOKENS`.
+"""
+
+from collections import (
+    OrderedDict
+)
+import random
+from threading import (
+    Lock
+)
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Tuple
+)
+
+
+CallbackEntry = Tuple[str, str, str]
+"""A pending command index, an argument name, and an argument value."""
+
+
+class CallbackTokenTable:
+    """A bounded table that maps callback tokens to callback entries.
+
+    Tokens are base 36 representations of a counter, prefixed by a random
+    epoch so that tokens of a previous process are not mistaken for new ones.
+    They are thus a few bytes long whatever the entry. The same entry always
+    gets the same token while it is in the table. When the table holds more
+    than :py:attr:`telecom.callback.CallbackTokenTable.MAX_SIZE` entries, the
+    least recently used one is evicted, and its buttons become inert.
+    """
+
+    MAX_SIZE: int = 10000
+    """Maximum number of entries."""
+
+    _counter: int
+    """Counter from which tokens are derived."""
+
+    _entries: 'OrderedDict[str, CallbackEntry]'
+    """Dict that maps a token to its entry, least recently used first."""
+
+    _epoch: str
+    """Prefix of the tokens."""
+
+    _lock: Lock
+    """Lock protecting the table."""
+
+    _tokens: Dict[CallbackEntry, str]
+    """Dict that maps an entry to its token."""
+
+    def __init__(self):
+        self._counter = 0
+        self._entries = OrderedDict()
+        self._epoch = _base36(random.getrandbits(20)) + "."
+        self._lock = Lock()
+        self._tokens = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def resolve(self, token: str) -> Optional[CallbackEntry]:
+        """Returns the entry of a token, or ``None`` if it is unknown or was
+        evicted.
+        """
+        with self._lock:
+            entry = self._entries.get(token, None)
+            if entry is not None:
+                self._entries.move_to_end(token)
+            return entry
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Restores the entries, epoch and counter of a snapshot returned by
+        :py:meth:`telecom.callback.CallbackTokenTable.snapshot`, so that the
+        buttons sent by a previous process keep working.
+        """
+        with self._lock:
+            self._counter = int(snapshot["counter"])
+            self._entries = OrderedDict(
+                (token, (pending_idx, arg_name, arg_value))
+                for token, pending_idx, arg_name, arg_value
+                in snapshot["entries"]
+            )
+            self._epoch = str(snapshot["epoch"])
+            self._tokens = {
+                entry: token for token, entry in self._entries.items()
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the entries, epoch and counter of the table as a JSON
+        serializable dict.
+        """
+        with self._lock:
+            return {
+                "counter": self._counter,
+                "entries": [
+                    [token, *entry] for token, entry in self._entries.items()
+                ],
+                "epoch": self._epoch
+            }
+
+    def token(self,
+              pending_idx: str,
+              arg_name: str,
+              arg_value: str) -> str:
+        """Returns the token of an entry, creating it if needed.
+        """
+        entry = (pending_idx, arg_name, arg_value)
+        with self._lock:
+            token = self._tokens.get(entry, None)
+            if token is not None:
+                self._entries.move_to_end(token)
+                return token
+            self._counter += 1
+            token = self._epoch + _base36(self._counter)
+            self._entries[token] = entry
+            self._tokens[entry] = token
+            while len(self._entries) > CallbackTokenTable.MAX_SIZE:
+                _, evicted = self._entries.popitem(last=False)
+                self._tokens.pop(evicted, None)
+            return token
+
+
+def _base36(number: int) -> str:
+    """Returns the base 36 representation of a positive integer.
+    """
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while number:
+        number, digit = divmod(number, 36)
+        result = digits[digit] + result
+    return result or "0"
@@ -4,6 +4,7 @@
 
 from typing import (
     Dict,
+    Hashable,
     Optional,
     Sequence,
     Tuple,
@@ -28,6 +29,9 @@ class CommandSelector(ArgumentSelector):
             for command_name in Help.HELP_DICT
         ]
 
+    def option_version(self) -> Optional[Hashable]:
+        return tuple(Help.HELP_DICT)
+
 
 class Help(Command):
     """Implentation of builtin command `/help`.
@@ -49,9 +53,17 @@ Displays help message of a command."""
             self.reply_error(f'Command `{command_name}` not found.')
             return
         command_doc = Help.HELP_DICT.get(command_name, None)
+        self.reply(Command.RENDER_CACHE.get(
+            "help",
+            command_name,
+            command_doc,
+            lambda: Help.render(command_name, command_doc)
+        ))
+
+    @staticmethod
+    def render(command_name: str, command_doc: Optional[str]) -> str:
+        """Returns the help message of a command.
+        """
         if command_doc is None:
-            self.reply(f'No help available for command `{command_name}`.')
-        else:
-            self.reply(
-                f'🆘 *Help for command* `{command_name}` 🆘\n{command_doc}'
-            )
+            return f'No help available for command `{command_name}`.'
+        return f'🆘 *Help for command* `{command_name}` 🆘\n{command_doc}'
@@ -15,22 +15,34 @@ from enum import (
     IntEnum
 )
 import functools
+import gzip
 import logging
+import tempfile
+from threading import (
+    Lock
+)
+import time
 from typing import (
     Any,
     Callable,
     Dict,
+    Iterable,
+    List,
     Optional,
     Sequence,
+    Tuple,
     Type
 )
+import weakref
 
 from telegram import (
+    InlineKeyboardMarkup,
     Message,
     ParseMode,
     Update
 )
 from telegram.constants import (
+    MAX_CAPTION_LENGTH,
     MAX_MESSAGE_LENGTH
 )
 from telegram.ext import (
@@ -42,6 +54,29 @@ from telegram.ext.filters import (
     Filters
 )
 
+from telecom.callback import (
+    CallbackTokenTable
+)
+from telecom.executor import (
+    CommandExecutor
+)
+from telecom.hooks import (
+    Hook,
+    HookPipeline
+)
+from telecom.metrics import (
+    MetricRegistry
+)
+from telecom.outbox import (
+    Outbox
+)
+from telecom.pending import (
+    PendingCommandStore,
+    SavedCommand
+)
+from telecom.render import (
+    RenderCache
+)
 from telecom.selector import (
     ArgumentSelector
 )
@@ -92,43 +127,124 @@ class Command:
         ON_RAISED_EXCEPTION = auto()
 
 
+    BLOCKING: bool = False
+    """Wether this command waits on slow services, e.g. docker daemons, in
+    which case it is called on the executor it is registered with rather
+    than in the telegram dispatcher thread. See
+    :py:meth:`telecom.command.register_command`."""
+
+    CALLBACK_TOKENS: CallbackTokenTable = CallbackTokenTable()
+    """Global table of the callback tokens of inline keyboard buttons."""
+
     COMMANDS: Dict[str, Type['Command']] = {}
     """Dictionary that maps a command name to the corresponding class.
 
     See :py:meth:`telecom.command.register_command`.
     """
 
-    PENDING_COMMANDS: Dict[str, 'Command'] = {}
-    """Global dict of pending commands."""
+    FACTORIES: Dict[str, Callable[[], 'Command']] = {}
+    """Dictionary that maps a command name to a function creating an instance
+    with the default arguments and executor it is registered with. It is used
+    to restore pending commands, see :py:meth:`telecom.command.restore`.
+    """
+
+    DOCUMENT_SPOOL_SIZE: int = 1024 * 1024
+    """Size (in bytes) above which a compressed document is spooled to disk
+    rather than held in memory, see
+    :py:meth:`telecom.command.Command.reply_document`."""
+
+    MAX_DOCUMENT_SIZE: int = 50 * 1024 * 1024
+    """Size (in bytes, uncompressed) at which documents are cut, see
+    :py:meth:`telecom.command.Command.reply_document`."""
+
+    MAX_REPLY_CHUNKS: int = 4
+    """Maximum number of messages a long reply is split into. Longer replies
+    are sent as a compressed document, see
+    :py:meth:`telecom.command.Command.reply`."""
+
+    METRICS: MetricRegistry = MetricRegistry()
+    """Global registry of metrics.
+
+    See :py:meth:`telecom.command.add_metrics_hooks`.
+    """
+
+    OUTBOX: Outbox = Outbox(METRICS)
+    """Global queue of outbound telegram requests."""
+
+    PENDING_COMMANDS: PendingCommandStore = PendingCommandStore()
+    """Global store of pending commands."""
 
     PENDING_COMMANDS_COUNTER: int = 0
     """A global counter that is incremented each a new pending command is added
     to :py:attr:`telecom.command.Command.PENDING_COMMANDS`."""
 
-    GLOBAL_HOOKS: Dict[HookType, Sequence[Callable[['Command'], None]]] = {}
-    """A global dict containing all hooks."""
+    PENDING_COMMANDS_LOCK: Lock = Lock()
+    """Lock protecting
+    :py:attr:`telecom.command.Command.PENDING_COMMANDS_COUNTER`, which is
+    incremented from several worker threads."""
+
+    RENDER_CACHE: RenderCache = RenderCache(METRICS)
+    """Global cache of rendered replies and keyboards."""
+
+    HOOKS: HookPipeline = HookPipeline(METRICS)
+    """Global pipeline of hooks, see
+    :py:meth:`telecom.command.add_command_hook`."""
 
     __HELP__: Optional[str] = None
     """Help text of that command."""
 
+    __STATE__: Sequence[str] = ()
+    """Names of the class attributes of that command holding state, e.g.
+    caches, thread pools or background threads, that are kept when its
+    module is reloaded, see :py:meth:`telecom.registry.CommandRegistry.reload`.
+    """
+
     _args_dict: Dict[str, Any]
     """Argument dict."""
 
     _context: CallbackContext
     """Telegram callback context."""
 
+    _executor: Optional[CommandExecutor]
+    """Executor this command is called on, or ``None`` if it is called in the
+    telegram dispatcher thread."""
+
     _first_call: bool
     """Wether this is the first time this command instance is called."""
 
+    _keyboard_messages: Dict[int, str]
+    """Dict that maps the id of a message sent by
+    :py:meth:`telecom.command.Command.arg` to the name of the argument its
+    inline keyboard selects."""
+
     _message: Message
     """Either the user message that called this command, or the last message
     the command sent."""
 
+    _name: Optional[str]
+    """Name the command is registered with, if any."""
+
     _pending_idx: Optional[str]
     """Key of this command in
     :py:attr:`telecom.command.Command.PENDING_COMMANDS`, or ``None`` if the
     command is not pending."""
 
+    _running: bool
+    """Wether this command is being called, see
+    :py:meth:`telecom.command.Command.dispatch`."""
+
+    _running_lock: Lock
+    """Lock protecting ``_running`` and ``_waiting``."""
+
+    _selectors: Dict[str, Tuple[ArgumentSelector, str]]
+    """Dict that maps an argument name to the selector of its last inline
+    keyboard and the prefix filter applied to it."""
+
+    _waiting: List[Tuple[Update, CallbackContext, Dict[str, Any],
+                         Dict[str, Any]]]
+    """Calls dispatched while this command was being called, with their
+    arguments and keyword arguments."""
+
     def __call__(self,
                  update: Update,
                  context: CallbackContext,
@@ -162,16 +278,58 @@ class Command:
             self.call_hooks(Command.HookType.ON_RAISED_EXCEPTION)
             raise
         else:
-            if self._pending_idx in Command.PENDING_COMMANDS:
-                Command.PENDING_COMMANDS.pop(self._pending_idx)
+            self.drop_pending()
             self.call_hooks(Command.HookType.ON_FINISHED)
+        finally:
+            self._end_call()
 
     def __init__(self):
         self._args_dict = {}
+        self._executor = None
+        self._keyboard_messages = {}
+        self._name = None
         self._pending_idx = None
+        self._running = False
+        self._running_lock = Lock()
+        self._selectors = {}
+        self._waiting = []
         self._first_call = True
         self.call_hooks(Command.HookType.ON_CREATED)
 
+    def _end_call(self) -> None:
+        """Starts the next waiting call, if any, once a call is over. Waiting
+        calls of a command that is no longer pending, e.g. a second tap on a
+        button that stopped a container, are dropped.
+        """
+        while True:
+            with self._running_lock:
+                if not self._waiting:
+                    self._running = False
+                    return
+                update, context, args, kwargs = self._waiting.pop(0)
+            if self._pending_idx is not None and \
+                    Command.PENDING_COMMANDS.get(self._pending_idx) is self:
+                break
+            logging.debug("Dropped a call of finished command %s",
+                          self._name)
+        self._start_call(update, context, args, kwargs)
+
+    def _start_call(self,
+                    update: Update,
+                    context: CallbackContext,
+                    args: Dict[str, Any],
+                    kwargs: Dict[str, Any]) -> None:
+        """Sets arguments and calls this command, on its executor if it has
+        one.
+        """
+        for arg_name, arg_value in args.items():
+            self.set_arg(arg_name, arg_value)
+        if self._executor is None:
+            self(update, context, **kwargs)
+        elif not self._executor.submit(self, update, context, **kwargs):
+            # Rejected, and reported, by the executor
+            self._end_call()
+
     def arg(self,
             arg_name: str,
             selector: ArgumentSelector,
@@ -187,44 +345,123 @@ class Command:
         """
         if arg_name in self._args_dict:
             return self._args_dict[arg_name]
-        if not self._pending_idx:
-            Command.PENDING_COMMANDS_COUNTER += 1
-            self._pending_idx = str(Command.PENDING_COMMANDS_COUNTER)
-            Command.PENDING_COMMANDS[self._pending_idx] = self
         self.reply(
             text,
-            reply_markup=selector.option_inline_keyboard(
-                f'{self._pending_idx}:{arg_name}'
-            )
+            reply_markup=self.inline_keyboard(arg_name, selector)
         )
+        self._keyboard_messages[self._message.message_id] = arg_name
         raise NotEnoughArguments
 
     def call_hooks(self, hook_type: HookType):
         """Calls all hooks of a given type.
 
         Hooks are called in the order they have been added using
-        :py:meth:`telecom.command.add_command_hook`.
+        :py:meth:`telecom.command.add_command_hook`. Deferred hooks are only
+        queued, see :py:class:`telecom.hooks.HookPipeline`.
         """
-        for hook in Command.GLOBAL_HOOKS.get(hook_type, []):
-            hook(self)
+        Command.HOOKS.call(hook_type, self)
 
     def delete_reply(self):
         """Deletes the last message sent by this command.
+
+        This does not wait for the deletion to be performed.
         """
-        self._context.bot.delete_message(
-            self._message.chat_id,
-            self._message.message_id
+        Command.OUTBOX.delete(
+            self._context.bot.delete_message,
+            chat_id=self._message.chat_id,
+            message_id=self._message.message_id
         )
 
+    def dispatch(self,
+                 update: Update,
+                 context: CallbackContext,
+                 args: Optional[Dict[str, Any]] = None,
+                 **kwargs) -> None:
+        """Calls this command, on its executor if it has one.
+
+        Calls of a command are serialized: if it is already being called,
+        e.g. when a button is tapped twice, the call waits for the running
+        one to be over, and ``args`` are only set then, see
+        :py:meth:`telecom.command.Command.set_arg`. See
+        :py:meth:`telecom.command.register_command`.
+        """
+        with self._running_lock:
+            if self._running:
+                self._waiting.append((update, context, args or {}, kwargs))
+                return
+            self._running = True
+        self._start_call(update, context, args or {}, kwargs)
+
+    def drop_pending(self) -> None:
+        """Removes this command from
+        :py:attr:`telecom.command.Command.PENDING_COMMANDS`, so that the
+        buttons of its inline keyboards become inert.
+        """
+        Command.PENDING_COMMANDS.pop(self._pending_idx)
+
     def edit_reply(self, text: str, **kwargs) -> None:
-        """Edits the last message sent by this command.
+        """Edits the last message sent by this command, which should have
+        been sent by :py:meth:`telecom.command.Command.reply` with
+        ``editable=True``. Texts longer than ``MAX_MESSAGE_LENGTH`` bytes are
+        cut, see :py:func:`telecom.command.cut_message`.
+
+        This does not wait for the edit to be performed, and successive edits
+        may be collapsed, see :py:class:`telecom.outbox.Outbox`.
         """
-        self._message = self._message.edit_text(
+        Command.OUTBOX.edit(
+            self._context.bot.edit_message_text,
+            chat_id=self._message.chat_id,
+            message_id=self._message.message_id,
             parse_mode=ParseMode.MARKDOWN,
-            text=text,
+            text=cut_message(text),
             **kwargs
         )
 
+    def inline_keyboard(self,
+                        arg_name: str,
+                        selector: ArgumentSelector,
+                        page: int = 0,
+                        prefix: str = "") -> InlineKeyboardMarkup:
+        """Creates the inline keyboard of a selector, whose buttons set argument
+        ``arg_name`` of this command. See
+        :py:meth:`telecom.selector.ArgumentSelector.option_inline_keyboard`.
+        Keyboard layouts are cached in
+        :py:attr:`telecom.command.Command.RENDER_CACHE`.
+
+        The command instance is added to
+        :py:attr:`telecom.Command.PENDING_COMMANDS`, or marked as recently
+        used if it is already pending. See
+        :py:meth:`telecom.command.Command.arg`.
+        """
+        if not self._pending_idx:
+            with Command.PENDING_COMMANDS_LOCK:
+                Command.PENDING_COMMANDS_COUNTER += 1
+                self._pending_idx = str(Command.PENDING_COMMANDS_COUNTER)
+        Command.PENDING_COMMANDS.add(
+            self._pending_idx,
+            self,
+            self._message.chat_id
+        )
+        self._selectors[arg_name] = (selector, prefix)
+        pending_idx = self._pending_idx
+        return selector.option_inline_keyboard(
+            lambda code: Command.CALLBACK_TOKENS.token(
+                pending_idx,
+                arg_name,
+                code
+            ),
+            page,
+            prefix,
+            Command.RENDER_CACHE
+        )
+
+    def keyboard_arg(self, message_id: int) -> Optional[str]:
+        """Returns the name of the argument selected by the inline keyboard of
+        a message, if that message was sent by
+        :py:meth:`telecom.command.Command.arg`.
+        """
+        return self._keyboard_messages.get(message_id, None)
+
     def main(self) -> None:
         """Main code of the command.
 
@@ -235,20 +472,91 @@ class Command:
         """
         raise NotImplementedError
 
-    def reply(self, text: str, **kwargs) -> None:
+    def reply(self, text: str, editable: bool = False, **kwargs) -> None:
         """Sends a markdown message through telegram.
+
+        Texts longer than ``MAX_MESSAGE_LENGTH`` bytes are split into several
+        messages on line boundaries, see
+        :py:func:`telecom.command.split_message`, and the keyword arguments
+        only apply to the last one. Texts that would take more than
+        :py:attr:`telecom.command.Command.MAX_REPLY_CHUNKS` messages are sent
+        as a compressed document instead.
+
+        If ``editable`` is ``True``, the text is always sent as a single
+        message, cut if needed, so that
+        :py:meth:`telecom.command.Command.edit_reply` later replaces all of
+        it.
         """
-        text_bytes = text.encode("UTF-8")
-        if len(text_bytes) > MAX_MESSAGE_LENGTH:
-            end = b'\n\n...'
-            text_bytes = text_bytes[:MAX_MESSAGE_LENGTH - len(end)] + end
-        self._message = self._context.bot.send_message(
-            chat_id=self._message.chat_id,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_to_message_id=self._message.message_id,
-            text=text_bytes.decode("UTF-8"),
-            **kwargs
-        )
+        if editable:
+            chunks = [cut_message(text)]
+        elif len(text.encode("UTF-8")) <= MAX_MESSAGE_LENGTH:
+            chunks = [text]
+        else:
+            chunks = split_message(text)
+        if len(chunks) > Command.MAX_REPLY_CHUNKS:
+            self.reply_document(
+                [text.encode("UTF-8")],
+                "reply.txt",
+                text.split("\n", 1)[0],
+                **kwargs
+            )
+            return
+        for idx, chunk in enumerate(chunks):
+            self._message = Command.OUTBOX.send(
+                self._context.bot.send_message,
+                chat_id=self._message.chat_id,
+                parse_mode=ParseMode.MARKDOWN,
+                reply_to_message_id=self._message.message_id,
+                text=chunk,
+                **(kwargs if idx == len(chunks) - 1 else {})
+            ).result()
+
+    def reply_document(self,
+                       chunks: Iterable[bytes],
+                       filename: str,
+                       caption: str = "",
+                       **kwargs) -> None:
+        """Sends data as a gzip compressed document named ``filename.gz``,
+        with a markdown caption.
+
+        The chunks are compressed as they are iterated, e.g. straight from a
+        docker log stream, into a temporary file that is only held in memory
+        while it is smaller than
+        :py:attr:`telecom.command.Command.DOCUMENT_SPOOL_SIZE`. Data beyond
+        :py:attr:`telecom.command.Command.MAX_DOCUMENT_SIZE` bytes is cut, and
+        the caption says so.
+        """
+        size = 0
+        with tempfile.SpooledTemporaryFile(
+                max_size=Command.DOCUMENT_SPOOL_SIZE) as file:
+            with gzip.GzipFile(filename, "wb", fileobj=file) as compressor:
+                for chunk in chunks:
+                    compressor.write(chunk[:Command.MAX_DOCUMENT_SIZE - size])
+                    size += len(chunk)
+                    # Exactly MAX_DOCUMENT_SIZE bytes is not cut, unless more
+                    # data follows
+                    if size > Command.MAX_DOCUMENT_SIZE:
+                        caption += f'\n✂️ Cut at {Command.MAX_DOCUMENT_SIZE} ' \
+                            f'bytes.'
+                        break
+            logging.debug("Compressed %d bytes into %d",
+                          min(size, Command.MAX_DOCUMENT_SIZE), file.tell())
+
+            def send_document(**kwargs):
+                # The file is read again if the request is retried
+                file.seek(0)
+                return self._context.bot.send_document(**kwargs)
+
+            self._message = Command.OUTBOX.send(
+                send_document,
+                caption=caption[:MAX_CAPTION_LENGTH],
+                chat_id=self._message.chat_id,
+                document=file,
+                filename=filename + ".gz",
+                parse_mode=ParseMode.MARKDOWN,
+                reply_to_message_id=self._message.message_id,
+                **kwargs
+            ).result()
 
     def reply_error(self, text: str) -> None:
         """Reports an error.
@@ -270,16 +578,160 @@ class Command:
         """
         self._args_dict[arg_name] = arg_value
 
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Returns the state of this pending command as a JSON serializable
+        dict, or ``None`` if it cannot be restored. See
+        :py:meth:`telecom.command.restore`.
+
+        Only the arguments that are strings or numbers are kept, i.e. those
+        given by the user, since default arguments are set again on restore.
+        Other attributes, e.g. the selectors of inline keyboards, are lost, so
+        that the pages of a restored inline keyboard cannot be browsed.
+        """
+        if self._name is None or self._first_call:
+            return None
+        message = self._message.to_dict()
+        return {
+            "args": {
+                arg_name: arg_value
+                for arg_name, arg_value in self._args_dict.items()
+                if isinstance(arg_value, (str, int, float))
+            },
+            "keyboards": {
+                str(message_id): arg_name
+                for message_id, arg_name in self._keyboard_messages.items()
+            },
+            "message": {
+                key: message[key]
+                for key in ("chat", "date", "from", "message_id")
+                if key in message
+            },
+            "name": self._name
+        }
+
+    def update_keyboard(self,
+                        arg_name: str,
+                        message_id: int,
+                        page: int = 0,
+                        prefix: Optional[str] = None) -> None:
+        """Replaces the inline keyboard of a message by another page of the
+        selector of an argument. If ``prefix`` is ``None``, the current prefix
+        filter is kept.
+        """
+        if arg_name not in self._selectors:
+            return
+        selector, current_prefix = self._selectors[arg_name]
+        Command.OUTBOX.edit(
+            self._context.bot.edit_message_reply_markup,
+            chat_id=self._message.chat_id,
+            message_id=message_id,
+            reply_markup=self.inline_keyboard(
+                arg_name,
+                selector,
+                page,
+                current_prefix if prefix is None else prefix
+            )
+        )
 
-def add_command_hook(hook_type: Command.HookType,
-                     hook: Callable[[Command], None]) -> None:
-    """Adds a global command hook.
 
-    See :py:attr:`telecom.command.Command.GLOBAL_HOOKS` and
+def add_command_hook(hook_type: Command.HookType,
+                     hook: Callable[[Command], None],
+                     deferred: bool = False,
+                     name: Optional[str] = None) -> None:
+    """Adds a global command hook, called after the hooks of the same type
+    added before.
+
+    A synchronous hook is called in the thread of the command, which waits for
+    it. A ``deferred`` hook is called later on a background thread, and must
+    not expect the command to be in the state it was when the hook was
+    triggered. ``name`` identifies the hook in logs and metrics, and defaults
+    to the qualified name of the function.
+
+    See :py:attr:`telecom.command.Command.HOOKS` and
     :py:meth:`telecom.command.Command.call_hooks`.
     """
-    Command.GLOBAL_HOOKS[hook_type] = [hook] + \
-        list(Command.GLOBAL_HOOKS.get(hook_type, []))
+    Command.HOOKS.add(hook_type, Hook(hook, deferred, name))
+
+
+def add_metrics_hooks() -> None:
+    """Adds global command hooks that record the duration and outcome of
+    each call of a command in :py:attr:`telecom.command.Command.METRICS`, and
+    registers gauges of the pending commands and callback tokens.
+
+    The outcome of a call is either ``finished``, ``pending`` (the command is
+    waiting for an argument), or ``error``.
+    """
+    durations = Command.METRICS.histogram(
+        "dockerbot_command_duration_seconds",
+        "Duration of the calls of commands",
+        ("command", "outcome")
+    )
+    called_at = weakref.WeakKeyDictionary()  # type: Any
+
+    def command_name(command: Command) -> str:
+        for name, command_class in Command.COMMANDS.items():
+            if type(command) is command_class:
+                return name
+        return type(command).__name__.lower()
+
+    def on_called(command: Command) -> None:
+        called_at[command] = time.monotonic()
+
+    def on_returned(outcome: str) -> Callable[[Command], None]:
+        def hook(command: Command) -> None:
+            start = called_at.pop(command, None)
+            if start is not None:
+                durations.observe(
+                    time.monotonic() - start,
+                    command=command_name(command),
+                    outcome=outcome
+                )
+        return hook
+
+    add_command_hook(Command.HookType.ON_CALLED_FOR_THE_FIRST_TIME,
+                     on_called, name="metrics.called")
+    add_command_hook(Command.HookType.ON_CALLED_NOT_FOR_THE_FIRST_TIME,
+                     on_called, name="metrics.called")
+    add_command_hook(Command.HookType.ON_FINISHED, on_returned("finished"),
+                     name="metrics.finished")
+    add_command_hook(Command.HookType.ON_NOT_ENOUGH_ARGUMENTS,
+                     on_returned("pending"), name="metrics.pending")
+    add_command_hook(Command.HookType.ON_RAISED_EXCEPTION,
+                     on_returned("error"), name="metrics.error")
+
+    Command.METRICS.gauge(
+        "dockerbot_callback_tokens",
+        "Number of callback tokens of inline keyboard buttons",
+        lambda: {(): len(Command.CALLBACK_TOKENS)}
+    )
+    Command.METRICS.gauge(
+        "dockerbot_pending_commands",
+        "Number of pending commands",
+        lambda: {(): len(Command.PENDING_COMMANDS)}
+    )
+    Command.METRICS.gauge(
+        "dockerbot_pending_command_events_total",
+        "Lookups, expirations and evictions of pending commands",
+        lambda: {
+            (event,): value
+            for event, value in Command.PENDING_COMMANDS.stats().items()
+            if event != "size"
+        },
+        ("event",),
+        "counter"
+    )
+
+
+def cut_message(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> str:
+    """Returns a markdown text if it is at most ``max_length`` bytes long,
+    otherwise its first lines that fit, followed by a mark, see
+    :py:func:`telecom.command.split_message`.
+    """
+    if len(text.encode("UTF-8")) <= max_length:
+        return text
+    mark = "\n✂️ ..."
+    return split_message(text, max_length - len(mark.encode("UTF-8")))[0] + \
+        mark
 
 
 def inline_query_handler(update: Update, context: CallbackContext) -> None:
@@ -291,16 +743,56 @@ def inline_query_handler(update: Update, context: CallbackContext) -> None:
         dispatcher = updater.dispatcher
         dispatcher.add_handler(CallbackQueryHandler(inline_query_handler))
     """
-    data = update.callback_query.data.split(":")
-    logging.debug("Received callback query %s", str(data))
-    call_idx = data[0]
-    arg_name = data[1]
-    arg_value = data[2]
-    if call_idx in Command.PENDING_COMMANDS:
-        Command.PENDING_COMMANDS[call_idx].set_arg(arg_name, arg_value)
-        Command.PENDING_COMMANDS[call_idx](update, context)
+    entry = Command.CALLBACK_TOKENS.resolve(update.callback_query.data)
+    logging.debug("Received callback query %s", str(entry))
+    call_idx, arg_name, arg_value = \
+        entry if entry is not None else ("", "", "")
+    command = restore(call_idx, context)
+    is_page = arg_value.startswith(ArgumentSelector.PAGE_CODE)
+    if command is not None and is_page:
+        update.callback_query.answer()
+        command.update_keyboard(
+            arg_name,
+            update.callback_query.message.message_id,
+            int(arg_value[len(ArgumentSelector.PAGE_CODE):])
+        )
+    elif command is not None:
+        update.callback_query.answer()
+        command.dispatch(update, context, {arg_name: arg_value})
     else:
-        logging.error("Bad call index %s", call_idx)
+        logging.info("Expired call index %s", call_idx)
+        update.callback_query.answer(
+            text="⌛️ This keyboard has expired, please issue the command "
+                 "again."
+        )
+        update.callback_query.edit_message_reply_markup(reply_markup=None)
+
+
+def reply_query_handler(update: Update, context: CallbackContext) -> None:
+    """Global handler of text replies to inline keyboards.
+
+    The text of the reply is used as a prefix filter on the options of the
+    inline keyboard, see :py:meth:`telecom.command.Command.update_keyboard`.
+    Register it to a telegram dispatcher as such::
+
+        dispatcher.add_handler(MessageHandler(
+            Filters.reply & Filters.text & ~Filters.command,
+            reply_query_handler
+        ))
+    """
+    message = update.message
+    replied_id = message.reply_to_message.message_id
+    for command in Command.PENDING_COMMANDS.chat_commands(message.chat_id):
+        arg_name = command.keyboard_arg(replied_id)
+        if arg_name is not None and isinstance(command, SavedCommand):
+            command = restore(command.pending_idx, context)
+        if arg_name is not None and command is not None:
+            command.update_keyboard(
+                arg_name,
+                replied_id,
+                prefix=message.text.strip()
+            )
+            return
 
 
 def register_command(dispatcher: Dispatcher,
@@ -321,31 +813,71 @@ def register_command(dispatcher: Dispatcher,
         authorized_users : List[int]
             List of users authorized to call this command; if none provided, all
             users are authorized
+        executor : telecom.executor.CommandExecutor
+            Executor the instances of that command are called on, if it is
+            :py:attr:`telecom.command.Command.BLOCKING`; otherwise, or if none
+            provided, they are called in the telegram dispatcher thread
+    """
+    Command.COMMANDS[command_name] = command_class
+    register_lazy_command(
+        dispatcher,
+        command_name,
+        lambda: command_class,
+        command_class.__HELP__,
+        **kwargs
+    )
+
+
+def register_lazy_command(dispatcher: Dispatcher,
+                          command_name: str,
+                          load: Callable[[], Type[Command]],
+                          help_text: Optional[str],
+                          **kwargs) -> CommandHandler:
+    """Registers a new command whose class is only obtained, by calling
+    ``load``, when the command is first issued. This allows the module
+    implementing the command to be imported on first use, see
+    :py:mod:`telecom.registry`. Returns the handler added to the dispatcher.
+
+    The keyword arguments are those of
+    :py:meth:`telecom.command.register_command`.
     """
     from telecom.cmd_help import Help
 
+    executor = kwargs.get("executor", None)
+    # pylint: disable=protected-access
+
     def factory(*args, **kwargs):
-        cmd = command_class()
-        cmd(*args, **kwargs)
+        cmd = load()()
+        cmd._executor = executor if cmd.BLOCKING else None
+        cmd._name = command_name
+        cmd.dispatch(*args, **kwargs)
+
+    def create() -> Command:
+        cmd = load()()
+        cmd._args_dict.update(kwargs.get("defaults", {}))
+        cmd._executor = executor if cmd.BLOCKING else None
+        cmd._name = command_name
+        return cmd
+
+    Command.FACTORIES[command_name] = create
 
     logging.debug("Registering command %s", command_name)
 
-    Command.COMMANDS[command_name] = command_class
-    Help.HELP_DICT[command_name] = command_class.__HELP__
+    Help.HELP_DICT[command_name] = help_text
 
     authorized_users = kwargs.get("authorized_users", [])
     command_filters = Filters.command
     if authorized_users:
         command_filters &= Filters.user(authorized_users)
 
-    dispatcher.add_handler(
-        CommandHandler(
-            command_name,
-            functools.partial(factory, **(kwargs.get("defaults", {}))),
-            pass_args=True,
-            filters=command_filters
-        )
+    handler = CommandHandler(
+        command_name,
+        functools.partial(factory, **(kwargs.get("defaults", {}))),
+        pass_args=True,
+        filters=command_filters
     )
+    dispatcher.add_handler(handler)
+    return handler
 
 
 def register_help_command(dispatcher: Dispatcher) -> None:
@@ -356,3 +888,75 @@ def register_help_command(dispatcher: Dispatcher) -> None:
     from telecom.cmd_help import Help
 
     register_command(dispatcher, "help", Help)
+
+
+def restore(pending_idx: str,
+            context: CallbackContext) -> Optional[Command]:
+    """Returns a pending command and marks it as recently used, or returns
+    ``None`` if it does not exist or has expired.
+
+    A command restored from a snapshot, see
+    :py:class:`telecom.state.StateFile`, is instantiated on first use, and
+    replaces its
+    :py:class:`telecom.pending.SavedCommand` in
+    :py:attr:`telecom.command.Command.PENDING_COMMANDS`.
+    """
+    # pylint: disable=protected-access
+    command = Command.PENDING_COMMANDS.get(pending_idx)
+    if not isinstance(command, SavedCommand):
+        return command
+    if command.name not in Command.FACTORIES:
+        logging.info("Cannot restore pending command %s: unknown command %s",
+                     pending_idx, command.name)
+        Command.PENDING_COMMANDS.pop(pending_idx)
+        return None
+    restored = Command.FACTORIES[command.name]()
+    restored._args_dict.update(command.state.get("args", {}))
+    restored._context = context
+    restored._first_call = False
+    restored._keyboard_messages = dict(command.keyboards)
+    restored._message = Message.de_json(command.state["message"], context.bot)
+    restored._pending_idx = pending_idx
+    Command.PENDING_COMMANDS.replace(pending_idx, restored)
+    logging.debug("Restored pending command %s", pending_idx)
+    return restored
+
+
+def split_message(text: str,
+                  max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Splits a markdown text into chunks of at most ``max_length`` bytes, on
+    line boundaries. Longer lines are wrapped over several chunks, without
+    cutting a UTF-8 sequence.
+
+    A code block spanning several chunks is closed at the end of a chunk and
+    reopened at the start of the next one, so that each chunk is valid
+    markdown.
+    """
+    fence = "```"
+    limit = max_length - len(fence) - 1
+    chunks = []  # type: List[str]
+    lines = []  # type: List[str]
+    size = -1
+    in_code_block = False
+    for line in text.split("\n"):
+        data = line.encode("UTF-8")
+        while len(data) > limit - size - 1:
+            # Lines that fit in an empty chunk are not wrapped, others fill
+            # the current chunk
+            cut = limit - size - 1
+            if len(data) > limit - len(fence) - 1:
+                while cut > 0 and data[cut] & 0xC0 == 0x80:
+                    # Continuation byte of a UTF-8 sequence
+                    cut -= 1
+                if cut > 0:
+                    lines.append(data[:cut].decode("UTF-8"))
+                    data = data[cut:]
+            chunks.append("\n".join(lines + [fence] * in_code_block))
+            lines = [fence] * in_code_block
+            size = len(fence) if in_code_block else -1
+        lines.append(data.decode("UTF-8"))
+        size += len(data) + 1
+        if line.startswith(fence):
+            in_code_block = not in_code_block
+    chunks.append("\n".join(lines))
+    return chunks
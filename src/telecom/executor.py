@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Execution of commands outside of the telegram dispatcher thread.
+
+See :py:meth:`telecom.command.register_command`.
+"""
+
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor
+)
+import contextlib
+import logging
+from threading import (
+    Lock
+)
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterator,
+    List
+)
+
+from telegram import (
+    ParseMode,
+    Update
+)
+from telegram.ext import (
+    CallbackContext
+)
+
+
+class CommandExecutor:
+    """A pool of worker threads that executes commands.
+
+    At most :py:attr:`telecom.executor.CommandExecutor.max_workers` commands
+    run at the same time. When all workers are busy, up to
+    :py:attr:`telecom.executor.CommandExecutor.max_queued` further commands
+    are queued, and the user is told so; beyond that, commands are rejected.
+
+    Exceptions raised by commands are forwarded to the error handlers of the
+    telegram dispatcher.
+    """
+
+    max_queued: int
+    """Maximum number of commands waiting for a worker."""
+
+    max_workers: int
+    """Number of worker threads."""
+
+    _executor: ThreadPoolExecutor
+    """Underlying thread pool."""
+
+    _lock: Lock
+    """Lock protecting ``_submitted``."""
+
+    _submitted: int
+    """Number of commands submitted and not yet finished."""
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 16):
+        self.max_queued = max_queued
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="command"
+        )
+        self._lock = Lock()
+        self._submitted = 0
+
+    def _done(self, future: Future) -> None:
+        """Callback invoked when a command finishes.
+        """
+        # pylint: disable=unused-argument
+        with self._lock:
+            self._submitted -= 1
+
+    def submit(self,
+               command: Any,
+               update: Update,
+               context: CallbackContext,
+               **kwargs) -> bool:
+        """Submits a call to a command. Returns ``False`` if the call was
+        rejected because the queue is full.
+
+        See :py:meth:`telecom.command.Command.__call__`.
+        """
+
+        def target():
+            try:
+                command(update, context, **kwargs)
+            except Exception as error:  # pylint: disable=broad-except
+                context.dispatcher.dispatch_error(update, error)
+
+        with self._lock:
+            waiting = self._submitted - self.max_workers
+            if waiting >= self.max_queued:
+                logging.warning("Command queue full, rejecting command")
+                self._notify(
+                    update,
+                    "⚠️ Too many commands are running, please try again "
+                    "later."
+                )
+                return False
+            self._submitted += 1
+        if waiting >= 0:
+            self._notify(
+                update,
+                f'⏳ All workers are busy, command queued in position '
+                f'{waiting + 1}.'
+            )
+        self._executor.submit(target).add_done_callback(self._done)
+        return True
+
+    @staticmethod
+    def _notify(update: Update, text: str) -> None:
+        """Replies to the message that triggered an update.
+        """
+        if update.effective_message is not None:
+            update.effective_message.reply_text(
+                text,
+                parse_mode=ParseMode.MARKDOWN
+            )
+
+
+class KeyedLock:
+    """A collection of locks indexed by keys, e.g. container ids.
+
+    Locks are created on demand and discarded once no thread holds or waits
+    for them, so the collection does not grow with the number of keys ever
+    used.
+    """
+
+    _lock: Lock
+    """Lock protecting ``_locks``."""
+
+    _locks: Dict[Hashable, List[Any]]
+    """Dict that maps a key to its lock and the number of threads holding or
+    waiting for it."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._locks = {}
+
+    @contextlib.contextmanager
+    def lock(self, key: Hashable) -> Iterator[None]:
+        """Context manager that holds the lock of a key.
+        """
+        with self._lock:
+            entry = self._locks.setdefault(key, [Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Hooks of commands, run synchronously or deferred to a background thread.
+
+A hook is a function called with a command instance at certain points of its
+execution, see :py:class:`telecom.command.Command.HookType` and
+:py:meth:`telecom.command.add_command_hook`. Synchronous hooks run in the
+thread of the command, before it resumes; they should be quick, e.g. taking a
+timestamp. Deferred hooks, e.g. audit logging, run later on a background
+thread so that they do not delay the command, and see the command as it is
+when they run.
+
+Every hook is timed, and an exception raised by a hook is logged without
+affecting the command or the other hooks.
+"""
+
+import logging
+import queue
+from threading import (
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple
+)
+
+from telecom.metrics import (
+    Counter,
+    Histogram,
+    MetricRegistry
+)
+
+
+class Hook:
+    """A hook function, and how it is run.
+    """
+
+    deferred: bool
+    """Wether the hook runs on the background thread of its pipeline."""
+
+    function: Callable[[Any], None]
+    """Function called with the command instance."""
+
+    name: str
+    """Name of the hook, used in logs and metrics."""
+
+    def __init__(self,
+                 function: Callable[[Any], None],
+                 deferred: bool = False,
+                 name: Optional[str] = None):
+        self.deferred = deferred
+        self.function = function
+        self.name = name or \
+            f'{function.__module__}.{getattr(function, "__qualname__", "")}'
+
+
+class HookPipeline:
+    """The hooks of each hook type, in the order they were added.
+
+    Deferred hooks are queued, in order, for a single background thread. At
+    most :py:attr:`telecom.hooks.HookPipeline.MAX_QUEUED` calls are queued;
+    beyond that, calls of deferred hooks are dropped and counted rather than
+    slowing down commands.
+    """
+
+    MAX_QUEUED: int = 1000
+    """Maximum number of calls of deferred hooks waiting to run."""
+
+    _dropped: Optional[Counter]
+    """Number of dropped calls, by hook."""
+
+    _durations: Optional[Histogram]
+    """Durations of the calls, by hook and mode."""
+
+    _errors: Optional[Counter]
+    """Number of calls that raised an exception, by hook."""
+
+    _hooks: Dict[Hashable, List[Hook]]
+    """Dict that maps a hook type to its hooks."""
+
+    _lock: Lock
+    """Lock protecting the registration of hooks and the start of the
+    background thread."""
+
+    _queue: 'queue.Queue[Tuple[Hook, Any]]'
+    """Calls of deferred hooks waiting to run."""
+
+    _thread: Optional[Thread]
+    """Background thread, started on first use."""
+
+    def __init__(self, metrics: Optional[MetricRegistry] = None):
+        self._hooks = {}
+        self._lock = Lock()
+        self._queue = queue.Queue(HookPipeline.MAX_QUEUED)
+        self._thread = None
+        self._dropped = self._durations = self._errors = None
+        if metrics is not None:
+            self._dropped = metrics.counter(
+                "dockerbot_command_hook_dropped_total",
+                "Calls of deferred hooks dropped because the queue was full",
+                ("hook",)
+            )
+            self._durations = metrics.histogram(
+                "dockerbot_command_hook_duration_seconds",
+                "Duration of the calls of command hooks",
+                ("hook", "mode")
+            )
+            self._errors = metrics.counter(
+                "dockerbot_command_hook_errors_total",
+                "Calls of command hooks that raised an exception",
+                ("hook",)
+            )
+            metrics.gauge(
+                "dockerbot_command_hooks_queued",
+                "Number of calls of deferred hooks waiting to run",
+                lambda: {(): self._queue.qsize()}
+            )
+
+    def _run(self, hook: Hook, command: Any) -> None:
+        """Calls a hook, timing it and logging its exceptions.
+        """
+        start = time.monotonic()
+        try:
+            hook.function(command)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Hook %s raised an exception", hook.name)
+            if self._errors is not None:
+                self._errors.inc(hook=hook.name)
+        if self._durations is not None:
+            self._durations.observe(
+                time.monotonic() - start,
+                hook=hook.name,
+                mode="deferred" if hook.deferred else "sync"
+            )
+
+    def _work(self) -> None:
+        """Runs the deferred hooks, forever.
+        """
+        while True:
+            hook, command = self._queue.get()
+            self._run(hook, command)
+            self._queue.task_done()
+
+    def add(self, hook_type: Hashable, hook: Hook) -> None:
+        """Adds a hook, run after the hooks of the same type added before.
+        """
+        with self._lock:
+            self._hooks.setdefault(hook_type, []).append(hook)
+
+    def call(self, hook_type: Hashable, command: Any) -> None:
+        """Calls the synchronous hooks of a type, and queues its deferred
+        hooks.
+        """
+        for hook in self._hooks.get(hook_type, ()):
+            if not hook.deferred:
+                self._run(hook, command)
+                continue
+            if self._thread is None:
+                with self._lock:
+                    if self._thread is None:
+                        self._thread = Thread(
+                            target=self._work,
+                            daemon=True,
+                            name="hooks"
+                        )
+                        self._thread.start()
+            try:
+                self._queue.put_nowait((hook, command))
+            except queue.Full:
+                logging.debug("Hook queue full, dropping %s", hook.name)
+                if self._dropped is not None:
+                    self._dropped.inc(hook=hook.name)
+
+    def hooks(self, hook_type: Hashable) -> List[Hook]:
+        """Returns the hooks of a type.
+        """
+        return list(self._hooks.get(hook_type, ()))
+
+    def join(self) -> None:
+        """Waits until all the queued calls of deferred hooks have run.
+        """
+        self._queue.join()
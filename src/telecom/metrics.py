@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""In-process metrics, rendered in the Prometheus text exposition format.
+
+Metrics are registered in :py:attr:`telecom.command.Command.METRICS`. They
+can be served over HTTP, see :py:meth:`telecom.metrics.MetricRegistry.serve`,
+and are displayed by command ``/metrics``.
+"""
+
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer
+)
+import math
+from socketserver import (
+    ThreadingMixIn
+)
+from threading import (
+    Lock,
+    Thread
+)
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+
+LabelValues = Tuple[str, ...]
+"""Values of the labels of a series, in the order of the label names of its
+metric."""
+
+
+class Metric:
+    """An abstract metric, made of one series per combination of label values.
+    """
+
+    TYPE: str = "untyped"
+    """Prometheus metric type."""
+
+    documentation: str
+    """Help text."""
+
+    label_names: Tuple[str, ...]
+    """Names of the labels."""
+
+    name: str
+    """Metric name."""
+
+    _lock: Lock
+    """Lock protecting the series."""
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 label_names: Sequence[str] = ()):
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.name = name
+        self._lock = Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        """Returns the label values of a series given as keyword arguments.
+        """
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f'Metric {self.name} expects labels {self.label_names}, got '
+                f'{tuple(labels)}'
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Returns the samples of the metric, as triples made of a name
+        suffix, labels, and a value.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing value.
+    """
+
+    TYPE = "counter"
+
+    _values: Dict[LabelValues, float]
+    """Dict that maps label values to the value of the series."""
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increments a series.
+        """
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [
+                ("", dict(zip(self.label_names, key)), value)
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(Metric):
+    """A value that is read when the metrics are rendered.
+    """
+
+    TYPE = "gauge"
+
+    _function: Callable[[], Dict[LabelValues, float]]
+    """Function returning the values of the series."""
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 function: Callable[[], Dict[LabelValues, float]],
+                 label_names: Sequence[str] = (),
+                 metric_type: str = "gauge"):
+        super().__init__(name, documentation, label_names)
+        self._function = function
+        self.TYPE = metric_type  # pylint: disable=invalid-name
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            ("", dict(zip(self.label_names, key)), float(value))
+            for key, value in sorted(self._function().items())
+        ]
+
+
+class Histogram(Metric):
+    """A distribution of observed values, e.g. durations, with cumulative
+    buckets.
+    """
+
+    TYPE = "histogram"
+
+    DEFAULT_BUCKETS: Tuple[float, ...] = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+    )
+    """Default upper bounds of the buckets, in seconds."""
+
+    buckets: Tuple[float, ...]
+    """Upper bounds of the buckets, in increasing order."""
+
+    _series: Dict[LabelValues, List[float]]
+    """Dict that maps label values to the counts of each bucket (not
+    cumulated), followed by the count of values above the last bucket and by
+    the sum of the values."""
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Adds a value to a series.
+        """
+        key = self._label_values(labels)
+        idx = len(self.buckets)
+        for bucket_idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                idx = bucket_idx
+                break
+        with self._lock:
+            series = self._series.setdefault(
+                key,
+                [0.0] * (len(self.buckets) + 2)
+            )
+            series[idx] += 1
+            series[-1] += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []  # type: List[Tuple[str, Dict[str, str], float]]
+        with self._lock:
+            series = sorted(
+                (key, list(values)) for key, values in self._series.items()
+            )
+        for key, values in series:
+            labels = dict(zip(self.label_names, key))
+            count = 0.0
+            for bound, bucket_count in zip(self.buckets, values):
+                count += bucket_count
+                samples.append(
+                    ("_bucket", {**labels, "le": _format_value(bound)}, count)
+                )
+            count += values[-2]
+            samples += [
+                ("_bucket", {**labels, "le": "+Inf"}, count),
+                ("_count", labels, count),
+                ("_sum", labels, values[-1])
+            ]
+        return samples
+
+
+class MetricRegistry:
+    """A collection of metrics.
+
+    Metrics are created on first use, e.g. with
+    :py:meth:`telecom.metrics.MetricRegistry.counter`, and created again with
+    the same name they are returned as is.
+    """
+
+    _lock: Lock
+    """Lock protecting ``_metrics``."""
+
+    _metrics: Dict[str, Metric]
+    """Dict that maps a metric name to the metric."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        """Registers a metric, unless a metric with the same name exists, and
+        returns the registered metric.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self,
+                name: str,
+                documentation: str,
+                label_names: Sequence[str] = ()) -> Counter:
+        """Returns a counter.
+        """
+        metric = self._register(Counter(name, documentation, label_names))
+        if not isinstance(metric, Counter):
+            raise ValueError(f'Metric {name} is not a counter')
+        return metric
+
+    def gauge(self,
+              name: str,
+              documentation: str,
+              function: Callable[[], Dict[LabelValues, float]],
+              label_names: Sequence[str] = (),
+              metric_type: str = "gauge") -> Gauge:
+        """Registers a gauge, whose series are the result of ``function``,
+        replacing the gauge with the same name if any. If the values are
+        totals maintained elsewhere, ``metric_type`` should be ``counter``.
+        """
+        metric = Gauge(name, documentation, function, label_names,
+                       metric_type)
+        with self._lock:
+            if not isinstance(self._metrics.get(name, metric), Gauge):
+                raise ValueError(f'Metric {name} is not a gauge')
+            self._metrics[name] = metric
+        return metric
+
+    def histogram(self,
+                  name: str,
+                  documentation: str,
+                  label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS
+                  ) -> Histogram:
+        """Returns a histogram.
+        """
+        metric = self._register(
+            Histogram(name, documentation, label_names, buckets)
+        )
+        if not isinstance(metric, Histogram):
+            raise ValueError(f'Metric {name} is not a histogram')
+        return metric
+
+    def render(self, prefix: str = "", compact: bool = False) -> str:
+        """Renders the metrics whose name starts with ``prefix`` in the
+        Prometheus text exposition format. If ``compact`` is set, comments and
+        histogram buckets are omitted.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []  # type: List[str]
+        for name, metric in metrics:
+            if not name.startswith(prefix):
+                continue
+            if not compact:
+                lines += [
+                    f'# HELP {name} {metric.documentation}',
+                    f'# TYPE {name} {metric.TYPE}'
+                ]
+            for suffix, labels, value in metric.samples():
+                if suffix == "_bucket" and compact:
+                    continue
+                label_text = ",".join([
+                    f'{key}="{_escape(label)}"'
+                    for key, label in labels.items()
+                ])
+                if label_text:
+                    label_text = "{" + label_text + "}"
+                lines.append(
+                    f'{name}{suffix}{label_text} {_format_value(value)}'
+                )
+        return "".join([line + "\n" for line in lines])
+
+    def serve(self, host: str, port: int) -> None:
+        """Serves the metrics at ``http://HOST:PORT/metrics`` from a background
+        thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Serves ``GET /metrics``.
+            """
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Handles a GET request.
+                """
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = _ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """An HTTP server handling each request in a thread.
+    """
+
+    daemon_threads = True
+
+
+def _escape(label: str) -> str:
+    """Escapes a label value.
+    """
+    return label.replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def _format_value(value: Optional[float]) -> str:
+    """Formats a sample value or a bucket bound.
+    """
+    if value is None or math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""Rate limited queue of outbound telegram requests.
+
+All the messages sent, edited and deleted by
+:py:class:`telecom.command.Command` go through
+:py:attr:`telecom.command.Command.OUTBOX`.
+"""
+
+from concurrent.futures import (
+    Future
+)
+import logging
+from threading import (
+    Condition,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple
+)
+
+from telegram.error import (
+    RetryAfter
+)
+
+from telecom.metrics import (
+    Histogram,
+    MetricRegistry
+)
+
+
+class TokenBucket:
+    """A token bucket rate limiter.
+
+    The bucket holds at most ``burst`` tokens, and is refilled at ``rate``
+    tokens per second. Sending a request consumes a token.
+    """
+
+    burst: float
+    """Capacity of the bucket."""
+
+    rate: float
+    """Refill rate, in tokens per second."""
+
+    _blocked_until: float
+    """Monotonic time before which no token is available."""
+
+    _tokens: float
+    """Number of tokens at time ``_updated_at``."""
+
+    _updated_at: float
+    """Monotonic time of the last update of ``_tokens``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.burst = burst
+        self.rate = rate
+        self._blocked_until = 0.0
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """Refills the bucket.
+        """
+        self._tokens = min(
+            self.burst,
+            self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def block(self, now: float, duration: float) -> None:
+        """Makes the bucket unavailable for ``duration`` seconds.
+        """
+        self._blocked_until = max(self._blocked_until, now + duration)
+
+    def consume(self, now: float) -> None:
+        """Consumes a token.
+        """
+        self._refill(now)
+        self._tokens -= 1
+
+    def delay(self, now: float) -> float:
+        """Returns the delay (in seconds) until a token is available.
+        """
+        self._refill(now)
+        return max(
+            self._blocked_until - now,
+            (1 - self._tokens) / self.rate,
+            0.0
+        )
+
+
+class Outbox:
+    """A queue of outbound telegram requests, sent by a single background
+    thread.
+
+    Requests are sent in order within a chat, subject to a global rate budget
+    of :py:attr:`telecom.outbox.Outbox.GLOBAL_RATE` requests per second and a
+    per-chat budget of :py:attr:`telecom.outbox.Outbox.CHAT_RATE` requests per
+    second. Consecutive edits of the same message that have not been sent yet
+    are collapsed into the latest one. Requests failing with
+    ``telegram.error.RetryAfter`` are retried once the delay demanded by
+    telegram has elapsed, up to :py:attr:`telecom.outbox.Outbox.MAX_RETRIES`
+    times.
+    """
+
+    CHAT_BURST: float = 3.0
+    """Number of requests that can be sent at once to a chat."""
+
+    CHAT_RATE: float = 1.0
+    """Sustained number of requests per second to a chat."""
+
+    GLOBAL_BURST: float = 30.0
+    """Number of requests that can be sent at once."""
+
+    GLOBAL_RATE: float = 30.0
+    """Sustained number of requests per second."""
+
+    MAX_RETRIES: int = 5
+    """Maximum number of retries of a request."""
+
+    _chats: Dict[int, TokenBucket]
+    """Dict that maps a chat id to its rate limiter."""
+
+    _condition: Condition
+    """Condition protecting the queue, and notified when it changes."""
+
+    _durations: Optional[Histogram]
+    """Histogram of the durations of the requests, if metrics are
+    recorded."""
+
+    _global: TokenBucket
+    """Global rate limiter."""
+
+    _latest: Dict[Hashable, '_Request']
+    """Dict that maps a coalescing key to the queued request having that
+    key."""
+
+    _queue: List['_Request']
+    """Queued requests."""
+
+    _thread: Optional[Thread]
+    """Background thread, started on the first request."""
+
+    def __init__(self, metrics: Optional[MetricRegistry] = None):
+        self._chats = {}
+        self._condition = Condition()
+        self._durations = None
+        if metrics is not None:
+            self._durations = metrics.histogram(
+                "dockerbot_telegram_request_duration_seconds",
+                "Duration of the telegram bot API requests",
+                ("method", "outcome")
+            )
+            metrics.gauge(
+                "dockerbot_telegram_requests_queued",
+                "Number of telegram bot API requests waiting to be sent",
+                lambda: {(): len(self)}
+            )
+        self._global = TokenBucket(Outbox.GLOBAL_RATE, Outbox.GLOBAL_BURST)
+        self._latest = {}
+        self._queue = []
+        self._thread = None
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def _enqueue(self, request: '_Request') -> Future:
+        """Enqueues a request, collapsing it into a queued request with the
+        same coalescing key if any.
+        """
+        with self._condition:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            queued = self._latest.get(request.key, None) \
+                if request.key is not None else None
+            if queued is not None:
+                queued.function = request.function
+                queued.kwargs = request.kwargs
+                queued.futures += request.futures
+            else:
+                self._queue.append(request)
+                if request.key is not None:
+                    self._latest[request.key] = request
+            self._condition.notify()
+        return request.futures[0]
+
+    def _next(self, now: float) -> Tuple[Optional['_Request'],
+                                         Optional[float]]:
+        """Dequeues the first request that can be sent now. If there is none,
+        returns the delay until one can be sent, or ``None`` if the queue is
+        empty. The condition must be held.
+        """
+        if not self._queue:
+            return None, None
+        delay = self._global.delay(now)
+        if delay > 0:
+            return None, delay
+        blocked = set()  # type: Set[int]
+        for idx, request in enumerate(self._queue):
+            if request.chat_id in blocked:
+                continue
+            bucket = self._chats.setdefault(
+                request.chat_id,
+                TokenBucket(Outbox.CHAT_RATE, Outbox.CHAT_BURST)
+            )
+            chat_delay = bucket.delay(now)
+            if chat_delay <= 0:
+                del self._queue[idx]
+                if self._latest.get(request.key, None) is request:
+                    self._latest.pop(request.key)
+                bucket.consume(now)
+                self._global.consume(now)
+                return request, None
+            blocked.add(request.chat_id)
+            delay = chat_delay if not delay else min(delay, chat_delay)
+        return None, delay
+
+    def _perform(self, request: '_Request') -> None:
+        """Sends a request, and requeues it if telegram asks to retry later.
+        """
+        start = time.monotonic()
+        try:
+            result = request.function(**request.kwargs)
+        except RetryAfter as error:
+            self._observe(request, start, "retry_after")
+            if request.retries >= Outbox.MAX_RETRIES:
+                request.fail(error)
+                return
+            logging.warning("Telegram asked to retry after %s s",
+                            error.retry_after)
+            request.retries += 1
+            with self._condition:
+                self._chats[request.chat_id].block(
+                    time.monotonic(),
+                    float(error.retry_after)
+                )
+                self._queue.insert(0, request)
+                if request.key is not None:
+                    newer = self._latest.get(request.key, None)
+                    if newer is not None:
+                        # A newer edit of the same message is already queued
+                        self._queue.remove(request)
+                        newer.futures = request.futures + newer.futures
+                    else:
+                        self._latest[request.key] = request
+        except Exception as error:  # pylint: disable=broad-except
+            self._observe(request, start, "error")
+            logging.warning("Telegram request failed: %s", str(error))
+            request.fail(error)
+        else:
+            self._observe(request, start, "ok")
+            for future in request.futures:
+                future.set_result(result)
+
+    def _observe(self,
+                 request: '_Request',
+                 start: float,
+                 outcome: str) -> None:
+        """Records the duration of a request, if metrics are recorded.
+        """
+        if self._durations is not None:
+            self._durations.observe(
+                time.monotonic() - start,
+                method=getattr(request.function, "__name__", "unknown"),
+                outcome=outcome
+            )
+
+    def _run(self) -> None:
+        """Sends queued requests forever.
+        """
+        while True:
+            with self._condition:
+                while True:
+                    request, delay = self._next(time.monotonic())
+                    if request is not None:
+                        break
+                    self._condition.wait(delay)
+            self._perform(request)
+
+    def delete(self, function: Callable[..., Any], **kwargs) -> Future:
+        """Enqueues the deletion of a message, e.g. ``bot.delete_message``.
+        Queued edits of that message are dropped.
+
+        The keyword arguments must contain ``chat_id`` and ``message_id``.
+        """
+        with self._condition:
+            queued = self._latest.pop(
+                (kwargs["chat_id"], kwargs["message_id"]),
+                None
+            )
+            if queued is not None:
+                self._queue.remove(queued)
+                for future in queued.futures:
+                    future.cancel()
+        return self._enqueue(_Request(function, kwargs))
+
+    def edit(self, function: Callable[..., Any], **kwargs) -> Future:
+        """Enqueues the edition of a message, e.g. ``bot.edit_message_text``.
+        It is collapsed with the queued editions of the same message, if any.
+
+        The keyword arguments must contain ``chat_id`` and ``message_id``.
+        """
+        return self._enqueue(_Request(
+            function,
+            kwargs,
+            (kwargs["chat_id"], kwargs["message_id"])
+        ))
+
+    def send(self, function: Callable[..., Any], **kwargs) -> Future:
+        """Enqueues a request to a chat, e.g. ``bot.send_message``.
+
+        The keyword arguments must contain ``chat_id``.
+        """
+        return self._enqueue(_Request(function, kwargs))
+
+
+class _Request:
+    """An outbound telegram request.
+    """
+
+    chat_id: int
+    """Chat concerned by the request."""
+
+    function: Callable[..., Any]
+    """Function performing the request."""
+
+    futures: List[Future]
+    """Futures resolved when the request is performed. There are more than
+    one if other requests were collapsed into this one."""
+
+    key: Optional[Hashable]
+    """Coalescing key."""
+
+    kwargs: Dict[str, Any]
+    """Keyword arguments of ``function``."""
+
+    retries: int
+    """Number of times the request was retried."""
+
+    def __init__(self,
+                 function: Callable[..., Any],
+                 kwargs: Dict[str, Any],
+                 key: Optional[Hashable] = None):
+        self.chat_id = kwargs["chat_id"]
+        self.function = function
+        self.futures = [Future()]
+        self.key = key
+        self.kwargs = kwargs
+        self.retries = 0
+
+    def fail(self, error: BaseException) -> None:
+        """Resolves the futures of the request with an exception.
+        """
+        for future in self.futures:
+            if not future.cancelled():
+                future.set_exception(error)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Bounded, expiring store of pending commands.
+
+A command is *pending* when it waits for an argument to be selected on one of
+its inline keyboards. See :py:attr:`telecom.command.Command.PENDING_COMMANDS`.
+"""
+
+from collections import (
+    OrderedDict
+)
+from threading import (
+    Lock
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+
+class SavedCommand:
+    """A pending command restored from a snapshot, that is not instantiated
+    yet. See :py:class:`telecom.state.StateFile`.
+
+    Instantiating a command needs its module, and a telegram bot to decode its
+    message, so this is deferred to the first time one of its inline keyboards
+    is used.
+    """
+
+    keyboards: Dict[int, str]
+    """Dict that maps the id of a message sent by the command to the name of
+    the argument its inline keyboard selects."""
+
+    name: str
+    """Command name."""
+
+    pending_idx: str
+    """Key of the command in the store."""
+
+    state: Dict[str, Any]
+    """State of the command, see :py:meth:`telecom.command.Command.snapshot`.
+    """
+
+    def __init__(self, pending_idx: str, state: Dict[str, Any]):
+        self.keyboards = {
+            int(message_id): arg_name
+            for message_id, arg_name in state.get("keyboards", {}).items()
+        }
+        self.name = state["name"]
+        self.pending_idx = pending_idx
+        self.state = state
+
+    def keyboard_arg(self, message_id: int) -> Optional[str]:
+        """Returns the name of the argument selected by the inline keyboard of
+        a message, see :py:meth:`telecom.command.Command.keyboard_arg`.
+        """
+        return self.keyboards.get(message_id, None)
+
+
+class PendingCommandStore:
+    """A store of pending commands, indexed by their pending index.
+
+    Entries expire :py:attr:`telecom.pending.PendingCommandStore.TTL` seconds
+    after they were last accessed. The store holds at most
+    :py:attr:`telecom.pending.PendingCommandStore.MAX_SIZE` entries overall,
+    and at most :py:attr:`telecom.pending.PendingCommandStore.MAX_PER_CHAT`
+    entries per chat; when a cap is exceeded, the least recently used entry
+    (of that chat) is evicted.
+
+    The store counts hits, misses, expirations and evictions, see
+    :py:meth:`telecom.pending.PendingCommandStore.stats`.
+    """
+
+    MAX_PER_CHAT: int = 50
+    """Maximum number of pending commands per chat."""
+
+    MAX_SIZE: int = 1000
+    """Maximum number of pending commands."""
+
+    TTL: float = 3600.0
+    """Duration (in seconds) after which an unused pending command expires."""
+
+    _by_chat: Dict[int, 'OrderedDict[str, None]']
+    """Dict that maps a chat id to the pending indices of that chat, least
+    recently used first."""
+
+    _entries: 'OrderedDict[str, Tuple[Any, int, float]]'
+    """Dict that maps a pending index to the command, its chat id, and its
+    last access time, least recently used first."""
+
+    _lock: Lock
+    """Lock protecting the store."""
+
+    _stats: Dict[str, int]
+    """Counters."""
+
+    def __init__(self):
+        self._by_chat = {}
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._stats = {
+            "chat_evictions": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "hits": 0,
+            "misses": 0
+        }
+
+    def __contains__(self, pending_idx: Any) -> bool:
+        with self._lock:
+            return pending_idx in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _expire(self, now: float) -> None:
+        """Removes expired entries. The lock must be held.
+        """
+        while self._entries:
+            pending_idx = next(iter(self._entries))
+            if now - self._entries[pending_idx][2] <= PendingCommandStore.TTL:
+                break
+            self._remove(pending_idx)
+            self._stats["expirations"] += 1
+
+    def _remove(self, pending_idx: str) -> Optional[Any]:
+        """Removes an entry and returns its command. The lock must be held.
+        """
+        if pending_idx not in self._entries:
+            return None
+        command, chat_id, _ = self._entries.pop(pending_idx)
+        chat_entries = self._by_chat.get(chat_id, OrderedDict())
+        chat_entries.pop(pending_idx, None)
+        if not chat_entries:
+            self._by_chat.pop(chat_id, None)
+        return command
+
+    def add(self,
+            pending_idx: str,
+            command: Any,
+            chat_id: int,
+            idle: float = 0.0) -> None:
+        """Adds a pending command, evicting other entries if needed.
+
+        ``idle`` is the time (in seconds) since the command was last used, when
+        entries are restored. Entries must then be added least recently used
+        first.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._remove(pending_idx)
+            self._entries[pending_idx] = (command, chat_id, now - idle)
+            chat_entries = self._by_chat.setdefault(chat_id, OrderedDict())
+            chat_entries[pending_idx] = None
+            while len(chat_entries) > PendingCommandStore.MAX_PER_CHAT:
+                self._remove(next(iter(chat_entries)))
+                self._stats["chat_evictions"] += 1
+            while len(self._entries) > PendingCommandStore.MAX_SIZE:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def chat_commands(self, chat_id: int) -> List[Any]:
+        """Returns the pending commands of a chat, least recently used first.
+        """
+        with self._lock:
+            return [
+                self._entries[pending_idx][0]
+                for pending_idx in self._by_chat.get(chat_id, {})
+            ]
+
+    def get(self, pending_idx: str) -> Optional[Any]:
+        """Returns a pending command and marks it as recently used, or returns
+        ``None`` if it does not exist or has expired.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if pending_idx not in self._entries:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            command, chat_id, _ = self._entries[pending_idx]
+            self._entries[pending_idx] = (command, chat_id, now)
+            self._entries.move_to_end(pending_idx)
+            self._by_chat[chat_id].move_to_end(pending_idx)
+            return command
+
+    def items(self) -> List[Tuple[str, Any, int, float]]:
+        """Returns the pending indices, commands, chat ids, and the time (in
+        seconds) since each command was last used, least recently used first.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            return [
+                (pending_idx, command, chat_id, now - used_at)
+                for pending_idx, (command, chat_id, used_at)
+                in self._entries.items()
+            ]
+
+    def pop(self, pending_idx: Optional[str]) -> Optional[Any]:
+        """Removes a pending command and returns it, or returns ``None`` if it
+        does not exist.
+        """
+        with self._lock:
+            if pending_idx is None:
+                return None
+            return self._remove(pending_idx)
+
+    def replace(self, pending_idx: str, command: Any) -> None:
+        """Replaces a pending command, without marking it as recently used.
+        """
+        with self._lock:
+            if pending_idx in self._entries:
+                _, chat_id, used_at = self._entries[pending_idx]
+                self._entries[pending_idx] = (command, chat_id, used_at)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the counters of the store, and its current size.
+        """
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Discovery of commands, import of their modules on first use, and reload.
+
+A command ``NAME`` is implemented in a module ``cmd_NAME.py``, by the class
+whose name is ``NAME`` in CamelCase (e.g. ``RestartBot`` in
+``cmd_restart_bot.py``). Modules are discovered by scanning directories, and
+parsed without being imported to read the help text of their command, so
+that registering commands costs almost nothing. A module is imported the
+first time its command is issued. Dropping a ``cmd_NAME.py`` file in a plugin
+directory is thus enough to add a command.
+
+Command modules can be reloaded in place, see
+:py:meth:`telecom.registry.CommandRegistry.reload`.
+"""
+
+import ast
+from concurrent.futures import (
+    Executor
+)
+import glob
+import importlib
+import logging
+import os
+import sys
+from threading import (
+    Lock
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Type
+)
+
+from telegram.ext import (
+    CommandHandler,
+    Dispatcher
+)
+
+from telecom.cmd_help import (
+    Help
+)
+from telecom.command import (
+    Command,
+    register_lazy_command
+)
+
+
+class CommandSpec:
+    """A discovered command, whose module may not be imported yet.
+    """
+
+    class_name: str
+    """Name of the class implementing the command."""
+
+    help_text: Optional[str]
+    """Help text of the command, see
+    :py:attr:`telecom.command.Command.__HELP__`."""
+
+    import_duration: Optional[float]
+    """Time (in seconds) it took to import the module, or ``None`` if it is
+    not imported yet."""
+
+    module_name: str
+    """Name of the module implementing the command."""
+
+    name: str
+    """Command name."""
+
+    path: str
+    """Path of the module implementing the command."""
+
+    _command_class: Optional[Type[Command]]
+    """Class implementing the command, once imported."""
+
+    _lock: Lock
+    """Lock serializing the import of the module."""
+
+    def __init__(self,
+                 name: str,
+                 module_name: str,
+                 class_name: str,
+                 help_text: Optional[str],
+                 path: str):
+        self.class_name = class_name
+        self.help_text = help_text
+        self.import_duration = None
+        self.module_name = module_name
+        self.name = name
+        self.path = path
+        self._command_class = None
+        self._lock = Lock()
+
+    def load(self) -> Type[Command]:
+        """Imports the module of the command if needed, and returns the class
+        implementing it.
+        """
+        with self._lock:
+            if self._command_class is None:
+                start = time.monotonic()
+                module = importlib.import_module(self.module_name)
+                command_class = getattr(module, self.class_name)
+                self.import_duration = time.monotonic() - start
+                logging.info("Imported command %s from %s in %.3f s",
+                             self.name, self.module_name,
+                             self.import_duration)
+                Command.COMMANDS[self.name] = command_class
+                self._command_class = command_class
+            return self._command_class
+
+
+class CommandRegistry:
+    """The commands discovered in some directories, and registered to a
+    telegram dispatcher.
+    """
+
+    directories: List[str]
+    """Directories scanned for command modules."""
+
+    dispatcher: Dispatcher
+    """Telegram dispatcher."""
+
+    specs: List[CommandSpec]
+    """Discovered commands, sorted by name."""
+
+    _handlers: List[CommandHandler]
+    """Handlers of the registered commands."""
+
+    _kwargs: Dict[str, Any]
+    """Keyword arguments the commands are registered with."""
+
+    _lock: Lock
+    """Lock serializing registrations and reloads."""
+
+    def __init__(self, dispatcher: Dispatcher, directories: Sequence[str]):
+        self.directories = list(directories)
+        self.dispatcher = dispatcher
+        self.specs = []
+        self._handlers = []
+        self._kwargs = {}
+        self._lock = Lock()
+
+    def _register(self, specs: List[CommandSpec]) -> None:
+        """Registers commands in place of the current ones. The lock must be
+        held.
+
+        New handlers are added before the old ones are removed, so that
+        commands stay available in between.
+        """
+        handlers = [
+            register_lazy_command(
+                self.dispatcher,
+                spec.name,
+                spec.load,
+                spec.help_text,
+                **self._kwargs
+            )
+            for spec in specs
+        ]
+        for handler in self._handlers:
+            self.dispatcher.remove_handler(handler)
+        names = {spec.name for spec in specs}
+        for spec in self.specs:
+            if spec.name not in names:
+                Command.COMMANDS.pop(spec.name, None)
+                Command.FACTORIES.pop(spec.name, None)
+                Help.HELP_DICT.pop(spec.name, None)
+        self._handlers = handlers
+        self.specs = specs
+
+    def register(self, **kwargs) -> None:
+        """Discovers and registers commands, see
+        :py:meth:`telecom.command.register_lazy_command`. The keyword
+        arguments are passed to all commands.
+        """
+        with self._lock:
+            self._kwargs = kwargs
+            self._register(discover_commands(self.directories))
+
+    def reload(self) -> List[str]:
+        """Discovers commands again, reloads the command modules that were
+        imported, and registers the commands in place of the current ones.
+        Returns the names of the reloaded modules.
+
+        Other modules, e.g. :py:mod:`telecom.command`, are not reloaded, so
+        that shared state such as pending commands and caches is kept. The
+        state of the command classes themselves is kept too, see
+        :py:func:`telecom.registry.keep_state`. Pending commands keep running
+        the code they were created with, and
+        :py:attr:`telecom.command.Command.RENDER_CACHE` is cleared. If a
+        module cannot be discovered or reloaded, the exception is raised and
+        the current commands are kept.
+        """
+        with self._lock:
+            specs = discover_commands(self.directories)
+            reloaded = []  # type: List[str]
+            for spec in specs:
+                module = sys.modules.get(spec.module_name, None)
+                if module is not None:
+                    previous = getattr(module, spec.class_name, None)
+                    importlib.reload(module)
+                    if previous is not None:
+                        keep_state(previous, getattr(module, spec.class_name))
+                    reloaded.append(spec.module_name)
+            self._register(specs)
+            Command.RENDER_CACHE.clear()
+            logging.info("Reloaded %d commands, re-imported %s", len(specs),
+                         ", ".join(reloaded) or "nothing")
+            return reloaded
+
+
+def discover_commands(directories: Sequence[str]) -> List[CommandSpec]:
+    """Finds the commands implemented in ``cmd_*.py`` modules of some
+    directories, sorted by name, without importing them.
+
+    Directories are added to ``sys.path`` so that their modules can be
+    imported later. If several directories implement the same command, the
+    first one wins.
+    """
+    specs = {}  # type: Dict[str, CommandSpec]
+    for directory in directories:
+        directory = os.path.abspath(directory)
+        if directory not in sys.path:
+            sys.path.append(directory)
+        for path in sorted(glob.glob(os.path.join(directory, "cmd_*.py"))):
+            spec = parse_command_module(path)
+            if spec is None:
+                continue
+            if spec.name in specs:
+                logging.warning("Command %s of %s is already implemented in "
+                                "%s, ignoring it", spec.name, path,
+                                specs[spec.name].path)
+                continue
+            specs[spec.name] = spec
+    return [specs[name] for name in sorted(specs)]
+
+
+def keep_state(previous: Type[Command], command_class: Type[Command]) -> None:
+    """Sets the state attributes of a reloaded command class, see
+    :py:attr:`telecom.command.Command.__STATE__`, to those of its previous
+    version. Thread pools created by the reloaded module in their place are
+    shut down, and background threads keep running, so that nothing leaks.
+    """
+    for name in command_class.__STATE__:
+        if name not in previous.__dict__:
+            continue
+        replaced = command_class.__dict__.get(name, None)
+        value = previous.__dict__[name]
+        if isinstance(replaced, Executor) and replaced is not value:
+            replaced.shutdown(wait=False)
+        setattr(command_class, name, value)
+
+
+def parse_command_module(path: str) -> Optional[CommandSpec]:
+    """Reads the command implemented by a ``cmd_NAME.py`` module without
+    importing it. Returns ``None`` if the module does not define the expected
+    class.
+    """
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    name = module_name[len("cmd_"):]
+    class_name = "".join([part.capitalize() for part in name.split("_")])
+    with open(path, "r", encoding="utf-8") as file:
+        tree = ast.parse(file.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == class_name:
+            return CommandSpec(
+                name,
+                module_name,
+                class_name,
+                _help_text(node),
+                path
+            )
+    logging.warning("Module %s does not define class %s, ignoring it",
+                    path, class_name)
+    return None
+
+
+def _help_text(node: ast.ClassDef) -> Optional[str]:
+    """Returns the ``__HELP__`` string literal of a class definition, if
+    any.
+    """
+    for statement in node.body:
+        target = None  # type: Optional[ast.expr]
+        value = None  # type: Optional[ast.expr]
+        if isinstance(statement, ast.Assign) and \
+                len(statement.targets) == 1:
+            target, value = statement.targets[0], statement.value
+        elif isinstance(statement, ast.AnnAssign):
+            target, value = statement.target, statement.value
+        if isinstance(target, ast.Name) and target.id == "__HELP__" and \
+                value is not None:
+            try:
+                help_text = ast.literal_eval(value)
+            except ValueError:
+                return None
+            return help_text if isinstance(help_text, str) else None
+    return None
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Cache of rendered replies and inline keyboard layouts.
+
+Rendering a reply or a keyboard often means listing containers and formatting
+them, although nothing changed since the last identical request. Each entry
+of the cache is stored with the version of the state it was rendered from,
+e.g. :py:attr:`docker_utils.ContainerCache.version`, and reused as long as
+that version is unchanged: there is no expiry to tune, and no stale entry is
+ever served.
+"""
+
+from collections import (
+    OrderedDict
+)
+from threading import (
+    Lock
+)
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar
+)
+
+from telecom.metrics import (
+    Counter,
+    MetricRegistry
+)
+
+
+T = TypeVar("T")
+
+
+class RenderCache:
+    """A size-bounded cache of rendered values, by kind and key.
+
+    At most :py:attr:`telecom.render.RenderCache.MAX_SIZE` entries are kept;
+    beyond that, the least recently used entries are evicted. Cached values
+    are shared, and must not be modified.
+    """
+
+    MAX_SIZE: int = 1000
+    """Maximum number of entries."""
+
+    _entries: 'OrderedDict[Tuple[str, Hashable], Tuple[Hashable, Any]]'
+    """Dict that maps a kind and a key to a version and the value rendered
+    from it, least recently used first."""
+
+    _lock: Lock
+    """Lock protecting the entries."""
+
+    _requests: Optional[Counter]
+    """Number of lookups, by kind and outcome."""
+
+    def __init__(self, metrics: Optional[MetricRegistry] = None):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._requests = None
+        if metrics is not None:
+            self._requests = metrics.counter(
+                "dockerbot_render_cache_requests_total",
+                "Lookups of the render cache, by kind and outcome (hit, miss "
+                "or uncached)",
+                ("kind", "outcome")
+            )
+            metrics.gauge(
+                "dockerbot_render_cache_entries",
+                "Number of entries of the render cache",
+                lambda: {(): len(self)}
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Removes all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get(self,
+            kind: str,
+            key: Hashable,
+            version: Optional[Hashable],
+            render: Callable[[], T]) -> T:
+        """Returns the value cached for a kind and a key if it was rendered
+        from ``version``, otherwise renders it by calling ``render`` and
+        caches it. If ``version`` is ``None``, i.e. the state is unknown, the
+        value is rendered and not cached.
+
+        ``render`` is called without holding any lock, so that concurrent
+        lookups of other entries are not delayed.
+        """
+        if version is None:
+            if self._requests is not None:
+                self._requests.inc(kind=kind, outcome="uncached")
+            return render()
+        entry_key = (kind, key)
+        with self._lock:
+            entry = self._entries.get(entry_key, None)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(entry_key)
+        if entry is not None and entry[0] == version:
+            if self._requests is not None:
+                self._requests.inc(kind=kind, outcome="hit")
+            return entry[1]
+        value = render()
+        with self._lock:
+            self._entries[entry_key] = (version, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > RenderCache.MAX_SIZE:
+                self._entries.popitem(last=False)
+        if self._requests is not None:
+            self._requests.inc(kind=kind, outcome="miss")
+        return value
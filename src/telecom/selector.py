@@ -11,7 +11,10 @@ See :py:meth:`telecom.command.Command.arg`.
 """
 
 from typing import (
+    Callable,
+    Hashable,
     List,
+    Optional,
     Sequence,
     Tuple,
     Union
@@ -22,6 +25,10 @@ from telegram import (
     InlineKeyboardMarkup
 )
 
+from telecom.render import (
+    RenderCache
+)
+
 
 class ArgumentSelector:
     """An abstract argument selector.
@@ -33,6 +40,14 @@ class ArgumentSelector:
     See implementation of
     :py:meth:`telecom.selector.ArgumentSelector.option_inline_keyboard`"""
 
+    PAGE_CODE: str = "#page="
+    """Prefix of the codes of the navigation buttons. It must not be the
+    prefix of an option code."""
+
+    ROW_COUNT: int = 8
+    """Maximum row count of a page of the telegram inline keyboard, navigation
+    row excluded."""
+
     def option_list(self) -> Sequence[Union[str, Tuple[str, str]]]:
         # pylint: disable=line-too-long
         """Implement this.
@@ -49,23 +64,90 @@ class ArgumentSelector:
         raise NotImplementedError
 
     def option_inline_keyboard(self,
-                               callback_prefix: str) -> InlineKeyboardMarkup:
+                               encode: Callable[[str], str],
+                               page: int = 0,
+                               prefix: str = "",
+                               cache: Optional[RenderCache] = None
+                               ) -> InlineKeyboardMarkup:
         """Creates a inline keyboard out of the options provided by this
-        selector.
+        selector. The callback data of a button is ``encode(code)``.
+
+        The layout of the keyboard is that of
+        :py:meth:`telecom.selector.ArgumentSelector.option_layout`. It is
+        reused from ``cache``, if given, as long as
+        :py:meth:`telecom.selector.ArgumentSelector.option_version` is
+        unchanged. Only the callback data are encoded on each call.
         """
-        button_layout = []  # type: List[List[InlineKeyboardButton]]
-        for idx, item in enumerate(self.option_list()):
+        if cache is None:
+            layout = self.option_layout(page, prefix)
+        else:
+            layout = cache.get(
+                "keyboard",
+                (type(self).__qualname__, page, prefix),
+                self.option_version(),
+                lambda: self.option_layout(page, prefix)
+            )
+        return InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton(text, callback_data=encode(code))
+                for text, code in row
+            ]
+            for row in layout
+        ])
+
+    def option_layout(self,
+                      page: int = 0,
+                      prefix: str = "") -> List[List[Tuple[str, str]]]:
+        """Lays out the options provided by this selector as rows of button
+        labels and codes.
+
+        Only the options whose label or code starts with ``prefix`` (case
+        insensitive) are considered, and only the buttons of page ``page`` are
+        laid out. If there are several pages, a navigation row is added, whose
+        buttons return :py:attr:`telecom.selector.ArgumentSelector.PAGE_CODE`
+        followed by a page number.
+        """
+        prefix = prefix.lower()
+        options = []  # type: List[Tuple[str, str]]
+        for item in self.option_list():
             (text, code) = \
                 item if isinstance(item, tuple) else (item, item)
-            button = InlineKeyboardButton(
-                text,
-                callback_data=f'{callback_prefix}:{code}'
-            )
-            if idx % ArgumentSelector.COLUMN_COUNT == 0:
-                button_layout += [[button]]
+            if text.lower().startswith(prefix) or \
+                    code.lower().startswith(prefix):
+                options.append((text, code))
+        page_size = self.COLUMN_COUNT * self.ROW_COUNT
+        page_count = max(1, -(-len(options) // page_size))
+        page = min(max(page, 0), page_count - 1)
+        layout = []  # type: List[List[Tuple[str, str]]]
+        for idx, option in enumerate(
+                options[page * page_size:(page + 1) * page_size]):
+            if idx % self.COLUMN_COUNT == 0:
+                layout += [[option]]
             else:
-                button_layout[-1] += [button]
-        return InlineKeyboardMarkup(button_layout)
+                layout[-1] += [option]
+
+        def page_button(text: str, target: int) -> Tuple[str, str]:
+            return (text, f'{self.PAGE_CODE}{target}')
+
+        if not options:
+            layout += [[page_button("🔎 No match", 0)]]
+        elif page_count > 1:
+            navigation = [page_button(f'{page + 1}/{page_count}', page)]
+            if page > 0:
+                navigation.insert(0, page_button("◀️", page - 1))
+            if page < page_count - 1:
+                navigation.append(page_button("▶️", page + 1))
+            layout += [navigation]
+        return layout
+
+    def option_version(self) -> Optional[Hashable]:
+        """Override this to cache the keyboards of this selector.
+
+        This method returns a value that changes whenever the options change,
+        e.g. the version of the state they are computed from, or ``None`` if
+        the options must be computed each time (default).
+        """
+        return None
 
 
 class YesNoSelector(ArgumentSelector):
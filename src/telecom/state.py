@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Snapshot of the pending commands and callback tokens, restored on startup.
+
+Without it, the inline keyboards sent before a restart of the bot become
+inert. The snapshot is a compact JSON file, written atomically on shutdown
+and periodically. Restoring it neither imports command modules nor decodes
+telegram messages: pending commands are restored as
+:py:class:`telecom.pending.SavedCommand` and instantiated on first use, see
+:py:meth:`telecom.command.restore`.
+"""
+
+import json
+import logging
+import os
+from threading import (
+    Event,
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional
+)
+
+from telecom.callback import (
+    CallbackTokenTable
+)
+from telecom.command import (
+    Command
+)
+from telecom.pending import (
+    SavedCommand
+)
+
+
+class StateFile:
+    """A snapshot file of :py:attr:`telecom.command.Command.PENDING_COMMANDS`,
+    :py:attr:`telecom.command.Command.PENDING_COMMANDS_COUNTER` and
+    :py:attr:`telecom.command.Command.CALLBACK_TOKENS`.
+    """
+
+    VERSION: int = 1
+    """Version of the snapshot format."""
+
+    interval: float
+    """Time (in seconds) between two periodic snapshots."""
+
+    path: str
+    """Path of the snapshot file."""
+
+    _last_data: Optional[bytes]
+    """Content of the last snapshot written or read, so that unchanged state
+    is not written again."""
+
+    _lock: Lock
+    """Lock serializing the writes."""
+
+    _stopped: Event
+    """Event set when periodic snapshots are stopped."""
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.interval = interval
+        self.path = path
+        self._last_data = None
+        self._lock = Lock()
+        self._stopped = Event()
+
+    def load(self) -> int:
+        """Restores the snapshot, if any, and returns the number of pending
+        commands restored. A missing, unreadable, malformed or outdated
+        snapshot is ignored as a whole.
+        """
+        start = time.monotonic()
+        now = time.time()
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+            snapshot = json.loads(data.decode("UTF-8"))
+            if snapshot.get("version", None) != StateFile.VERSION:
+                raise ValueError(f'unknown version {snapshot.get("version")}')
+            pending = [
+                (
+                    str(pending_idx),
+                    SavedCommand(str(pending_idx), dict(state)),
+                    int(chat_id),
+                    max(now - float(used_at), 0.0)
+                )
+                for pending_idx, chat_id, used_at, state
+                in snapshot["pending"]
+            ]
+            counter = int(snapshot["counter"])
+            tokens = CallbackTokenTable()
+            tokens.restore(snapshot["tokens"])
+        except FileNotFoundError:
+            return 0
+        except (AttributeError, KeyError, OSError, TypeError,
+                ValueError) as error:
+            logging.warning("Ignoring state file %s: %s", self.path,
+                            str(error))
+            return 0
+        for pending_idx, command, chat_id, idle in pending:
+            Command.PENDING_COMMANDS.add(pending_idx, command, chat_id, idle)
+        with Command.PENDING_COMMANDS_LOCK:
+            Command.PENDING_COMMANDS_COUNTER = max(
+                Command.PENDING_COMMANDS_COUNTER,
+                counter
+            )
+        Command.CALLBACK_TOKENS.restore(tokens.snapshot())
+        self._last_data = data
+        logging.info("Restored %d pending commands and %d callback tokens "
+                     "from %s in %.3f s", len(pending), len(tokens),
+                     self.path, time.monotonic() - start)
+        return len(pending)
+
+    def save(self) -> None:
+        """Writes a snapshot, unless the state did not change since the last
+        one. The file is replaced atomically.
+        """
+        now = time.time()
+        pending = []  # type: List[List[Any]]
+        for pending_idx, command, chat_id, idle in \
+                Command.PENDING_COMMANDS.items():
+            state = command.state if isinstance(command, SavedCommand) \
+                else command.snapshot()
+            if state is not None:
+                used_at = round(now - idle)
+                pending.append([pending_idx, chat_id, used_at, state])
+        snapshot = {
+            "counter": Command.PENDING_COMMANDS_COUNTER,
+            "pending": pending,
+            "tokens": Command.CALLBACK_TOKENS.snapshot(),
+            "version": StateFile.VERSION
+        }  # type: Dict[str, Any]
+        data = json.dumps(
+            snapshot,
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("UTF-8")
+        with self._lock:
+            if data == self._last_data:
+                return
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, self.path)
+            self._last_data = data
+        logging.debug("Saved %d pending commands to %s", len(pending),
+                      self.path)
+
+    def start(self) -> None:
+        """Writes snapshots periodically from a background thread, until
+        :py:meth:`telecom.state.StateFile.stop` is called.
+        """
+
+        def target():
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.save()
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception("Could not save state to %s",
+                                      self.path)
+
+        Thread(target=target, daemon=True, name="state").start()
+
+    def stop(self) -> None:
+        """Stops periodic snapshots, and writes a last one.
+        """
+        self._stopped.set()
+        self.save()
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""End to end benchmark of the bot, offline.
+
+A fake docker daemon (see ``tools/fake_docker.py``) and a fake telegram bot
+API (see ``tools/fake_bot_api.py``) are started locally, and the commands of
+the bot are registered exactly as in ``src/main.py``. Each scenario then feeds
+updates to the telegram dispatcher, as the updater would, and measures the
+time until the bot has sent the expected requests to the bot API. Every
+iteration runs in its own chat, so that chats do not share rate budgets.
+
+Example::
+
+    python3 tools/benchmark.py --containers 10 100 1000 --latency 0.005
+
+The exit status is non-zero if any iteration failed.
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import sys
+from threading import (
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional
+)
+
+from telegram import (
+    Update
+)
+from telegram.ext import (
+    Updater
+)
+
+from fake_bot_api import (
+    ApiCall,
+    FakeBotApi
+)
+from fake_docker import (
+    FakeDocker
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from telecom.command import (  # noqa: E402
+    add_metrics_hooks,
+    Command
+)
+from telecom.executor import (  # noqa: E402
+    CommandExecutor
+)
+from telecom.outbox import (  # noqa: E402
+    Outbox
+)
+import main  # noqa: E402
+
+
+class BenchmarkError(Exception):
+    """Raised when the bot does not behave as expected in time.
+    """
+
+
+class Session:
+    """A user talking to the bot in a chat of its own.
+    """
+
+    CHAT_IDS = itertools.count(1000)
+    """Chat id generator."""
+
+    UPDATE_IDS = itertools.count(1)
+    """Update id generator."""
+
+    api: FakeBotApi
+    """Fake bot API."""
+
+    chat_id: int
+    """Chat of the session."""
+
+    timeout: float
+    """Time (in seconds) to wait for the bot."""
+
+    updater: Updater
+    """Updater of the bot."""
+
+    _message_ids: 'itertools.count[int]'
+    """Message id generator, for messages sent by the user."""
+
+    _seen: int
+    """Number of requests of the chat already returned by
+    :py:meth:`benchmark.Session.wait`, or preceding them."""
+
+    def __init__(self, updater: Updater, api: FakeBotApi, timeout: float):
+        self.api = api
+        self.chat_id = next(Session.CHAT_IDS)
+        self.timeout = timeout
+        self.updater = updater
+        self._message_ids = itertools.count(1000000)
+        self._seen = 0
+
+    def _process(self, data: Dict[str, Any]) -> None:
+        """Feeds an update to the dispatcher.
+        """
+        data["update_id"] = next(Session.UPDATE_IDS)
+        self.updater.dispatcher.process_update(
+            Update.de_json(data, self.updater.bot)
+        )
+
+    def _user(self) -> Dict[str, Any]:
+        return {
+            "first_name": "User",
+            "id": self.chat_id,
+            "is_bot": False,
+            "username": f'user{self.chat_id}'
+        }
+
+    def command(self, text: str) -> None:
+        """Sends a command, e.g. ``/logs container-00001``.
+        """
+        self._process({
+            "message": {
+                "chat": {"id": self.chat_id, "type": "private"},
+                "date": int(time.time()),
+                "entities": [{
+                    "length": len(text.split(" ")[0]),
+                    "offset": 0,
+                    "type": "bot_command"
+                }],
+                "from": self._user(),
+                "message_id": next(self._message_ids),
+                "text": text
+            }
+        })
+
+    def press(self, call: ApiCall, text: Optional[str] = None) -> None:
+        """Presses a button of the inline keyboard of a message sent by the
+        bot: the first one whose text starts with ``text``, or the first one.
+        """
+        buttons = [
+            button
+            for row in call.result["reply_markup"]["inline_keyboard"]
+            for button in row
+            if text is None or button["text"].startswith(text)
+        ]
+        if not buttons:
+            raise BenchmarkError(f'No button "{text}"')
+        self._process({
+            "callback_query": {
+                "chat_instance": str(self.chat_id),
+                "data": buttons[0]["callback_data"],
+                "from": self._user(),
+                "id": str(next(Session.UPDATE_IDS)),
+                "message": call.result
+            }
+        })
+
+    def wait(self, method: str, contains: str = "") -> ApiCall:
+        """Waits until the bot performs a request ``method`` in this chat,
+        whose text contains ``contains``, and returns it. Requests returned by
+        previous calls, and the requests preceding them, are skipped.
+        """
+        found = []  # type: List[ApiCall]
+
+        def predicate(calls: List[ApiCall]) -> bool:
+            for idx in range(self._seen, len(calls)):
+                if calls[idx].method == method and \
+                        contains in str(calls[idx].params.get("text", "")):
+                    self._seen = idx + 1
+                    found.append(calls[idx])
+                    return True
+            return False
+
+        if self.api.wait(self.chat_id, predicate, self.timeout) is None:
+            raise BenchmarkError(
+                f'Timed out waiting for {method} in chat {self.chat_id}'
+            )
+        return found[0]
+
+
+def scenario_info(session: Session, container_names: List[str]) -> None:
+    """``/info``, then the docker daemon button of the keyboard.
+    """
+    # pylint: disable=unused-argument
+    session.command("/info")
+    session.press(session.wait("sendMessage", "Select"), "Docker daemon")
+    session.wait("sendMessage", "Docker status")
+
+
+def scenario_keyboard(session: Session, container_names: List[str]) -> None:
+    """``/logs``, then the next page of the keyboard, then a container.
+    """
+    # pylint: disable=unused-argument
+    session.command("/logs")
+    keyboard = session.wait("sendMessage", "Choose")
+    if len(container_names) > 16:
+        session.press(keyboard, "▶️")
+        keyboard = session.wait("editMessageReplyMarkup")
+    session.press(keyboard, "container-")
+    session.wait("sendMessage", "Logs for container")
+
+
+def scenario_logs(session: Session, container_names: List[str]) -> None:
+    """``/logs CONTAINER``.
+    """
+    session.command(f'/logs {random.choice(container_names)}')
+    session.wait("sendMessage", "Logs for container")
+
+
+def scenario_restart(session: Session, container_names: List[str]) -> None:
+    """``/restart CONTAINER``.
+    """
+    session.command(f'/restart {random.choice(container_names)}')
+    session.wait("editMessageText", "Restarted")
+
+
+def scenario_restart_glob(session: Session,
+                          container_names: List[str]) -> None:
+    """``/restart container-0000*``, i.e. up to ten containers.
+    """
+    # pylint: disable=unused-argument
+    session.command("/restart container-0000*")
+    session.wait("editMessageText", "Restarted")
+
+
+def scenario_stats(session: Session, container_names: List[str]) -> None:
+    """``/stats``, then the refresh button.
+    """
+    # pylint: disable=unused-argument
+    session.command("/stats")
+    session.press(session.wait("sendMessage", "Top"), "🔄 Refresh")
+    session.wait("editMessageText", "Top")
+
+
+SCENARIOS: Dict[str, Callable[[Session, List[str]], None]] = {
+    "info": scenario_info,
+    "keyboard": scenario_keyboard,
+    "logs": scenario_logs,
+    "restart": scenario_restart,
+    "restart_glob": scenario_restart_glob,
+    "stats": scenario_stats
+}
+"""Dict that maps a scenario name to the function playing one iteration."""
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns a percentile of a sorted list, e.g. ``fraction=0.99``.
+    """
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(updater: Updater,
+                 api: FakeBotApi,
+                 scenario: Callable[[Session, List[str]], None],
+                 container_names: List[str],
+                 iterations: int,
+                 concurrency: int,
+                 timeout: float) -> Dict[str, float]:
+    """Plays a scenario ``iterations`` times, from ``concurrency`` threads.
+    """
+    latencies = []  # type: List[float]
+    failures = []  # type: List[str]
+    lock = Lock()
+    remaining = itertools.count(iterations, -1)
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining) <= 0:
+                    return
+            session = Session(updater, api, timeout)
+            start = time.monotonic()
+            try:
+                scenario(session, container_names)
+            except BenchmarkError as error:
+                with lock:
+                    failures.append(str(error))
+                continue
+            with lock:
+                latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    threads = [Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - start
+    for failure in failures[:3]:
+        logging.warning("%s", failure)
+    latencies.sort()
+    return {
+        "failures": len(failures),
+        "iterations": len(latencies),
+        "max": latencies[-1] if latencies else float("nan"),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "throughput": len(latencies) / duration
+    }
+
+
+def main_benchmark() -> int:
+    """Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--containers",
+        default=[50],
+        help="Numbers of containers of the fake docker daemon; each number "
+             "is benchmarked in turn",
+        nargs="+",
+        type=int)
+    parser.add_argument(
+        "-i", "--iterations",
+        default=100,
+        help="Number of iterations of each scenario",
+        type=int)
+    parser.add_argument(
+        "-j", "--concurrency",
+        default=8,
+        help="Number of concurrent users",
+        type=int)
+    parser.add_argument(
+        "-l", "--latency",
+        default=0.0,
+        help="Latency of the fake docker daemon, in seconds",
+        type=float)
+    parser.add_argument(
+        "--log-lines",
+        default=1000,
+        help="Number of log lines of each container",
+        type=int)
+    parser.add_argument(
+        "-m", "--metrics",
+        action="store_true",
+        help="Print the metrics of the bot at the end")
+    parser.add_argument(
+        "-s", "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        default=[],
+        dest="scenarios",
+        help="Scenario to play; reuse this option to play more scenarios "
+             "(default: all)")
+    parser.add_argument(
+        "--timeout",
+        default=30.0,
+        help="Time to wait for the bot, in seconds",
+        type=float)
+    parser.add_argument(
+        "--unthrottled",
+        action="store_true",
+        help="Lift the rate limits of the outbound telegram requests")
+    parser.add_argument(
+        "-w", "--workers",
+        default=4,
+        help="Number of threads executing docker commands",
+        type=int)
+    arguments = parser.parse_args()
+
+    if arguments.unthrottled:
+        Outbox.GLOBAL_BURST = Outbox.GLOBAL_RATE = 1000000.0
+        Command.OUTBOX = Outbox(Command.METRICS)
+    add_metrics_hooks()
+    api = FakeBotApi()
+    api_url = api.serve()
+    failures = 0
+    print(f'{"containers":>10} {"scenario":<13} {"iter":>5} {"fail":>5} '
+          f'{"p50 ms":>8} {"p99 ms":>8} {"max ms":>8} {"ops/s":>8} '
+          f'{"docker req/op":>13}')
+    for container_count in arguments.containers:
+        docker = FakeDocker(
+            container_count,
+            arguments.latency,
+            arguments.log_lines
+        )
+        container_caches = main.init_docker([docker.serve()])
+        updater = Updater(
+            token="123:bench",
+            base_url=api_url,
+            use_context=True
+        )
+        executor = CommandExecutor(
+            arguments.workers,
+            arguments.concurrency
+        )
+        main.register_commands(updater, [], container_caches, executor)
+        container_names = sorted(
+            container.name for container in docker.containers.values()
+        )
+        for name in arguments.scenarios or sorted(SCENARIOS):
+            scenario = SCENARIOS[name]
+            # Warm up caches and connections
+            run_scenario(updater, api, scenario, container_names, 1, 1,
+                         arguments.timeout)
+            requests = docker.requests
+            result = run_scenario(
+                updater,
+                api,
+                scenario,
+                container_names,
+                arguments.iterations,
+                arguments.concurrency,
+                arguments.timeout
+            )
+            failures += int(result["failures"])
+            per_op = (docker.requests - requests) / \
+                max(result["iterations"] + result["failures"], 1)
+            print(f'{container_count:>10} {name:<13} '
+                  f'{result["iterations"]:>5} {result["failures"]:>5} '
+                  f'{result["p50"] * 1000:>8.1f} '
+                  f'{result["p99"] * 1000:>8.1f} '
+                  f'{result["max"] * 1000:>8.1f} '
+                  f'{result["throughput"]:>8.1f} {per_op:>13.1f}',
+                  flush=True)
+    api.shutdown()
+    if arguments.metrics:
+        print(Command.METRICS.render(compact=True), end="")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        level=os.environ.get("LOGGING_LEVEL", "ERROR"))
+    sys.exit(main_benchmark())
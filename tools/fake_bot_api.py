@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""A fake telegram bot API, recording the requests of the bot.
+
+It answers the methods used by the bot with plausible results, and records
+every request along with its arrival time, so that the time from an update
+to the reply of the bot can be measured. Point the bot at it with
+``--telegram-api-url http://127.0.0.1:PORT/bot``.
+"""
+
+import email.parser
+import email.policy
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+import json
+from threading import (
+    Condition,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional
+)
+import urllib.parse
+
+
+class ApiCall:
+    """A request received by the fake bot API.
+    """
+
+    arrived_at: float
+    """Monotonic time at which the request was received."""
+
+    method: str
+    """Bot API method, e.g. ``sendMessage``."""
+
+    params: Dict[str, Any]
+    """Parameters of the request."""
+
+    result: Any
+    """Result returned to the bot."""
+
+    def __init__(self, method: str, params: Dict[str, Any], result: Any):
+        self.arrived_at = time.monotonic()
+        self.method = method
+        self.params = params
+        self.result = result
+
+    @property
+    def chat_id(self) -> Optional[int]:
+        """Returns the chat the request is about, if any.
+        """
+        chat_id = self.params.get("chat_id", None)
+        return None if chat_id is None else int(chat_id)
+
+
+class FakeBotApi:
+    """A fake telegram bot API listening on ``127.0.0.1``.
+    """
+
+    BOT: Dict[str, Any] = {
+        "first_name": "Bench",
+        "id": 1,
+        "is_bot": True,
+        "username": "bench_bot"
+    }
+    """The bot, as returned by ``getMe``."""
+
+    _calls: Dict[Optional[int], List[ApiCall]]
+    """Dict that maps a chat id to the requests about that chat."""
+
+    _condition: Condition
+    """Condition protecting ``_calls`` and ``_message_id``, notified when a
+    request is received."""
+
+    _message_id: int
+    """Id of the last message sent."""
+
+    _server: ThreadingHTTPServer
+    """HTTP server."""
+
+    def __init__(self, port: int = 0):
+        self._calls = {}
+        self._condition = Condition()
+        self._message_id = 0
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", port),
+            _handler_class(self)
+        )
+        self._server.daemon_threads = True
+
+    def call(self, method: str, params: Dict[str, Any]) -> ApiCall:
+        """Records a request and returns it, along with its result.
+        """
+        with self._condition:
+            result = True  # type: Any
+            if method == "getMe":
+                result = FakeBotApi.BOT
+            elif method in ("getMyCommands", "getUpdates"):
+                if method == "getUpdates":
+                    # Long polling
+                    self._condition.wait(float(params.get("timeout", 0)))
+                result = []
+            elif method in ("sendDocument", "sendMessage") or \
+                    method.startswith("edit") and "message_id" in params:
+                if method.startswith("send"):
+                    self._message_id += 1
+                result = {
+                    "chat": {"id": int(params["chat_id"]), "type": "private"},
+                    "date": int(time.time()),
+                    "from": FakeBotApi.BOT,
+                    "message_id": int(params.get("message_id",
+                                                 self._message_id)),
+                    "text": params.get("text", "")
+                }
+                if method == "sendDocument":
+                    result["caption"] = params.get("caption", "")
+                    result["document"] = {
+                        "file_id": f'file{self._message_id}',
+                        "file_name": params.get("document.filename", ""),
+                        "file_size": len(params.get("document", b'')),
+                        "file_unique_id": f'unique{self._message_id}'
+                    }
+                markup = params.get("reply_markup", None)
+                if isinstance(markup, str):
+                    markup = json.loads(markup)
+                # Only inline keyboards are part of the sent message
+                if isinstance(markup, dict) and "inline_keyboard" in markup:
+                    result["reply_markup"] = markup
+            call = ApiCall(method, params, result)
+            self._calls.setdefault(call.chat_id, []).append(call)
+            self._condition.notify_all()
+        return call
+
+    def calls(self, chat_id: Optional[int]) -> List[ApiCall]:
+        """Returns the requests about a chat.
+        """
+        with self._condition:
+            return list(self._calls.get(chat_id, []))
+
+    def serve(self) -> str:
+        """Starts serving in a background thread, and returns the base URL of
+        the API, to be given as ``base_url`` to ``telegram.Bot``.
+        """
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self._server.server_address[1]}/bot'
+
+    def shutdown(self) -> None:
+        """Stops serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait(self,
+             chat_id: int,
+             predicate: Callable[[List[ApiCall]], bool],
+             timeout: float) -> Optional[ApiCall]:
+        """Waits until the requests about a chat satisfy a predicate, and
+        returns the last one, or ``None`` on timeout.
+        """
+        with self._condition:
+            satisfied = self._condition.wait_for(
+                lambda: predicate(self._calls.get(chat_id, [])),
+                timeout
+            )
+            return self._calls[chat_id][-1] if satisfied else None
+
+
+def _handler_class(api: FakeBotApi) -> type:
+    """Returns a request handler class bound to a fake bot API.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """Handles one bot API request.
+        """
+
+        disable_nagle_algorithm = True
+
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            """Handles a bot API request, of the form
+            ``POST /botTOKEN/METHOD``.
+            """
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b''
+            content_type = self.headers.get("Content-Type", "")
+            params = {}  # type: Dict[str, Any]
+            if content_type.startswith("application/json") and body:
+                params = json.loads(body)
+            elif content_type.startswith("application/x-www-form"):
+                params = dict(urllib.parse.parse_qsl(body.decode("UTF-8")))
+            elif content_type.startswith("multipart/form-data"):
+                params = _parse_multipart(content_type, body)
+            call = api.call(method, params)
+            data = json.dumps({"ok": True, "result": call.result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST
+
+    return Handler
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Dict[str, Any]:
+    """Parses a ``multipart/form-data`` body. Files are returned as bytes,
+    and their name as ``FIELD.filename``.
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode("UTF-8") + body
+    )
+    params = {}  # type: Dict[str, Any]
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True)
+        if not isinstance(name, str) or not isinstance(payload, bytes):
+            continue
+        if filename is None:
+            params[name] = payload.decode("UTF-8")
+        else:
+            params[name] = payload
+            params[f'{name}.filename'] = filename
+    return params
@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+"""A fake docker daemon, serving the subset of the docker engine API used by
+the bot over plain HTTP.
+
+Containers are generated, and every request is delayed by a configurable
+latency to simulate a remote or busy daemon. Lifecycle actions update the
+state of the containers and are broadcast on the events stream.
+
+Example::
+
+    python3 tools/fake_docker.py --containers 200 --latency 0.01 &
+    python3 src/main.py -t TOKEN -s tcp://127.0.0.1:2375
+"""
+
+import argparse
+import datetime
+import json
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+import queue
+import re
+import struct
+import sys
+from threading import (
+    Lock,
+    Thread
+)
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence
+)
+import urllib.parse
+
+
+class FakeContainer:
+    """A fake container.
+    """
+
+    id: str
+    """Container id."""
+
+    labels: Dict[str, str]
+    """Container labels."""
+
+    name: str
+    """Container name."""
+
+    status: str
+    """Container status, e.g. ``running``."""
+
+    def __init__(self, idx: int):
+        self.id = f'{idx:012x}'.ljust(64, "0")
+        self.labels = {"bench.group": str(idx % 10)}
+        self.name = f'container-{idx:05d}'
+        self.status = "running" if idx % 4 else "exited"
+
+    def inspect(self) -> Dict[str, Any]:
+        """Returns the result of ``GET /containers/ID/json``.
+        """
+        return {
+            "Config": {
+                "Image": "bench:latest",
+                "Labels": self.labels,
+                "Tty": False
+            },
+            "Created": "2020-01-01T00:00:00.000000000Z",
+            "Id": self.id,
+            "Image": "sha256:" + "0" * 64,
+            "Name": "/" + self.name,
+            "State": {
+                "Running": self.status == "running",
+                "Status": self.status
+            }
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the result of ``GET /containers/ID/stats?stream=0``, with
+        counters increasing over time.
+        """
+        uptime = time.monotonic()
+        seed = int(self.id[:12], 16) + 1
+        cpu_share = (seed % 97) / 100
+        return {
+            "blkio_stats": {
+                "io_service_bytes_recursive": [
+                    {"op": "Read", "value": int(uptime * seed * 10)},
+                    {"op": "Write", "value": int(uptime * seed * 3)}
+                ]
+            },
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": int(uptime * 1e9 * cpu_share)},
+                "online_cpus": 4,
+                "system_cpu_usage": int(uptime * 4e9)
+            },
+            "memory_stats": {
+                "limit": 16 * 1024 ** 3,
+                "stats": {"inactive_file": 1024 ** 2},
+                "usage": seed * 10 * 1024 ** 2
+            },
+            "networks": {
+                "eth0": {
+                    "rx_bytes": int(uptime * seed * 100),
+                    "tx_bytes": int(uptime * seed * 50)
+                }
+            },
+            "precpu_stats": {
+                "cpu_usage": {
+                    "total_usage": int((uptime - 1) * 1e9 * cpu_share)
+                },
+                "system_cpu_usage": int((uptime - 1) * 4e9)
+            }
+        }
+
+    def size(self) -> Dict[str, Any]:
+        """Returns the entry of this container in ``GET /system/df``.
+        """
+        return {
+            **self.summary(),
+            "SizeRootFs": 100 * 1024 ** 2 + self.size_rw,
+            "SizeRw": self.size_rw
+        }
+
+    @property
+    def size_rw(self) -> int:
+        """Returns the size of the writable layer of this container.
+        """
+        return (int(self.id[:12], 16) * 7919 % 1000) * 1024 ** 2
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns the entry of this container in ``GET /containers/json``.
+        """
+        return {
+            "Id": self.id,
+            "Image": "bench:latest",
+            "Labels": self.labels,
+            "Names": ["/" + self.name],
+            "State": self.status,
+            "Status": self.status
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    """An HTTP server with a listen backlog closer to the one of the docker
+    daemon, so that concurrent requests are not delayed by SYN retries.
+    """
+
+    request_queue_size = 128
+
+
+class FakeDocker:
+    """A fake docker daemon listening on ``127.0.0.1``.
+    """
+
+    ACTION_EVENTS: Dict[str, Sequence[str]] = {
+        "restart": ("kill", "die", "stop", "start", "restart"),
+        "stop": ("kill", "die", "stop")
+    }
+    """Dict that maps a lifecycle action to the events a docker daemon
+    broadcasts for it, if there are several."""
+
+    ACTION_STATUSES: Dict[str, str] = {
+        "pause": "paused",
+        "restart": "running",
+        "start": "running",
+        "stop": "exited",
+        "unpause": "running"
+    }
+    """Dict that maps a lifecycle action to the resulting container
+    status."""
+
+    containers: Dict[str, FakeContainer]
+    """Dict that maps a container id to the corresponding container."""
+
+    df_delay: float
+    """Additional delay (in seconds) of disk usage requests, which take tens
+    of seconds on a real daemon with many images and volumes."""
+
+    latency: float
+    """Delay (in seconds) added to every request."""
+
+    log_line_length: int
+    """Length of a log line, in bytes."""
+
+    log_lines: int
+    """Number of log lines of each container, one per second up to now."""
+
+    requests: int
+    """Number of requests served."""
+
+    stats_delay: float
+    """Additional delay (in seconds) of stats requests, which take about a
+    second on a real daemon."""
+
+    _listeners: List['queue.Queue[Dict[str, Any]]']
+    """Queues of the connected events streams."""
+
+    _lock: Lock
+    """Lock protecting the containers, listeners and counter."""
+
+    _server: ThreadingHTTPServer
+    """HTTP server."""
+
+    def __init__(self,
+                 container_count: int = 50,
+                 latency: float = 0.0,
+                 log_lines: int = 1000,
+                 log_line_length: int = 80,
+                 port: int = 0,
+                 stats_delay: float = 1.0,
+                 df_delay: float = 0.0):
+        self.containers = {}
+        for idx in range(container_count):
+            container = FakeContainer(idx)
+            self.containers[container.id] = container
+        self.df_delay = df_delay
+        self.latency = latency
+        self.log_line_length = log_line_length
+        self.log_lines = log_lines
+        self.requests = 0
+        self.stats_delay = stats_delay
+        self._listeners = []
+        self._lock = Lock()
+        self._server = _Server(
+            ("127.0.0.1", port),
+            _handler_class(self)
+        )
+        self._server.daemon_threads = True
+
+    def find(self, name: str) -> Optional[FakeContainer]:
+        """Finds a container by name, id or id prefix. An id prefix must match
+        a single container.
+        """
+        with self._lock:
+            for container in self.containers.values():
+                if name in (container.name, container.id):
+                    return container
+            matches = [
+                container for container in self.containers.values()
+                if container.id.startswith(name)
+            ]
+        return matches[0] if len(matches) == 1 else None
+
+    def act(self, container: FakeContainer, action: str) -> None:
+        """Applies a lifecycle action and broadcasts its events.
+        """
+        with self._lock:
+            container.status = FakeDocker.ACTION_STATUSES[action]
+        for event in FakeDocker.ACTION_EVENTS.get(action, (action,)):
+            self.emit(
+                container,
+                event,
+                {"exitCode": "0"} if event == "die" else None
+            )
+
+    def df(self) -> Dict[str, Any]:
+        """Returns the result of ``GET /system/df``: one image per ten
+        containers, one volume per container, and some build cache.
+        """
+        with self._lock:
+            containers = [
+                container.size() for container in self.containers.values()
+            ]
+        images = [
+            {
+                "Containers": len(range(group, len(containers), 10)),
+                "Id": "sha256:" + f'{group:064x}',
+                "RepoTags": [f'bench-{group}:latest'],
+                "SharedSize": 50 * 1024 ** 2,
+                "Size": (group + 1) * 150 * 1024 ** 2
+            }
+            for group in range(max(1, len(containers) // 10))
+        ]
+        return {
+            "BuildCache": [
+                {
+                    "Description": f'step {idx}',
+                    "ID": f'{idx:025x}',
+                    "InUse": False,
+                    "Shared": idx % 2 == 0,
+                    "Size": idx * 10 * 1024 ** 2,
+                    "Type": "regular"
+                }
+                for idx in range(20)
+            ],
+            "Containers": containers,
+            "Images": images,
+            "LayersSize": sum([image["Size"] for image in images]),
+            "Volumes": [
+                {
+                    "Name": f'{idx:064x}',
+                    "UsageData": {
+                        "RefCount": 1 if idx % 3 else 0,
+                        "Size": idx * 1024 ** 2
+                    }
+                }
+                for idx in range(len(containers))
+            ]
+        }
+
+    def emit(self,
+             container: FakeContainer,
+             action: str,
+             attributes: Optional[Dict[str, str]] = None) -> None:
+        """Broadcasts a container event, e.g. ``die`` with attribute
+        ``exitCode``, or ``health_status: unhealthy``.
+        """
+        with self._lock:
+            for listener in self._listeners:
+                listener.put({
+                    "Action": action,
+                    "Actor": {
+                        "Attributes": {
+                            "name": container.name,
+                            **(attributes or {})
+                        },
+                        "ID": container.id
+                    },
+                    "Type": "container",
+                    "id": container.id,
+                    "status": action,
+                    "time": int(time.time())
+                })
+
+    def listen(self) -> 'queue.Queue[Dict[str, Any]]':
+        """Returns a new events queue.
+        """
+        listener = queue.Queue()  # type: queue.Queue[Dict[str, Any]]
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def unlisten(self, listener: 'queue.Queue[Dict[str, Any]]') -> None:
+        """Discards an events queue.
+        """
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def log(self,
+            since: Optional[float],
+            until: Optional[float],
+            tail: Optional[int]) -> List[bytes]:
+        """Returns the log lines of a container, timestamped, one per second
+        and ending now.
+        """
+        now = int(time.time())
+        first = now - self.log_lines + 1
+        start = first if since is None else max(first, int(since))
+        end = now if until is None else min(now, int(until) - 1)
+        seconds = range(start, end + 1)
+        if tail is not None:
+            seconds = seconds[max(len(seconds) - tail, 0):]
+        padding = "x" * max(self.log_line_length - 24, 0)
+        lines = []
+        for second in seconds:
+            stamp = datetime.datetime.utcfromtimestamp(second).strftime(
+                "%Y-%m-%dT%H:%M:%S.000000000Z"
+            )
+            lines.append(
+                f'{stamp} line {second - first} {padding}\n'.encode("UTF-8")
+            )
+        return lines
+
+    def serve(self) -> str:
+        """Starts serving in a background thread, and returns the URL of the
+        daemon, e.g. ``tcp://127.0.0.1:2375``.
+        """
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'tcp://127.0.0.1:{self._server.server_address[1]}'
+
+    def shutdown(self) -> None:
+        """Stops serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _handler_class(docker: FakeDocker) -> type:
+    """Returns a request handler class bound to a fake docker daemon.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """Handles one docker engine API request.
+        """
+
+        disable_nagle_algorithm = True
+
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+        def _reply(self, status: int, body: Any = None) -> None:
+            data = b'' if body is None else json.dumps(body).encode("UTF-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _start_stream(self, content_type: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f'{len(data):x}\r\n'.encode("ascii") + data +
+                             b'\r\n')
+            self.wfile.flush()
+
+        def _events(self) -> None:
+            self._start_stream("application/json")
+            listener = docker.listen()
+            try:
+                while True:
+                    try:
+                        event = listener.get(timeout=1.0)
+                    except queue.Empty:
+                        continue
+                    self._write_chunk(json.dumps(event).encode("UTF-8"))
+            except OSError:
+                pass
+            finally:
+                docker.unlisten(listener)
+                self.close_connection = True
+
+        def _logs(self,
+                  container: FakeContainer,
+                  query: Dict[str, str]) -> None:
+            def number(key: str) -> Optional[float]:
+                value = query.get(key, "")
+                return float(value) if value and value != "all" and \
+                    float(value) > 0 else None
+
+            tail = number("tail")
+            lines = docker.log(
+                number("since"),
+                number("until"),
+                None if tail is None else int(tail)
+            )
+            self._start_stream("application/vnd.docker.raw-stream")
+            for line in lines:
+                # Multiplexed stream frame, on stdout
+                self._write_chunk(struct.pack(">BxxxL", 1, len(line)) + line)
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _route(self, method: str) -> None:
+            with docker._lock:  # pylint: disable=protected-access
+                docker.requests += 1
+            if docker.latency:
+                time.sleep(docker.latency)
+            url = urllib.parse.urlparse(self.path)
+            path = re.sub(r'^/v[0-9.]+', "", url.path)
+            query = {
+                key: values[-1]
+                for key, values in urllib.parse.parse_qs(url.query).items()
+            }
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            if method == "GET" and path == "/_ping":
+                self._reply(200, "OK")
+            elif method == "GET" and path == "/version":
+                self._reply(200, {"ApiVersion": "1.40", "Version": "fake"})
+            elif method == "GET" and path == "/info":
+                self._reply(200, {
+                    "Containers": len(docker.containers),
+                    "MemTotal": 16 * 1000 ** 3,
+                    "ServerVersion": "fake"
+                })
+            elif method == "GET" and path == "/system/df":
+                time.sleep(docker.df_delay)
+                self._reply(200, docker.df())
+            elif method == "GET" and path == "/events":
+                self._events()
+            elif method == "GET" and path == "/containers/json":
+                with docker._lock:  # pylint: disable=protected-access
+                    summaries = [
+                        container.summary()
+                        for container in docker.containers.values()
+                    ]
+                self._reply(200, summaries)
+            else:
+                match = re.match(r'^/containers/([^/]+)/([a-z]+)$', path)
+                container = docker.find(match.group(1)) if match else None
+                action = match.group(2) if match else ""
+                if container is None:
+                    self._reply(404, {"message": "No such container"})
+                elif method == "GET" and action == "json":
+                    self._reply(200, container.inspect())
+                elif method == "GET" and action == "logs":
+                    self._logs(container, query)
+                elif method == "GET" and action == "stats":
+                    time.sleep(docker.stats_delay)
+                    self._reply(200, container.stats())
+                elif method == "POST" and \
+                        action in FakeDocker.ACTION_STATUSES:
+                    docker.act(container, action)
+                    self._reply(204)
+                else:
+                    self._reply(404, {"message": "Not implemented"})
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Handles a GET request.
+            """
+            self._route("GET")
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            """Handles a POST request.
+            """
+            self._route("POST")
+
+    return Handler
+
+
+def main() -> int:
+    """Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--containers",
+        default=50,
+        help="Number of containers",
+        type=int)
+    parser.add_argument(
+        "--df-delay",
+        default=0.0,
+        help="Additional delay of disk usage requests, in seconds",
+        type=float)
+    parser.add_argument(
+        "-l", "--latency",
+        default=0.0,
+        help="Delay added to every request, in seconds",
+        type=float)
+    parser.add_argument(
+        "--log-lines",
+        default=1000,
+        help="Number of log lines of each container",
+        type=int)
+    parser.add_argument(
+        "--stats-delay",
+        default=1.0,
+        help="Additional delay of stats requests, in seconds",
+        type=float)
+    parser.add_argument(
+        "-p", "--port",
+        default=2375,
+        help="Port to listen on",
+        type=int)
+    arguments = parser.parse_args()
+    docker = FakeDocker(
+        arguments.containers,
+        arguments.latency,
+        arguments.log_lines,
+        port=arguments.port,
+        stats_delay=arguments.stats_delay,
+        df_delay=arguments.df_delay
+    )
+    print(f'Fake docker daemon listening at {docker.serve()}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        docker.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Replays recorded telegram updates against the webhook of the bot.
+
+This stands in for the telegram servers when testing webhook mode (see the
+``--webhook`` option of ``src/main.py``) end to end. Updates are read from a
+file containing one JSON encoded update per line, as returned by the
+``getUpdates`` method of the bot API, and POSTed to the webhook one at a time.
+Update ids are renumbered so that the same file can be replayed many times.
+
+Example::
+
+    python3 src/main.py -t TOKEN --webhook https://example.org \\
+        --webhook-listen 127.0.0.1:8443 --webhook-secret s3cr3t &
+    python3 tools/replay_updates.py updates.jsonl http://127.0.0.1:8443/s3cr3t
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterator
+)
+import urllib.error
+import urllib.request
+
+
+def read_updates(path: str) -> Iterator[Dict[str, Any]]:
+    """Reads updates from a JSON lines file.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def post_update(url: str, update: Dict[str, Any], timeout: float) -> int:
+    """POSTs an update to the webhook, and returns the HTTP status.
+    """
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def main() -> int:
+    """Main function.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("updates", help="JSON lines file of updates")
+    parser.add_argument("url", help="Webhook URL, including the secret path")
+    parser.add_argument(
+        "-d", "--delay",
+        default=0.0,
+        help="Delay between two updates, in seconds",
+        type=float)
+    parser.add_argument(
+        "-n", "--repeat",
+        default=1,
+        help="Number of times the file is replayed",
+        type=int)
+    parser.add_argument(
+        "--timeout",
+        default=10.0,
+        help="HTTP timeout, in seconds",
+        type=float)
+    arguments = parser.parse_args()
+
+    update_id = int(time.time())
+    failures = 0
+    latencies = []
+    for _ in range(arguments.repeat):
+        for update in read_updates(arguments.updates):
+            update_id += 1
+            update["update_id"] = update_id
+            start = time.monotonic()
+            status = post_update(arguments.url, update, arguments.timeout)
+            latencies.append(time.monotonic() - start)
+            if status != 200:
+                failures += 1
+                print(f'Update {update_id}: HTTP {status}', file=sys.stderr)
+            time.sleep(arguments.delay)
+    latencies.sort()
+    if latencies:
+        print(f'{len(latencies)} updates, {failures} failures, '
+              f'p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+              f'max {latencies[-1] * 1000:.1f} ms')
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())